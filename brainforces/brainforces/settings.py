@@ -297,15 +297,60 @@ MESSAGE_TAGS = {
 REDIS_HOST = os.getenv('REDIS_HOST', default='localhost')
 REDIS_PORT = 6379
 REDIS_DB = int(os.getenv('REDIS_DB', default=0))
+# таймауты внешних сервисов в секундах:
+# медленный сервис не должен занимать воркеры gunicorn
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', default=1))
+ELASTICSEARCH_TIMEOUT = float(os.getenv('ELASTICSEARCH_TIMEOUT', default=2))
+# после скольких ошибок подряд сервис перестает вызываться
+# и через сколько секунд пробуется снова
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(
+    os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', default=5)
+)
+CIRCUIT_BREAKER_RESET_TIMEOUT = float(
+    os.getenv('CIRCUIT_BREAKER_RESET_TIMEOUT', default=30)
+)
 
 ELASTICSEARCH_DSL = {
     'default': {
         'hosts': (
             f"{os.getenv('ELASTICSEARCH_HOST', default='localhost')}:9200"
         ),
+        'timeout': ELASTICSEARCH_TIMEOUT,
+        # повтор к тому же узлу удвоил бы ожидание
+        'max_retries': 0,
     },
 }
 
+# движок поиска: elastic или postgres (без отдельного сервиса)
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', default='elastic')
+SEARCH_POSTGRES_CONFIG = 'russian'
+# с поиском postgres elastic не обновляется
+ELASTICSEARCH_DSL_AUTOSYNC = SEARCH_BACKEND == 'elastic'
+
+# обновлять elastic задачей celery, а не в потоке запроса
+ELASTICSEARCH_QUEUED_SIGNALS = (
+    os.getenv('ELASTICSEARCH_QUEUED_SIGNALS', default='true').lower().strip()
+    in YES_OPTIONS
+)
+if ELASTICSEARCH_QUEUED_SIGNALS:
+    ELASTICSEARCH_DSL_SIGNAL_PROCESSOR = (
+        'core.search_queue.QueuedSignalProcessor'
+    )
+SEARCH_INDEX_FLUSH_DELAY = int(
+    os.getenv('SEARCH_INDEX_FLUSH_DELAY', default=1)
+)
+SEARCH_INDEX_MAX_RETRIES = int(
+    os.getenv('SEARCH_INDEX_MAX_RETRIES', default=5)
+)
+# сколько секунд хранить в redis id найденных документов
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', default=300))
+# сколько найденных документов можно пролистать
+SEARCH_MAX_HITS = int(os.getenv('SEARCH_MAX_HITS', default=1000))
+# подсказки при наборе поискового запроса
+SEARCH_SUGGEST_SIZE = int(os.getenv('SEARCH_SUGGEST_SIZE', default=5))
+SEARCH_SUGGEST_TTL = int(os.getenv('SEARCH_SUGGEST_TTL', default=30))
+SEARCH_SUGGEST_MIN_LENGTH = 2
+
 CELERY_TASK_ALWAYS_EAGER = (
     os.getenv('CELERY_TASK_ALWAYS_EAGER', default='true').lower().strip()
     in YES_OPTIONS
@@ -317,3 +362,52 @@ RABBITMQ_PASS = os.getenv('RABBITMQ_PASS', default='guest')
 CELERY_BROKER_URL = (
     f'amqp://{RABBITMQ_USER}:{RABBITMQ_PASS}@{RABBITMQ_HOST}:5672//'
 )
+
+QUIZ_RESULTS_INTERVAL = int(os.getenv('QUIZ_RESULTS_INTERVAL', default=60))
+QUIZ_RESULTS_BATCH_SIZE = int(os.getenv('QUIZ_RESULTS_BATCH_SIZE', default=10))
+QUIZ_RESULTS_STAGGER = int(os.getenv('QUIZ_RESULTS_STAGGER', default=5))
+QUIZ_RATING_ENGINE = os.getenv('QUIZ_RATING_ENGINE', default='additive')
+QUIZ_ELO_K_FACTOR = int(os.getenv('QUIZ_ELO_K_FACTOR', default=32))
+CELERY_BEAT_SCHEDULE = {
+    'make-ended-quizzes-results': {
+        'task': 'quiz.tasks.make_ended_quizzes_results',
+        'schedule': QUIZ_RESULTS_INTERVAL,
+    },
+}
+
+QUIZ_ANSWERS_WRITE_BEHIND = (
+    os.getenv('QUIZ_ANSWERS_WRITE_BEHIND', default='false').lower().strip()
+    in YES_OPTIONS
+)
+QUIZ_ANSWERS_STREAM_BATCH_SIZE = int(
+    os.getenv('QUIZ_ANSWERS_STREAM_BATCH_SIZE', default=500)
+)
+QUIZ_ANSWERS_FLUSH_WAIT = int(os.getenv('QUIZ_ANSWERS_FLUSH_WAIT', default=30))
+
+QUIZ_LIVE_STANDINGS = (
+    os.getenv('QUIZ_LIVE_STANDINGS', default='true').lower().strip()
+    in YES_OPTIONS
+)
+
+QUIZ_ANSWER_KEY_LOCAL_TTL = int(
+    os.getenv('QUIZ_ANSWER_KEY_LOCAL_TTL', default=5)
+)
+QUIZ_ANSWER_KEY_REDIS_TTL = int(
+    os.getenv('QUIZ_ANSWER_KEY_REDIS_TTL', default=86400)
+)
+QUIZ_ANSWER_KEY_WARM_UP_LEAD = int(
+    os.getenv('QUIZ_ANSWER_KEY_WARM_UP_LEAD', default=60)
+)
+QUIZ_ANSWER_KEY_LOCAL_MAX_SIZE = int(
+    os.getenv('QUIZ_ANSWER_KEY_LOCAL_MAX_SIZE', default=100)
+)
+
+ORGANIZATION_ROLES_LOCAL_TTL = int(
+    os.getenv('ORGANIZATION_ROLES_LOCAL_TTL', default=5)
+)
+ORGANIZATION_ROLES_REDIS_TTL = int(
+    os.getenv('ORGANIZATION_ROLES_REDIS_TTL', default=86400)
+)
+ORGANIZATION_ROLES_LOCAL_MAX_SIZE = int(
+    os.getenv('ORGANIZATION_ROLES_LOCAL_MAX_SIZE', default=10000)
+)
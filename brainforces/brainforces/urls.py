@@ -23,6 +23,11 @@ urlpatterns = [
         'organizations/', django.urls.include('organization.urls')
     ),
     django.urls.path('about/', django.urls.include('about.urls')),
+    django.urls.path(
+        'metrics/circuit-breakers/',
+        core.views.CircuitBreakerMetricsView.as_view(),
+        name='circuit_breaker_metrics',
+    ),
     django.urls.path(
         'social-auth/',
         django.urls.include('social_django.urls', namespace='social_auth'),
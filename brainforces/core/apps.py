@@ -7,3 +7,7 @@ class CoreConfig(django.apps.AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
     verbose_name = 'кор'
+
+    def ready(self) -> None:
+        """подключаем сигналы"""
+        import core.signals  # noqa: F401
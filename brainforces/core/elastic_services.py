@@ -1,22 +1,295 @@
+import typing
+
+import django_elasticsearch_dsl.fields
 import django_elasticsearch_dsl.search
+import elasticsearch.exceptions
 import elasticsearch_dsl
 
+import django.conf
 import django.db.models
 
+import core.facets
+import core.resilience
+
+
+# словоформы находит русский стеммер, поэтому нечеткий поиск
+# нужен только для опечаток в длинных словах:
+# до 5 символов - без опечаток, до 9 - одна, дальше - две
+FUZZINESS = 'AUTO:5,9'
+# сколько первых символов должны совпасть точно при нечетком поиске
+FUZZY_PREFIX_LENGTH = 2
+# сколько вариантов слова перебирает нечеткий поиск
+FUZZY_MAX_EXPANSIONS = 20
+# сколько документов достаем из elastic за один запрос
+SEARCH_BATCH_SIZE = 500
+
+elastic_breaker = core.resilience.register_breaker(
+    core.resilience.CircuitBreaker(
+        'elastic', exceptions=(elasticsearch.exceptions.TransportError,)
+    )
+)
+
+# текстовые поля: русская морфология, ё не отличается от е
+TEXT_ANALYZER = elasticsearch_dsl.analyzer(
+    'russian_text',
+    tokenizer='standard',
+    char_filter=[
+        elasticsearch_dsl.char_filter(
+            'yo_to_ye', 'mapping', mappings=['ё => е', 'Ё => Е']
+        )
+    ],
+    filter=[
+        'lowercase',
+        elasticsearch_dsl.token_filter(
+            'russian_stop', 'stop', stopwords='_russian_'
+        ),
+        elasticsearch_dsl.token_filter(
+            'russian_stemmer', 'stemmer', language='russian'
+        ),
+        elasticsearch_dsl.token_filter(
+            'english_stemmer', 'stemmer', language='light_english'
+        ),
+    ],
+)
+
+# префиксы слов для подсказок при наборе запроса
+AUTOCOMPLETE_ANALYZER = elasticsearch_dsl.analyzer(
+    'autocomplete',
+    tokenizer=elasticsearch_dsl.tokenizer(
+        'autocomplete',
+        'edge_ngram',
+        min_gram=1,
+        max_gram=20,
+        token_chars=['letter', 'digit'],
+    ),
+    filter=['lowercase'],
+)
+
+
+def make_text_field(
+    attr: typing.Optional[str] = None,
+) -> django_elasticsearch_dsl.fields.TextField:
+    """текстовое поле с русской морфологией"""
+    return django_elasticsearch_dsl.fields.TextField(
+        attr=attr, analyzer=TEXT_ANALYZER
+    )
+
+
+def make_name_field() -> django_elasticsearch_dsl.fields.TextField:
+    """название с подполем suggest для подсказок"""
+    return django_elasticsearch_dsl.fields.TextField(
+        analyzer=TEXT_ANALYZER,
+        fields={
+            'suggest': django_elasticsearch_dsl.fields.TextField(
+                analyzer=AUTOCOMPLETE_ANALYZER, search_analyzer='standard'
+            )
+        },
+    )
+
 
-def make_search_results(
+def make_access_query(
+    document_class: django_elasticsearch_dsl.Document,
+    user_pk: typing.Optional[int],
+) -> elasticsearch_dsl.query.Query:
+    """
+    фильтр доступа пользователя к документам
+    access_required_fields должны выполняться всегда,
+    access_public_fields - для всех, кроме участников организации
+    (их id лежат в member_ids, организация - в access_organization_field)
+    """
+    required = [
+        elasticsearch_dsl.Q('term', **{field: value})
+        for field, value in document_class.access_required_fields.items()
+    ]
+    public = elasticsearch_dsl.Q(
+        'bool',
+        filter=[
+            elasticsearch_dsl.Q('term', **{field: value})
+            for field, value in document_class.access_public_fields.items()
+        ],
+    )
+    if user_pk is None:
+        return elasticsearch_dsl.Q('bool', filter=required + [public])
+    member = elasticsearch_dsl.Q('term', member_ids=user_pk)
+    return elasticsearch_dsl.Q(
+        'bool',
+        filter=required
+        + [elasticsearch_dsl.Q('bool', should=[public, member])],
+    )
+
+
+def make_search_query(
+    query_text: str, fields: list
+) -> elasticsearch_dsl.query.Query:
+    """
+    запрос по полям с весами (name^3)
+    нечеткий поиск начинается с третьего символа и перебирает
+    ограниченное число вариантов, чтобы не обходить весь словарь
+    """
+    return elasticsearch_dsl.Q(
+        'multi_match',
+        query=query_text,
+        fields=fields,
+        fuzziness=FUZZINESS,
+        prefix_length=FUZZY_PREFIX_LENGTH,
+        max_expansions=FUZZY_MAX_EXPANSIONS,
+    )
+
+
+def make_facet_aggregations(
+    facets: typing.Dict[str, core.facets.Facet], selected: dict
+) -> typing.Dict[str, elasticsearch_dsl.aggs.Agg]:
+    """
+    агрегации фасетов: счетчики каждого фасета считаются
+    с фильтрами остальных выбранных фасетов, но без своего,
+    чтобы было видно, сколько записей даст другое значение
+    """
+    aggregations = dict()
+    for name, facet in facets.items():
+        aggregation = elasticsearch_dsl.A(
+            'filter',
+            filter=elasticsearch_dsl.Q(
+                'bool',
+                filter=[
+                    facets[other].get_filter(value)
+                    for other, value in selected.items()
+                    if other != name
+                ],
+            ),
+        )
+        aggregation.bucket('values', facet.get_aggregation())
+        aggregations[name] = aggregation
+    return aggregations
+
+
+def make_sort(order_by: typing.Iterable[str]) -> typing.List[dict]:
+    """
+    сортировка elastic по полям в записи orm ('-start_time')
+    пустые значения там же, где их ставит postgres:
+    первыми при сортировке по убыванию, последними - по возрастанию
+    """
+    sort = list()
+    for field in order_by:
+        order = 'desc' if field.startswith('-') else 'asc'
+        sort.append(
+            {
+                field.lstrip('-'): {
+                    'order': order,
+                    'missing': '_first' if order == 'desc' else '_last',
+                }
+            }
+        )
+    return sort
+
+
+def get_hits(
     document_class: django_elasticsearch_dsl.Document,
     fields: list,
     query_text: str,
-) -> django.db.models.QuerySet:
+    user_pk: typing.Optional[int],
+    facets: typing.Optional[typing.Dict[str, core.facets.Facet]] = None,
+    selected: typing.Optional[dict] = None,
+    max_hits: typing.Optional[int] = None,
+) -> typing.Tuple[typing.List[int], dict]:
+    """
+    id найденных документов (не больше max_hits, по умолчанию
+    SEARCH_MAX_HITS) и счетчики фасетов
+    фильтр доступа и сортировка выполняются в elastic,
+    документы достаются пачками через search_after
+    fields - поля, по которым искать, с весами;
+    без запроса документы идут в порядке default_sort документа
+    selected - выбранные значения фасетов, фильтруют только документы,
+    агрегации фасетов приходят в ответе на первую пачку
+    """
+    facets = facets or dict()
+    selected = selected or dict()
+    if max_hits is None:
+        max_hits = django.conf.settings.SEARCH_MAX_HITS
+    search = (
+        document_class.search()
+        .filter(make_access_query(document_class, user_pk))
+        .source(False)
+    )
+    if query_text:
+        search = search.query(make_search_query(query_text, fields)).sort(
+            {'_score': {'order': 'desc'}}, {'id': {'order': 'desc'}}
+        )
+    else:
+        search = search.sort(*make_sort(document_class.default_sort))
+    if selected:
+        search = search.post_filter(
+            'bool',
+            filter=[
+                facets[name].get_filter(value)
+                for name, value in selected.items()
+            ],
+        )
+    size = min(SEARCH_BATCH_SIZE, max_hits)
+    first_search = search.extra(size=size)
+    for name, aggregation in make_facet_aggregations(facets, selected).items():
+        first_search.aggs.bucket(name, aggregation)
+    response = first_search.execute()
+    facet_counts = dict()
+    if facets:
+        aggregations = response.aggregations.to_dict()
+        facet_counts = {
+            name: facet.get_counts(aggregations[name]['values'])
+            for name, facet in facets.items()
+        }
+    hits = list(response)
+    hit_ids = [int(hit.meta.id) for hit in hits]
+    while hits and len(hits) == size and len(hit_ids) < max_hits:
+        size = min(SEARCH_BATCH_SIZE, max_hits - len(hit_ids))
+        hits = list(
+            search.extra(
+                size=size, search_after=list(hits[-1].meta.sort)
+            ).execute()
+        )
+        hit_ids.extend(int(hit.meta.id) for hit in hits)
+    return hit_ids, facet_counts
+
+
+def get_hit_ids(
+    document_class: django_elasticsearch_dsl.Document,
+    fields: list,
+    query_text: str,
+    user_pk: typing.Optional[int],
+) -> typing.List[int]:
+    """id всех найденных документов по убыванию релевантности"""
+    return get_hits(document_class, fields, query_text, user_pk)[0]
+
+
+def get_objects_in_order(
+    queryset: django.db.models.QuerySet, pks: list
+) -> list:
+    """записи одним запросом в порядке pks, удаленные пропускаем"""
+    objects = queryset.in_bulk(pks)
+    return [objects[pk] for pk in pks if pk in objects]
+
+
+def get_suggestions(
+    document_class: django_elasticsearch_dsl.Document,
+    prefix: str,
+    user_pk: typing.Optional[int],
+    size: int,
+) -> typing.List[dict]:
     """
-    результаты поиска elastic
-    document_class - документ по которому производится поиск
-    fields - поля, по которым искать
-    query_text - сам запрос
+    подсказки по началу названия: id и названия первых size документов
+    ищем по подполю name.suggest без нечеткого поиска,
+    поэтому запрос дешевый
     """
-    query = elasticsearch_dsl.Q(
-        'multi_match', query=query_text, fields=fields, fuzziness='auto'
+    search = (
+        document_class.search()
+        .query(
+            elasticsearch_dsl.Q(
+                'match',
+                **{'name.suggest': {'query': prefix, 'operator': 'and'}},
+            )
+        )
+        .filter(make_access_query(document_class, user_pk))
+        .source(['name'])
+        .extra(size=size)
     )
-    results = document_class.search().query(query)
-    return results.to_queryset()
+    return [
+        {'id': int(hit.meta.id), 'name': hit.name} for hit in search.execute()
+    ]
@@ -0,0 +1,190 @@
+import typing
+
+import elasticsearch_dsl
+
+import django.db.models
+
+
+class Facet:
+    """
+    фасет списка: фильтр по одному значению из GET параметра
+    и число записей для каждого значения из агрегации elastic
+    счетчики - список словарей value, label, count
+    """
+
+    title: str  # название фасета в форме
+
+    def clean(self, value: str) -> typing.Optional[str]:
+        """допустимое значение фильтра или None"""
+        ...
+
+    def get_filter(self, value: str) -> elasticsearch_dsl.query.Query:
+        """фильтр elastic по значению"""
+        ...
+
+    def get_orm_filter(self, value: str) -> django.db.models.Q:
+        """тот же фильтр для postgres"""
+        ...
+
+    def get_aggregation(self) -> elasticsearch_dsl.aggs.Agg:
+        """агрегация elastic для счетчиков"""
+        ...
+
+    def get_counts(self, result: dict) -> typing.List[dict]:
+        """счетчики из результата агрегации"""
+        ...
+
+    def get_default_counts(self) -> typing.List[dict]:
+        """значения без счетчиков, когда агрегации недоступны"""
+        return list()
+
+    def get_choices(
+        self, counts: typing.Optional[list], selected: typing.Optional[str]
+    ) -> typing.List[dict]:
+        """варианты для формы с отметкой выбранного"""
+        if counts is None:
+            counts = self.get_default_counts()
+        return [
+            {**count, 'selected': count['value'] == selected}
+            for count in counts
+        ]
+
+
+class TermsFacet(Facet):
+    """
+    фасет по значениям поля документа (terms)
+    labels - подписи всех значений (для булевых полей),
+    без них значения - id, а подписи берутся из label_field
+    первого документа корзины
+    """
+
+    def __init__(
+        self,
+        title: str,
+        field: str,
+        labels: typing.Optional[dict] = None,
+        label_field: typing.Optional[str] = None,
+        size: int = 10,
+    ) -> None:
+        self.title = title
+        self.field = field
+        self.labels = labels
+        self.label_field = label_field
+        self.size = size
+
+    def clean(self, value: str) -> typing.Optional[str]:
+        if self.labels is not None:
+            return value if value in self.labels else None
+        return value if value.isdigit() else None
+
+    def get_filter(self, value: str) -> elasticsearch_dsl.query.Query:
+        return elasticsearch_dsl.Q('term', **{self.field: value})
+
+    def get_orm_filter(self, value: str) -> django.db.models.Q:
+        return django.db.models.Q(**{self.field.replace('.', '__'): value})
+
+    def get_aggregation(self) -> elasticsearch_dsl.aggs.Agg:
+        aggregation = elasticsearch_dsl.A(
+            'terms', field=self.field, size=self.size
+        )
+        if self.label_field:
+            aggregation.bucket(
+                'label', 'top_hits', size=1, _source=[self.label_field]
+            )
+        return aggregation
+
+    def get_label(self, value: str, bucket: dict) -> str:
+        """подпись значения корзины"""
+        if self.labels is not None:
+            return self.labels[value]
+        if not self.label_field:
+            return value
+        label = bucket['label']['hits']['hits'][0]['_source']
+        for part in self.label_field.split('.'):
+            label = label[part]
+        return label
+
+    def get_counts(self, result: dict) -> typing.List[dict]:
+        counts = {
+            bucket.get('key_as_string', str(bucket['key'])): bucket
+            for bucket in result['buckets']
+        }
+        if self.labels is not None:
+            return [
+                {
+                    'value': value,
+                    'label': label,
+                    'count': counts[value]['doc_count']
+                    if value in counts
+                    else 0,
+                }
+                for value, label in self.labels.items()
+            ]
+        return [
+            {
+                'value': value,
+                'label': self.get_label(value, bucket),
+                'count': bucket['doc_count'],
+            }
+            for value, bucket in counts.items()
+        ]
+
+    def get_default_counts(self) -> typing.List[dict]:
+        if self.labels is None:
+            return list()
+        return [
+            {'value': value, 'label': label, 'count': None}
+            for value, label in self.labels.items()
+        ]
+
+
+class FacetOption(typing.NamedTuple):
+    """вариант FiltersFacet"""
+
+    label: str
+    query: elasticsearch_dsl.query.Query  # фильтр elastic
+    # фильтр postgres, строится при запросе (может зависеть от now)
+    get_orm_filter: typing.Callable[[], django.db.models.Q]
+
+
+class FiltersFacet(Facet):
+    """фасет из именованных фильтров (filters), например статус по датам"""
+
+    def __init__(
+        self, title: str, options: typing.Dict[str, FacetOption]
+    ) -> None:
+        self.title = title
+        self.options = options
+
+    def clean(self, value: str) -> typing.Optional[str]:
+        return value if value in self.options else None
+
+    def get_filter(self, value: str) -> elasticsearch_dsl.query.Query:
+        return self.options[value].query
+
+    def get_orm_filter(self, value: str) -> django.db.models.Q:
+        return self.options[value].get_orm_filter()
+
+    def get_aggregation(self) -> elasticsearch_dsl.aggs.Agg:
+        return elasticsearch_dsl.A(
+            'filters',
+            filters={
+                value: option.query for value, option in self.options.items()
+            },
+        )
+
+    def get_counts(self, result: dict) -> typing.List[dict]:
+        return [
+            {
+                'value': value,
+                'label': option.label,
+                'count': result['buckets'][value]['doc_count'],
+            }
+            for value, option in self.options.items()
+        ]
+
+    def get_default_counts(self) -> typing.List[dict]:
+        return [
+            {'value': value, 'label': option.label, 'count': None}
+            for value, option in self.options.items()
+        ]
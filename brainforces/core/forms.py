@@ -4,5 +4,5 @@ import django.forms
 class SearchForm(django.forms.Form):
     """форма для поиска"""
 
-    query = django.forms.CharField()
-    search_by = django.forms.ChoiceField(choices=[])
+    query = django.forms.CharField(required=False)
+    search_by = django.forms.ChoiceField(choices=[], required=False)
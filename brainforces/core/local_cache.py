@@ -0,0 +1,77 @@
+import collections
+import threading
+import typing
+
+import django.conf
+
+
+class LocalCache:
+    """
+    кеш в памяти процесса ограниченного размера (LRU)
+    при переполнении вытесняются записи, которые дольше всех
+    не читали; размер берется из настройки max_size_setting
+    при каждой записи, поэтому его можно менять в тестах
+    """
+
+    def __init__(self, max_size_setting: str) -> None:
+        self.max_size_setting = max_size_setting
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        return key in self.entries
+
+    def get(
+        self, key: typing.Hashable, default: typing.Any = None
+    ) -> typing.Any:
+        """значение по ключу, запись становится самой свежей"""
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key: typing.Hashable, value: typing.Any) -> None:
+        """записываем значение и вытесняем лишние старые записи"""
+        max_size = getattr(django.conf.settings, self.max_size_setting)
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key: typing.Hashable) -> typing.Any:
+        """удаляем запись, если она есть"""
+        with self.lock:
+            return self.entries.pop(key, None)
+
+    def evict(
+        self, predicate: typing.Callable[[typing.Hashable, typing.Any], bool]
+    ) -> None:
+        """удаляем все записи, для которых predicate(ключ, значение)"""
+        with self.lock:
+            for key in [
+                key
+                for key, value in self.entries.items()
+                if predicate(key, value)
+            ]:
+                del self.entries[key]
+
+    def evict_stale(
+        self, is_stale: typing.Callable[[typing.Any], bool]
+    ) -> None:
+        """
+        удаляем давно не читанные записи, пока они устаревшие,
+        чтобы просроченные записи не ждали переполнения кеша
+        """
+        with self.lock:
+            while self.entries and is_stale(next(iter(self.entries.values()))):
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """очищаем кеш"""
+        with self.lock:
+            self.entries.clear()
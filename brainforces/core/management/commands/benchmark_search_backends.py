@@ -0,0 +1,104 @@
+import time
+import typing
+
+import numpy
+
+import django.core.management.base
+
+import core.search_backends
+import quiz.documents
+import quiz.views
+
+
+class Command(django.core.management.base.BaseCommand):
+    """
+    сравниваем движки поиска на данных текущей базы:
+    задержку поиска викторин без кеша
+    и совпадение первых страниц выдачи
+    для elastic нужны проиндексированные викторины (reindex_search)
+    """
+
+    help = 'Замер движков поиска'
+
+    def add_arguments(
+        self, parser: django.core.management.base.CommandParser
+    ) -> None:
+        parser.add_argument(
+            '--backends',
+            nargs='+',
+            default=list(core.search_backends.SEARCH_BACKENDS),
+            choices=list(core.search_backends.SEARCH_BACKENDS),
+            help='движки поиска',
+        )
+        parser.add_argument(
+            '--queries',
+            nargs='+',
+            default=['викторина', 'математика', 'история'],
+            help='поисковые запросы',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='сколько раз выполнять каждый запрос',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            default=None,
+            help='pk пользователя, от имени которого ищем',
+        )
+
+    def measure(self, function: typing.Callable, *args) -> float:
+        """время выполнения функции в миллисекундах"""
+        start = time.perf_counter()
+        function(*args)
+        return (time.perf_counter() - start) * 1000
+
+    def handle(self, *args, **options) -> None:
+        # elastic без кеша и без запасного поиска в postgres
+        elastic_options = {'use_cache': False, 'use_fallback': False}
+        backends = {
+            name: core.search_backends.get_search_backend(
+                name, **(elastic_options if name == 'elastic' else {})
+            )
+            for name in options['backends']
+        }
+        fields = quiz.views.QuizListView.search_fields
+        page_size = quiz.views.QuizListView.paginate_by
+        first_pages = {name: dict() for name in backends}
+        self.stdout.write('backend\tmean ms\tp50 ms\tp95 ms')
+        for name, backend in backends.items():
+            latencies = list()
+            for query_text in options['queries']:
+                args = (
+                    quiz.documents.QuizDocument,
+                    fields,
+                    query_text,
+                    options['user'],
+                )
+                first_pages[name][query_text] = backend.get_hit_ids(*args)[
+                    :page_size
+                ]
+                latencies.extend(
+                    self.measure(backend.get_hit_ids, *args)
+                    for _ in range(options['repeat'])
+                )
+            p50, p95 = numpy.percentile(latencies, (50, 95))
+            self.stdout.write(
+                f'{name}\t{numpy.mean(latencies):.2f}\t{p50:.2f}\t{p95:.2f}'
+            )
+        if len(backends) < 2:
+            return
+        # доля общих викторин на первых страницах выдачи двух движков
+        first, second = list(first_pages)[:2]
+        self.stdout.write(f'query\t{first}\t{second}\toverlap')
+        for query_text in options['queries']:
+            first_ids = set(first_pages[first][query_text])
+            second_ids = set(first_pages[second][query_text])
+            union = first_ids | second_ids
+            overlap = len(first_ids & second_ids) / len(union) if union else 1
+            self.stdout.write(
+                f'{query_text}\t{len(first_ids)}\t{len(second_ids)}'
+                f'\t{overlap:.2f}'
+            )
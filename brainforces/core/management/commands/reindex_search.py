@@ -0,0 +1,101 @@
+import elasticsearch_dsl.connections
+
+import django.conf
+import django.core.management.base
+
+import core.search_index
+import core.tasks
+
+
+class Command(django.core.management.base.BaseCommand):
+    """
+    пересборка индексов elastic без простоя поиска:
+    новый индекс с версией в имени заливается за алиасом,
+    затем алиас атомарно переключается на него
+    """
+
+    help = 'Пересборка индексов elasticsearch'
+
+    def add_arguments(
+        self, parser: django.core.management.base.CommandParser
+    ) -> None:
+        parser.add_argument(
+            '--indexes',
+            nargs='+',
+            default=None,
+            help='алиасы индексов, по умолчанию - все',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help=(
+                'только проверить доступность elastic и версии индексов, '
+                'недостающие и устаревшие индексы пересобрать задачей celery '
+                '(при CELERY_TASK_ALWAYS_EAGER - сразу, до выхода из команды)'
+            ),
+        )
+        parser.add_argument(
+            '--catch-up',
+            action='store_true',
+            help='переиндексировать записи, измененные во время сборки',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='сколько записей доставать из базы и отправлять за раз',
+        )
+        parser.add_argument(
+            '--thread-count',
+            type=int,
+            default=4,
+            help='сколько потоков отправляют bulk запросы',
+        )
+
+    def check_indexes(self, documents: list) -> None:
+        """
+        проверяем elastic и ставим пересборку устаревших индексов
+        если индексы уже пересобираются, новую сборку не ставим
+        """
+        if not elasticsearch_dsl.connections.get_connection().ping():
+            self.stderr.write('elasticsearch недоступен')
+            return
+        if core.search_index.is_rebuilding():
+            self.stdout.write('индексы уже пересобираются')
+            return
+        outdated = list()
+        for document_class in documents:
+            alias = document_class._index._name
+            status = core.search_index.get_index_status(document_class)
+            self.stdout.write(f'{alias}\t{status}')
+            if status != core.search_index.OK_STATUS:
+                outdated.append(alias)
+        if not outdated:
+            return
+        if django.conf.settings.CELERY_TASK_ALWAYS_EAGER:
+            # без celery задача выполняется здесь же: запуск контейнера
+            # ждет, пока индексы соберутся
+            self.stdout.write('пересборка индексов без celery, синхронно')
+        core.tasks.rebuild_search_indexes.delay(outdated)
+
+    def handle(self, *args, **options) -> None:
+        documents = core.search_index.get_documents(options['indexes'])
+        if options['check']:
+            self.check_indexes(documents)
+            return
+        if options['catch_up']:
+            self.stdout.write(f'caught up: {core.search_index.catch_up()}')
+            return
+        report = core.search_index.rebuild_indexes(
+            documents, options['chunk_size'], options['thread_count']
+        )
+        if report is None:
+            self.stderr.write('индексы уже пересобираются')
+            return
+        caught_up = report.pop('caught_up')
+        for alias, index_report in report.items():
+            self.stdout.write(
+                f'{alias}\t{index_report["index"]}\t'
+                f'{index_report["documents"]}'
+            )
+        self.stdout.write(f'caught up: {caught_up}')
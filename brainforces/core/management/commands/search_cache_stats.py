@@ -0,0 +1,27 @@
+import django.core.management.base
+
+import core.search_cache
+
+
+class Command(django.core.management.base.BaseCommand):
+    """попадания и промахи кеша результатов поиска"""
+
+    help = 'Статистика кеша поиска'
+
+    def add_arguments(
+        self, parser: django.core.management.base.CommandParser
+    ) -> None:
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='обнулить счетчики после вывода',
+        )
+
+    def handle(self, *args, **options) -> None:
+        stats = core.search_cache.get_stats()
+        self.stdout.write(
+            f'hits: {stats["hits"]}\tmisses: {stats["misses"]}\t'
+            f'hit rate: {stats["hit_rate"]}'
+        )
+        if options['reset']:
+            core.search_cache.reset_stats()
@@ -1,10 +1,103 @@
+import collections
+import threading
+import typing
+
 import redis
+import redis.client
+import redis.exceptions
 
 import django.conf
 
+import core.resilience
+
+
+# сколько разных счетчиков копим в памяти, пока redis недоступен
+MAX_BUFFERED_COUNTERS = 10000
+
+
+class RedisCircuitOpenError(
+    core.resilience.CircuitOpenError, redis.exceptions.ConnectionError
+):
+    """
+    цепь redis разомкнута - для вызывающего кода
+    это обычная ошибка соединения, которую он уже обрабатывает
+    """
+
+
+redis_breaker = core.resilience.register_breaker(
+    core.resilience.CircuitBreaker(
+        'redis',
+        exceptions=(
+            redis.exceptions.ConnectionError,
+            redis.exceptions.TimeoutError,
+        ),
+        open_error=RedisCircuitOpenError,
+    )
+)
+
+
+class BreakerPipeline(redis.client.Pipeline):
+    """пайплайн, который выполняется через предохранитель redis"""
 
-redis_connection = redis.Redis(
+    def execute(self, raise_on_error: bool = True) -> list:
+        return redis_breaker.call(super().execute, raise_on_error)
+
+
+class BreakerRedis(redis.Redis):
+    """
+    клиент redis, команды и пайплайны которого идут через предохранитель:
+    пока redis не отвечает, ошибка возвращается сразу, без таймаута
+    """
+
+    def execute_command(self, *args, **options) -> typing.Any:
+        return redis_breaker.call(super().execute_command, *args, **options)
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: typing.Any = None
+    ) -> BreakerPipeline:
+        return BreakerPipeline(
+            self.connection_pool,
+            self.response_callbacks,
+            transaction,
+            shard_hint,
+        )
+
+
+redis_connection = BreakerRedis(
     host=django.conf.settings.REDIS_HOST,
     port=django.conf.settings.REDIS_PORT,
     db=django.conf.settings.REDIS_DB,
+    socket_timeout=django.conf.settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=django.conf.settings.REDIS_SOCKET_TIMEOUT,
 )
+
+buffered_counters = collections.Counter()
+buffered_counters_lock = threading.Lock()
+
+
+def incr_buffered(key: str) -> typing.Optional[int]:
+    """
+    увеличиваем счетчик в redis
+    пока redis недоступен, приращения копятся в памяти процесса
+    и дописываются при следующем удачном вызове
+    возвращаем новое значение или None, если redis недоступен
+    """
+    with buffered_counters_lock:
+        increments = buffered_counters.copy()
+        buffered_counters.clear()
+    increments[key] += 1
+    pipeline = redis_connection.pipeline(transaction=False)
+    for counter_key, amount in increments.items():
+        pipeline.incrby(counter_key, amount)
+    try:
+        values = pipeline.execute()
+    except redis.exceptions.RedisError:
+        with buffered_counters_lock:
+            for counter_key, amount in increments.items():
+                if (
+                    counter_key in buffered_counters
+                    or len(buffered_counters) < MAX_BUFFERED_COUNTERS
+                ):
+                    buffered_counters[counter_key] += amount
+        return None
+    return values[list(increments).index(key)]
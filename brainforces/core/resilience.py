@@ -0,0 +1,151 @@
+import threading
+import time
+import typing
+
+import django.conf
+
+
+class CircuitOpenError(Exception):
+    """цепь разомкнута: зависимость не вызываем, пока она не оживет"""
+
+
+class CircuitBreaker:
+    """
+    предохранитель для внешней зависимости (elastic, redis)
+    closed - вызовы идут как обычно, ошибки подряд считаются;
+    после failure_threshold ошибок подряд цепь размыкается (open)
+    и reset_timeout секунд вызовы сразу уходят в fallback;
+    потом пропускается один пробный вызов (half_open):
+    успех замыкает цепь, ошибка снова размыкает
+    состояние свое у каждого процесса
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        name: str,
+        exceptions: typing.Tuple[typing.Type[Exception], ...],
+        open_error: typing.Type[Exception] = CircuitOpenError,
+        failure_threshold: int = None,
+        reset_timeout: float = None,
+    ) -> None:
+        self.name = name
+        self.exceptions = exceptions
+        self.open_error = open_error
+        self.failure_threshold = (
+            failure_threshold
+            or django.conf.settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        )
+        self.reset_timeout = (
+            reset_timeout or django.conf.settings.CIRCUIT_BREAKER_RESET_TIMEOUT
+        )
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """замыкаем цепь и обнуляем счетчики"""
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.is_probing = False
+        self.trips = 0
+        self.short_circuits = 0
+
+    def get_state(self) -> str:
+        """состояние с учетом истекшего reset_timeout"""
+        if (
+            self.state == self.OPEN
+            and time.monotonic() - self.opened_at >= self.reset_timeout
+        ):
+            self.state = self.HALF_OPEN
+        return self.state
+
+    def before_call(self) -> bool:
+        """можно ли вызвать зависимость сейчас"""
+        with self.lock:
+            state = self.get_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.is_probing:
+                self.is_probing = True
+                return True
+            self.short_circuits += 1
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.is_probing = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            self.is_probing = False
+            if (
+                self.state == self.HALF_OPEN
+                or self.failures >= self.failure_threshold
+            ):
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def call(
+        self,
+        function: typing.Callable,
+        *args,
+        fallback: typing.Optional[typing.Callable] = None,
+        **kwargs,
+    ) -> typing.Any:
+        """
+        вызываем function через предохранитель
+        при ошибке зависимости или разомкнутой цепи вызываем fallback
+        с теми же аргументами, без fallback - пробрасываем ошибку
+        (при разомкнутой цепи - open_error)
+        """
+        if not self.before_call():
+            if fallback is None:
+                raise self.open_error(f'цепь {self.name} разомкнута')
+            return fallback(*args, **kwargs)
+        try:
+            result = function(*args, **kwargs)
+        except self.exceptions:
+            self.record_failure()
+            if fallback is None:
+                raise
+            return fallback(*args, **kwargs)
+        except BaseException:
+            # ошибка не зависимости: пробный вызов не состоялся
+            with self.lock:
+                self.is_probing = False
+            raise
+        self.record_success()
+        return result
+
+    def get_metrics(self) -> dict:
+        """состояние и счетчики для мониторинга"""
+        with self.lock:
+            return {
+                'state': self.get_state(),
+                'failures': self.failures,
+                'trips': self.trips,
+                'short_circuits': self.short_circuits,
+            }
+
+
+BREAKERS: typing.Dict[str, CircuitBreaker] = dict()
+
+
+def register_breaker(breaker: CircuitBreaker) -> CircuitBreaker:
+    """запоминаем предохранитель для метрик"""
+    BREAKERS[breaker.name] = breaker
+    return breaker
+
+
+def get_metrics() -> dict:
+    """метрики всех предохранителей процесса"""
+    return {name: breaker.get_metrics() for name, breaker in BREAKERS.items()}
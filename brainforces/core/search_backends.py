@@ -0,0 +1,237 @@
+import re
+import typing
+
+import django_elasticsearch_dsl
+
+import django.conf
+import django.contrib.postgres.search
+import django.db.models
+
+import core.elastic_services
+import core.facets
+import core.search_cache
+import core.search_vectors
+import organization.visibility
+
+
+def get_lookups(fields: dict) -> dict:
+    """условия на поля документа ('organized_by.is_active') для orm"""
+    return {field.replace('.', '__'): value for field, value in fields.items()}
+
+
+def get_elastic_suggestions(
+    document_class: django_elasticsearch_dsl.Document,
+    prefix: str,
+    user_pk: typing.Optional[int],
+) -> typing.List[dict]:
+    """подсказки из elastic без кеша"""
+    return core.elastic_services.get_suggestions(
+        document_class,
+        prefix,
+        user_pk,
+        django.conf.settings.SEARCH_SUGGEST_SIZE,
+    )
+
+
+class ElasticSearchBackend:
+    """
+    поиск в elasticsearch
+    найденные id и подсказки кешируются в redis
+    elastic вызывается через предохранитель: при ошибке или таймауте,
+    а пока цепь разомкнута - сразу, ищет postgres (use_fallback)
+    """
+
+    def __init__(
+        self, use_cache: bool = True, use_fallback: bool = True
+    ) -> None:
+        self.use_cache = use_cache
+        self.use_fallback = use_fallback
+
+    def call(
+        self, function: typing.Callable, fallback_name: str, *args
+    ) -> list:
+        """вызываем elastic, запасной вариант - метод PostgresSearchBackend"""
+        if not self.use_fallback:
+            return function(*args)
+        return core.elastic_services.elastic_breaker.call(
+            function,
+            *args,
+            fallback=getattr(PostgresSearchBackend(), fallback_name),
+        )
+
+    def get_hits(
+        self,
+        document_class: django_elasticsearch_dsl.Document,
+        fields: list,
+        query_text: str,
+        user_pk: typing.Optional[int],
+        facets: typing.Optional[typing.Dict[str, core.facets.Facet]] = None,
+        selected: typing.Optional[dict] = None,
+        max_hits: typing.Optional[int] = None,
+    ) -> typing.Tuple[typing.List[int], dict]:
+        """найденные id и счетчики фасетов одним запросом к elastic"""
+        return self.call(
+            core.search_cache.get_hits
+            if self.use_cache
+            else core.elastic_services.get_hits,
+            'get_hits',
+            document_class,
+            fields,
+            query_text,
+            user_pk,
+            facets,
+            selected,
+            max_hits,
+        )
+
+    def get_hit_ids(
+        self,
+        document_class: django_elasticsearch_dsl.Document,
+        fields: list,
+        query_text: str,
+        user_pk: typing.Optional[int],
+    ) -> typing.List[int]:
+        return self.get_hits(document_class, fields, query_text, user_pk)[0]
+
+    def get_suggestions(
+        self,
+        document_class: django_elasticsearch_dsl.Document,
+        prefix: str,
+        user_pk: typing.Optional[int],
+    ) -> typing.List[dict]:
+        return self.call(
+            core.search_cache.get_suggestions
+            if self.use_cache
+            else get_elastic_suggestions,
+            'get_suggestions',
+            document_class,
+            prefix,
+            user_pk,
+        )
+
+
+class PostgresSearchBackend:
+    """
+    полнотекстовый поиск postgres по search_vector с gin индексом,
+    отдельный сервис не нужен - для небольших установок и тестов
+    модель и условия доступа берутся из того же документа, что и в elastic,
+    boost полей заменяют веса частей вектора (A > B > C)
+    """
+
+    def get_queryset(
+        self,
+        document_class: django_elasticsearch_dsl.Document,
+        user_pk: typing.Optional[int],
+    ) -> django.db.models.QuerySet:
+        """записи модели документа, доступные пользователю"""
+        queryset = document_class.django.model._default_manager.filter(
+            **get_lookups(document_class.access_required_fields)
+        )
+        public = django.db.models.Q(
+            **get_lookups(document_class.access_public_fields)
+        )
+        return organization.visibility.filter_visible(
+            queryset, public, document_class.access_organization_field, user_pk
+        )
+
+    def get_hits(
+        self,
+        document_class: django_elasticsearch_dsl.Document,
+        fields: list,
+        query_text: str,
+        user_pk: typing.Optional[int],
+        facets: typing.Optional[typing.Dict[str, core.facets.Facet]] = None,
+        selected: typing.Optional[dict] = None,
+        max_hits: typing.Optional[int] = None,
+    ) -> typing.Tuple[typing.List[int], dict]:
+        """
+        выбранные фасеты фильтруют записи,
+        счетчики фасетов postgres не считает - форма покажет их без чисел
+        """
+        if max_hits is None:
+            max_hits = django.conf.settings.SEARCH_MAX_HITS
+        if not max_hits:
+            return list(), dict()
+        queryset = self.get_queryset(document_class, user_pk)
+        for name, value in (selected or dict()).items():
+            queryset = queryset.filter(facets[name].get_orm_filter(value))
+        if not query_text:
+            queryset = queryset.order_by(*document_class.default_sort)
+        else:
+            query = django.contrib.postgres.search.SearchQuery(
+                query_text,
+                config=django.conf.settings.SEARCH_POSTGRES_CONFIG,
+                search_type='websearch',
+            )
+            # совпадение по всему вектору проверяет gin индекс,
+            # по выбранным полям - только лексемы их весов
+            vector = core.search_vectors.TsFilter(
+                django.db.models.F('search_vector'),
+                core.search_vectors.get_field_weights(fields),
+            )
+            queryset = (
+                queryset.filter(search_vector=query)
+                .alias(scoped_vector=vector)
+                .filter(scoped_vector=query)
+                .annotate(
+                    rank=django.contrib.postgres.search.SearchRank(
+                        vector, query
+                    )
+                )
+                .order_by('-rank', '-pk')
+            )
+        return (
+            list(queryset.values_list('pk', flat=True)[:max_hits]),
+            dict(),
+        )
+
+    def get_hit_ids(
+        self,
+        document_class: django_elasticsearch_dsl.Document,
+        fields: list,
+        query_text: str,
+        user_pk: typing.Optional[int],
+    ) -> typing.List[int]:
+        return self.get_hits(document_class, fields, query_text, user_pk)[0]
+
+    def get_suggestions(
+        self,
+        document_class: django_elasticsearch_dsl.Document,
+        prefix: str,
+        user_pk: typing.Optional[int],
+    ) -> typing.List[dict]:
+        words = re.findall(r'\w+', prefix)
+        if not words:
+            return list()
+        # каждое слово - префикс слова из названия: "ист:*A"
+        query = django.contrib.postgres.search.SearchQuery(
+            ' & '.join(
+                f'{word}:*{core.search_vectors.NAME_WEIGHT}' for word in words
+            ),
+            config=django.conf.settings.SEARCH_POSTGRES_CONFIG,
+            search_type='raw',
+        )
+        return list(
+            self.get_queryset(document_class, user_pk)
+            .filter(search_vector=query)
+            .annotate(
+                rank=django.contrib.postgres.search.SearchRank(
+                    django.db.models.F('search_vector'), query
+                )
+            )
+            .order_by('-rank', '-pk')
+            .values('id', 'name')[: django.conf.settings.SEARCH_SUGGEST_SIZE]
+        )
+
+
+SEARCH_BACKENDS = {
+    'elastic': ElasticSearchBackend,
+    'postgres': PostgresSearchBackend,
+}
+
+
+def get_search_backend(name: str = None, **kwargs) -> object:
+    """движок поиска из настройки SEARCH_BACKEND"""
+    if name is None:
+        name = django.conf.settings.SEARCH_BACKEND
+    return SEARCH_BACKENDS[name](**kwargs)
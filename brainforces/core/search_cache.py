@@ -0,0 +1,195 @@
+import hashlib
+import json
+import typing
+
+import django_elasticsearch_dsl
+import redis.exceptions
+
+import django.conf
+
+import core.elastic_services
+import core.facets
+import core.redis_rervices
+
+
+HITS_KEY = 'search:cache:hits'
+MISSES_KEY = 'search:cache:misses'
+
+
+def get_generation_key(alias: str) -> str:
+    """ключ поколения результатов поиска по индексу"""
+    return f'search:{alias}:generation'
+
+
+def normalize_query(query_text: str) -> str:
+    """запросы, отличающиеся регистром и пробелами, - один и тот же запрос"""
+    return ' '.join(query_text.lower().split())
+
+
+def get_scope(user_pk: typing.Optional[int]) -> str:
+    """
+    область видимости результатов:
+    анонимы видят одно и то же, пользователь - еще и свои организации
+    """
+    return 'public' if user_pk is None else f'user:{user_pk}'
+
+
+def get_result_key(
+    alias: str,
+    generation: int,
+    query_text: str,
+    fields: list,
+    scope: str,
+    params: typing.Optional[dict] = None,
+) -> str:
+    """
+    ключ результата поиска
+    params - остальное, от чего зависит результат (фасеты, число id)
+    """
+    digest = hashlib.sha1(
+        json.dumps(
+            [normalize_query(query_text), sorted(fields), scope, params],
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+    return f'search:{alias}:{generation}:{digest}'
+
+
+def get_hits(
+    document_class: django_elasticsearch_dsl.Document,
+    fields: list,
+    query_text: str,
+    user_pk: typing.Optional[int],
+    facets: typing.Optional[typing.Dict[str, core.facets.Facet]] = None,
+    selected: typing.Optional[dict] = None,
+    max_hits: typing.Optional[int] = None,
+) -> typing.Tuple[typing.List[int], dict]:
+    """
+    id найденных документов и счетчики фасетов из кеша или из elastic
+    страницы поиска берутся срезом списка id,
+    поэтому при листании elastic не запрашивается
+    счетчик статуса по датам может отстать на SEARCH_CACHE_TTL
+    если redis недоступен, ищем и не кешируем
+    """
+    args = (
+        document_class,
+        fields,
+        query_text,
+        user_pk,
+        facets,
+        selected,
+        max_hits,
+    )
+    alias = document_class._index._name
+    connection = core.redis_rervices.redis_connection
+    params = {
+        'facets': sorted(facets or dict()),
+        'selected': selected or dict(),
+        'max_hits': max_hits,
+    }
+    try:
+        generation = int(connection.get(get_generation_key(alias)) or 0)
+        result_key = get_result_key(
+            alias, generation, query_text, fields, get_scope(user_pk), params
+        )
+        cached_result = connection.get(result_key)
+    except redis.exceptions.RedisError:
+        return core.elastic_services.get_hits(*args)
+    if cached_result is not None:
+        try:
+            connection.incr(HITS_KEY)
+        except redis.exceptions.RedisError:
+            pass
+        result = json.loads(cached_result)
+        return result['ids'], result['facets']
+    hit_ids, facet_counts = core.elastic_services.get_hits(*args)
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.set(
+        result_key,
+        json.dumps({'ids': hit_ids, 'facets': facet_counts}),
+        ex=django.conf.settings.SEARCH_CACHE_TTL,
+    )
+    pipeline.incr(MISSES_KEY)
+    try:
+        pipeline.execute()
+    except redis.exceptions.RedisError:
+        pass
+    return hit_ids, facet_counts
+
+
+def get_hit_ids(
+    document_class: django_elasticsearch_dsl.Document,
+    fields: list,
+    query_text: str,
+    user_pk: typing.Optional[int],
+) -> typing.List[int]:
+    """id найденных документов из кеша или из elastic"""
+    return get_hits(document_class, fields, query_text, user_pk)[0]
+
+
+def get_suggestions(
+    document_class: django_elasticsearch_dsl.Document,
+    prefix: str,
+    user_pk: typing.Optional[int],
+) -> typing.List[dict]:
+    """
+    подсказки из кеша или из elastic
+    при наборе одни и те же префиксы запрашиваются часто,
+    поэтому храним их недолго - SEARCH_SUGGEST_TTL секунд
+    """
+    alias = document_class._index._name
+    size = django.conf.settings.SEARCH_SUGGEST_SIZE
+    connection = core.redis_rervices.redis_connection
+    try:
+        generation = int(connection.get(get_generation_key(alias)) or 0)
+        result_key = get_result_key(
+            alias, generation, prefix, ['name.suggest'], get_scope(user_pk)
+        )
+        cached_suggestions = connection.get(result_key)
+    except redis.exceptions.RedisError:
+        return core.elastic_services.get_suggestions(
+            document_class, prefix, user_pk, size
+        )
+    if cached_suggestions is not None:
+        return json.loads(cached_suggestions)
+    suggestions = core.elastic_services.get_suggestions(
+        document_class, prefix, user_pk, size
+    )
+    try:
+        connection.set(
+            result_key,
+            json.dumps(suggestions),
+            ex=django.conf.settings.SEARCH_SUGGEST_TTL,
+        )
+    except redis.exceptions.RedisError:
+        pass
+    return suggestions
+
+
+def invalidate_search_cache(alias: str) -> None:
+    """
+    документы индекса изменились - повышаем поколение,
+    старые результаты удалятся сами по истечении SEARCH_CACHE_TTL
+    """
+    try:
+        core.redis_rervices.redis_connection.incr(get_generation_key(alias))
+    except redis.exceptions.RedisError:
+        pass
+
+
+def get_stats() -> dict:
+    """попадания и промахи кеша поиска"""
+    hits, misses = core.redis_rervices.redis_connection.mget(
+        HITS_KEY, MISSES_KEY
+    )
+    hits, misses = int(hits or 0), int(misses or 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0,
+    }
+
+
+def reset_stats() -> None:
+    """обнуляем счетчики кеша поиска"""
+    core.redis_rervices.redis_connection.delete(HITS_KEY, MISSES_KEY)
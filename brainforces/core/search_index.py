@@ -0,0 +1,273 @@
+import hashlib
+import json
+import typing
+
+import django_elasticsearch_dsl
+import django_elasticsearch_dsl.registries
+import elasticsearch.exceptions
+import elasticsearch.helpers
+
+import django.utils.timezone
+
+import core.redis_rervices
+import core.search_cache
+import core.search_queue
+
+
+MISSING_STATUS = 'missing'
+OUTDATED_STATUS = 'outdated'
+OK_STATUS = 'ok'
+
+# сколько секунд может идти сборка индексов, пока журнал изменений пишется
+REBUILDING_TTL = 6 * 60 * 60
+# одновременно индексы пересобирает только один процесс
+REBUILD_LOCK_KEY = 'search_index:rebuild_lock'
+# таймаут запросов сборки в секундах: обычный ELASTICSEARCH_TIMEOUT
+# рассчитан на поиск, а не на заливку и refresh всего индекса
+REINDEX_REQUEST_TIMEOUT = 120
+
+
+def get_documents(
+    aliases: typing.Optional[list] = None,
+) -> typing.List[django_elasticsearch_dsl.Document]:
+    """документы по именам алиасов, по умолчанию - все"""
+    documents = django_elasticsearch_dsl.registries.registry.get_documents()
+    if aliases is None:
+        return list(documents)
+    return [
+        document_class
+        for document_class in documents
+        if document_class._index._name in aliases
+    ]
+
+
+def get_index_body(document_class: django_elasticsearch_dsl.Document) -> dict:
+    """настройки и схема индекса документа"""
+    return document_class._index.to_dict()
+
+
+def get_mapping_version(
+    document_class: django_elasticsearch_dsl.Document,
+) -> str:
+    """версия схемы индекса - хеш настроек и полей документа"""
+    return hashlib.sha1(
+        json.dumps(get_index_body(document_class), sort_keys=True).encode()
+    ).hexdigest()
+
+
+def get_alias_indexes(
+    document_class: django_elasticsearch_dsl.Document,
+) -> typing.List[str]:
+    """индексы, на которые сейчас указывает алиас документа"""
+    connection = document_class._get_connection()
+    try:
+        return list(
+            connection.indices.get_alias(name=document_class._index._name)
+        )
+    except elasticsearch.exceptions.NotFoundError:
+        return list()
+
+
+def get_index_status(document_class: django_elasticsearch_dsl.Document) -> str:
+    """
+    есть ли алиас и совпадает ли версия схемы его индекса с текущей
+    индекс со старой схемой нужно пересобрать
+    """
+    indexes = get_alias_indexes(document_class)
+    if not indexes:
+        return MISSING_STATUS
+    mapping = document_class._get_connection().indices.get_mapping(
+        index=indexes[0]
+    )
+    version = (
+        mapping[indexes[0]]['mappings'].get('_meta', dict()).get('version')
+    )
+    if version != get_mapping_version(document_class):
+        return OUTDATED_STATUS
+    return OK_STATUS
+
+
+def iterate_chunks(
+    document_class: django_elasticsearch_dsl.Document, chunk_size: int
+) -> typing.Iterator[list]:
+    """
+    записи документа пачками по первичному ключу
+    связанные записи (indexing_prefetch документа) выбираются
+    одним запросом на пачку, а не на каждую запись
+    """
+    queryset = (
+        document_class()
+        .get_queryset()
+        .prefetch_related(*document_class.indexing_prefetch)
+        .order_by('pk')
+    )
+    last_pk = None
+    while True:
+        chunk_queryset = queryset
+        if last_pk is not None:
+            chunk_queryset = queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_queryset[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def get_index_actions(
+    document_class: django_elasticsearch_dsl.Document,
+    index_name: str,
+    chunk_size: int,
+) -> typing.Iterator[dict]:
+    """действия bulk api для всех записей документа"""
+    document = document_class()
+    for chunk in iterate_chunks(document_class, chunk_size):
+        for instance in chunk:
+            if document.should_index_object(instance):
+                yield {
+                    '_op_type': 'index',
+                    '_index': index_name,
+                    '_id': document.generate_id(instance),
+                    '_source': document.prepare(instance),
+                }
+
+
+def create_index(document_class: django_elasticsearch_dsl.Document) -> str:
+    """
+    новый индекс с версией в имени
+    обновление поиска на время заливки выключено
+    """
+    alias = document_class._index._name
+    index_name = (
+        f'{alias}-{django.utils.timezone.now().strftime("%Y%m%d%H%M%S%f")}'
+    )
+    body = get_index_body(document_class)
+    body.setdefault('settings', dict())['refresh_interval'] = '-1'
+    body.setdefault('mappings', dict())['_meta'] = {
+        'version': get_mapping_version(document_class)
+    }
+    document_class._get_connection().indices.create(
+        index=index_name, body=body, request_timeout=REINDEX_REQUEST_TIMEOUT
+    )
+    return index_name
+
+
+def swap_alias(
+    document_class: django_elasticsearch_dsl.Document, index_name: str
+) -> None:
+    """
+    атомарно переключаем алиас на новый индекс и удаляем старые
+    индекс, созданный search_index --rebuild, занимает имя алиаса,
+    его удаляем в том же запросе
+    """
+    connection = document_class._get_connection()
+    alias = document_class._index._name
+    old_indexes = get_alias_indexes(document_class)
+    actions = [
+        {'remove': {'index': old_index, 'alias': alias}}
+        for old_index in old_indexes
+    ]
+    if not old_indexes and connection.indices.exists(index=alias):
+        actions.append({'remove_index': {'index': alias}})
+    actions.append({'add': {'index': index_name, 'alias': alias}})
+    connection.indices.update_aliases(body={'actions': actions})
+    for old_index in old_indexes:
+        connection.indices.delete(index=old_index, ignore_unavailable=True)
+
+
+def build_index(
+    document_class: django_elasticsearch_dsl.Document,
+    chunk_size: int = 1000,
+    thread_count: int = 4,
+) -> dict:
+    """
+    собираем новый индекс документа за алиасом
+    поиск до переключения алиаса работает по старому индексу
+    возвращаем имя индекса и количество документов
+    """
+    index_name = create_index(document_class)
+    connection = document_class._get_connection()
+    indexed = 0
+    for ok, _ in elasticsearch.helpers.parallel_bulk(
+        connection,
+        get_index_actions(document_class, index_name, chunk_size),
+        thread_count=thread_count,
+        chunk_size=chunk_size,
+        request_timeout=REINDEX_REQUEST_TIMEOUT,
+    ):
+        indexed += ok
+    connection.indices.put_settings(
+        index=index_name,
+        body={
+            'refresh_interval': get_index_body(document_class)
+            .get('settings', dict())
+            .get('refresh_interval')
+        },
+        request_timeout=REINDEX_REQUEST_TIMEOUT,
+    )
+    connection.indices.refresh(
+        index=index_name, request_timeout=REINDEX_REQUEST_TIMEOUT
+    )
+    swap_alias(document_class, index_name)
+    core.search_cache.invalidate_search_cache(document_class._index._name)
+    return {'index': index_name, 'documents': indexed}
+
+
+def start_rebuilding() -> None:
+    """пока индексы собираются, изменения записей пишутся в журнал"""
+    connection = core.redis_rervices.redis_connection
+    connection.delete(core.search_queue.JOURNAL_KEY)
+    connection.set(core.search_queue.REBUILDING_KEY, 1, ex=REBUILDING_TTL)
+
+
+def catch_up() -> int:
+    """
+    переиндексируем записи, измененные во время сборки:
+    они попали в старый индекс, а в новый - нет
+    если elastic ответил ошибкой, журнал остается до следующего запуска
+    возвращаем количество обновленных документов
+    """
+    connection = core.redis_rervices.redis_connection
+    connection.delete(core.search_queue.REBUILDING_KEY)
+    fields = connection.hgetall(core.search_queue.JOURNAL_KEY)
+    if not fields:
+        return 0
+    updated = core.search_queue.flush_dirty(fields)
+    connection.delete(core.search_queue.JOURNAL_KEY)
+    return updated
+
+
+def is_rebuilding() -> bool:
+    """идет ли сейчас пересборка индексов"""
+    return bool(core.redis_rervices.redis_connection.exists(REBUILD_LOCK_KEY))
+
+
+def rebuild_indexes(
+    documents: typing.List[django_elasticsearch_dsl.Document],
+    chunk_size: int = 1000,
+    thread_count: int = 4,
+) -> typing.Optional[dict]:
+    """
+    пересобираем индексы документов без простоя поиска
+    и догоняем изменения, сделанные во время сборки
+    параллельная сборка затерла бы журнал изменений и удалила бы
+    чужой новый индекс при переключении алиаса, поэтому сборка идет
+    под блокировкой; если она уже занята - возвращаем None
+    """
+    lock = core.redis_rervices.redis_connection.lock(
+        REBUILD_LOCK_KEY, timeout=REBUILDING_TTL
+    )
+    if not lock.acquire(blocking=False):
+        return None
+    try:
+        start_rebuilding()
+        report = dict()
+        try:
+            for document_class in documents:
+                report[document_class._index._name] = build_index(
+                    document_class, chunk_size, thread_count
+                )
+        finally:
+            report['caught_up'] = catch_up()
+    finally:
+        lock.release()
+    return report
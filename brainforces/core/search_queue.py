@@ -0,0 +1,283 @@
+import collections
+import typing
+
+import django_elasticsearch_dsl.apps
+import django_elasticsearch_dsl.registries
+import django_elasticsearch_dsl.signals
+import redis.exceptions
+
+import django.apps
+import django.conf
+import django.core.exceptions
+import django.db
+import django.db.models
+
+import core.redis_rervices
+import core.tasks
+
+
+DIRTY_KEY = 'search_index:dirty'
+PROCESSING_KEY = 'search_index:processing'
+FLUSH_LOCK_KEY = 'search_index:flush_lock'
+FLUSH_SCHEDULED_KEY = 'search_index:flush_scheduled'
+# пока пересобираются индексы, изменения дублируются в журнал
+REBUILDING_KEY = 'search_index:rebuilding'
+JOURNAL_KEY = 'search_index:journal'
+
+INDEX_ACTION = 'index'
+DELETE_ACTION = 'delete'
+
+
+def get_dirty_field(model: typing.Type[django.db.models.Model], pk) -> str:
+    """поле хеша измененных записей: app_label.model_name:pk"""
+    return f'{model._meta.label_lower}:{pk}'
+
+
+def is_indexed(model: typing.Type[django.db.models.Model]) -> bool:
+    """есть ли документы, которые надо обновить при изменении модели"""
+    registry = django_elasticsearch_dsl.registries.registry
+    return model in registry.get_models() or bool(get_related_documents(model))
+
+
+def get_related_documents(
+    model: typing.Type[django.db.models.Model],
+) -> list:
+    """документы, у которых модель указана в related_models"""
+    registry = django_elasticsearch_dsl.registries.registry
+    return [
+        document_class
+        for document_class in registry.get_documents()
+        if model in getattr(document_class.django, 'related_models', ())
+    ]
+
+
+def get_related_instances(
+    document_class: django_elasticsearch_dsl.Document,
+    instance: django.db.models.Model,
+) -> list:
+    """записи документа, которые зависят от измененной записи"""
+    try:
+        related = document_class().get_instances_from_related(instance)
+    except django.core.exceptions.ObjectDoesNotExist:
+        return list()
+    if related is None:
+        return list()
+    if isinstance(related, django.db.models.Model):
+        return [related]
+    return list(related)
+
+
+def mark_dirty(instances: typing.Iterable, action: str) -> None:
+    """
+    запоминаем записи, которые нужно переиндексировать
+    повторные изменения одной записи схлопываются в одно поле хеша,
+    во время пересборки индексов записи попадают и в журнал,
+    выгрузка в elastic ставится после коммита транзакции
+    """
+    fields = {
+        get_dirty_field(instance.__class__, instance.pk): action
+        for instance in instances
+    }
+    if not fields:
+        return
+    connection = core.redis_rervices.redis_connection
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.hset(DIRTY_KEY, mapping=fields)
+    pipeline.exists(REBUILDING_KEY)
+    _, is_rebuilding = pipeline.execute()
+    if is_rebuilding:
+        connection.hset(JOURNAL_KEY, mapping=fields)
+    django.db.transaction.on_commit(schedule_search_index_flush)
+
+
+def schedule_search_index_flush() -> None:
+    """ставим задачу на выгрузку в elastic, если она еще не поставлена"""
+    if core.redis_rervices.redis_connection.set(
+        FLUSH_SCHEDULED_KEY, 1, nx=True, ex=60
+    ):
+        core.tasks.flush_search_index.apply_async(
+            countdown=django.conf.settings.SEARCH_INDEX_FLUSH_DELAY
+        )
+
+
+class QueuedSignalProcessor(
+    django_elasticsearch_dsl.signals.BaseSignalProcessor
+):
+    """
+    вместо синхронного обновления elastic в потоке запроса
+    запоминаем измененные записи в redis,
+    а в elastic их выгружает задача celery
+    если redis недоступен, обновляем elastic сразу
+    """
+
+    def setup(self) -> None:
+        django.db.models.signals.post_save.connect(self.handle_save)
+        django.db.models.signals.post_delete.connect(self.handle_delete)
+        django.db.models.signals.m2m_changed.connect(self.handle_m2m_changed)
+        django.db.models.signals.pre_delete.connect(self.handle_pre_delete)
+
+    def teardown(self) -> None:
+        django.db.models.signals.post_save.disconnect(self.handle_save)
+        django.db.models.signals.post_delete.disconnect(self.handle_delete)
+        django.db.models.signals.m2m_changed.disconnect(
+            self.handle_m2m_changed
+        )
+        django.db.models.signals.pre_delete.disconnect(self.handle_pre_delete)
+
+    def should_handle(self, instance: django.db.models.Model) -> bool:
+        """автосинхронизация включена и модель участвует в поиске"""
+        return (
+            django_elasticsearch_dsl.apps.DEDConfig.autosync_enabled()
+            and is_indexed(instance.__class__)
+        )
+
+    def handle_save(
+        self, sender: type, instance: django.db.models.Model, **kwargs
+    ) -> None:
+        """запись и зависящие от нее документы переиндексируем позже"""
+        if not self.should_handle(instance):
+            return
+        try:
+            mark_dirty([instance], INDEX_ACTION)
+        except redis.exceptions.RedisError:
+            super().handle_save(sender, instance, **kwargs)
+
+    def handle_pre_delete(
+        self, sender: type, instance: django.db.models.Model, **kwargs
+    ) -> None:
+        """
+        после удаления связи уже не найти,
+        поэтому зависящие записи запоминаем до него
+        """
+        if not self.should_handle(instance):
+            return
+        related_instances = [
+            related_instance
+            for document_class in get_related_documents(instance.__class__)
+            for related_instance in get_related_instances(
+                document_class, instance
+            )
+        ]
+        try:
+            mark_dirty(related_instances, INDEX_ACTION)
+        except redis.exceptions.RedisError:
+            super().handle_pre_delete(sender, instance, **kwargs)
+
+    def handle_delete(
+        self, sender: type, instance: django.db.models.Model, **kwargs
+    ) -> None:
+        """документ записи удаляем позже"""
+        registry = django_elasticsearch_dsl.registries.registry
+        if not self.should_handle(instance) or (
+            instance.__class__ not in registry.get_models()
+        ):
+            return
+        try:
+            mark_dirty([instance], DELETE_ACTION)
+        except redis.exceptions.RedisError:
+            super().handle_delete(sender, instance, **kwargs)
+
+
+def group_dirty_fields(fields: dict) -> dict:
+    """{(модель, действие): [pk]} из полей хеша измененных записей"""
+    grouped = collections.defaultdict(list)
+    for field, action in fields.items():
+        label, pk = field.decode().rsplit(':', 1)
+        model = django.apps.apps.get_model(label)
+        grouped[(model, action.decode())].append(model._meta.pk.to_python(pk))
+    return grouped
+
+
+def index_instances(
+    model: typing.Type[django.db.models.Model], pks: list
+) -> int:
+    """
+    переиндексируем записи и зависящие от них документы
+    bulk запросом на каждый документ
+    возвращаем количество обновленных записей
+    """
+    registry = django_elasticsearch_dsl.registries.registry
+    instances = list(model._default_manager.filter(pk__in=pks))
+    updated = 0
+    if model in registry.get_models():
+        for document_class in registry.get_documents(models=[model]):
+            document_class().update(instances, refresh=False)
+        updated += len(instances)
+    for document_class in get_related_documents(model):
+        related_instances = {
+            related_instance.pk: related_instance
+            for instance in instances
+            for related_instance in get_related_instances(
+                document_class, instance
+            )
+        }
+        document_class().update(related_instances.values(), refresh=False)
+        updated += len(related_instances)
+    return updated
+
+
+def delete_instances(
+    model: typing.Type[django.db.models.Model], pks: list
+) -> int:
+    """удаляем документы записей одним bulk запросом на каждый документ"""
+    registry = django_elasticsearch_dsl.registries.registry
+    if model not in registry.get_models():
+        return 0
+    instances = [model(pk=pk) for pk in pks]
+    for document_class in registry.get_documents(models=[model]):
+        document_class().update(
+            instances,
+            action=DELETE_ACTION,
+            refresh=False,
+            raise_on_error=False,
+        )
+    return len(instances)
+
+
+def flush_dirty(fields: dict) -> int:
+    """выгружаем измененные записи в elastic"""
+    updated = 0
+    for (model, action), pks in group_dirty_fields(fields).items():
+        if action == DELETE_ACTION:
+            updated += delete_instances(model, pks)
+        else:
+            updated += index_instances(model, pks)
+    return updated
+
+
+def flush_search_index() -> int:
+    """
+    выгружаем все измененные записи в elastic
+    одновременно выгружает только один процесс
+    если elastic ответил ошибкой, записи возвращаются в очередь,
+    при этом более новые изменения тех же записей не затираются
+    возвращаем количество обновленных документов
+    """
+    connection = core.redis_rervices.redis_connection
+    connection.delete(FLUSH_SCHEDULED_KEY)
+    lock = connection.lock(FLUSH_LOCK_KEY, timeout=300)
+    if not lock.acquire(blocking=False):
+        return 0
+    try:
+        # записи, оставшиеся после упавшего процесса
+        fields = connection.hgetall(PROCESSING_KEY)
+        if not fields and connection.exists(DIRTY_KEY):
+            connection.rename(DIRTY_KEY, PROCESSING_KEY)
+            fields = connection.hgetall(PROCESSING_KEY)
+        if not fields:
+            return 0
+        try:
+            updated = flush_dirty(fields)
+        except Exception:
+            pipeline = connection.pipeline()
+            for field, action in fields.items():
+                pipeline.hsetnx(DIRTY_KEY, field, action)
+            pipeline.delete(PROCESSING_KEY)
+            pipeline.execute()
+            raise
+        connection.delete(PROCESSING_KEY)
+    finally:
+        lock.release()
+    if connection.exists(DIRTY_KEY):
+        schedule_search_index_flush()
+    return updated
@@ -0,0 +1,122 @@
+import functools
+import operator
+import typing
+
+import django.conf
+import django.contrib.postgres.search
+import django.db.models
+
+
+# веса частей поискового вектора postgres:
+# название записи, название организации, текст без разметки
+NAME_WEIGHT = 'A'
+ORGANIZATION_WEIGHT = 'B'
+TEXT_WEIGHT = 'C'
+# вес каждого поля из search_fields представлений
+FIELD_WEIGHTS = {
+    'name': NAME_WEIGHT,
+    'organized_by.name': ORGANIZATION_WEIGHT,
+    'posted_by.name': ORGANIZATION_WEIGHT,
+    'description': TEXT_WEIGHT,
+    'text': TEXT_WEIGHT,
+}
+
+
+class TsFilter(
+    django.contrib.postgres.search.SearchVectorCombinable,
+    django.db.models.Func,
+):
+    """лексемы вектора только с указанными весами"""
+
+    function = 'ts_filter'
+    output_field = django.contrib.postgres.search.SearchVectorField()
+    config = None  # для склейки с SearchVector через +
+
+    def __init__(self, vector: typing.Any, weights: typing.Iterable) -> None:
+        super().__init__(
+            vector,
+            django.db.models.Value('{%s}' % ','.join(sorted(weights))),
+        )
+
+
+def get_field_weights(fields: list) -> typing.Set[str]:
+    """веса полей поиска, boost (name^3) не учитывается"""
+    return {FIELD_WEIGHTS[field.split('^')[0]] for field in fields}
+
+
+def make_search_vector(
+    weighted_texts: typing.List[typing.Tuple[str, str]],
+) -> django.contrib.postgres.search.SearchVector:
+    """вектор из текстов с весами: [(текст, вес)]"""
+    config = django.conf.settings.SEARCH_POSTGRES_CONFIG
+    return functools.reduce(
+        operator.add,
+        [
+            django.contrib.postgres.search.SearchVector(
+                django.db.models.Value(
+                    text, output_field=django.db.models.TextField()
+                ),
+                weight=weight,
+                config=config,
+            )
+            for text, weight in weighted_texts
+        ],
+    )
+
+
+def should_update(
+    update_fields: typing.Optional[typing.Iterable], source_fields: tuple
+) -> bool:
+    """изменилось ли при сохранении поле, из которого строится вектор"""
+    return update_fields is None or bool(
+        set(update_fields) & set(source_fields)
+    )
+
+
+def update_search_vector(instance: django.db.models.Model) -> None:
+    """пересчитываем вектор записи по ее get_search_texts"""
+    instance.__class__._default_manager.filter(pk=instance.pk).update(
+        search_vector=make_search_vector(instance.get_search_texts())
+    )
+
+
+def update_organization_name(
+    queryset: django.db.models.QuerySet, name: str
+) -> int:
+    """
+    организация переименована - меняем ее название в векторах записей
+    одним запросом: лексемы остальных весов остаются как были
+    """
+    return queryset.update(
+        search_vector=TsFilter(
+            django.db.models.F('search_vector'), (NAME_WEIGHT, TEXT_WEIGHT)
+        )
+        + make_search_vector([(name, ORGANIZATION_WEIGHT)])
+    )
+
+
+def backfill_search_vectors(
+    queryset: django.db.models.QuerySet,
+    get_texts: typing.Callable[[django.db.models.Model], list],
+    batch_size: int = 500,
+) -> int:
+    """
+    векторы всех записей пачками по первичному ключу
+    get_texts - тексты с весами записи, как у get_search_texts
+    (в миграциях у моделей нет методов)
+    """
+    queryset = queryset.order_by('pk')
+    updated = 0
+    last_pk = None
+    while True:
+        chunk_queryset = queryset
+        if last_pk is not None:
+            chunk_queryset = queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_queryset[:batch_size])
+        if not chunk:
+            return updated
+        for instance in chunk:
+            instance.search_vector = make_search_vector(get_texts(instance))
+        queryset.model._default_manager.bulk_update(chunk, ['search_vector'])
+        updated += len(chunk)
+        last_pk = chunk[-1].pk
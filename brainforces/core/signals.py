@@ -0,0 +1,14 @@
+import django_elasticsearch_dsl
+import django_elasticsearch_dsl.signals
+
+import django.dispatch
+
+import core.search_cache
+
+
+@django.dispatch.receiver(django_elasticsearch_dsl.signals.post_index)
+def invalidate_search_cache(
+    sender: django_elasticsearch_dsl.Document, **kwargs
+) -> None:
+    """документы записаны в индекс - результаты поиска по нему устарели"""
+    core.search_cache.invalidate_search_cache(sender._index._name)
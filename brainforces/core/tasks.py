@@ -0,0 +1,43 @@
+import typing
+
+import celery
+import elasticsearch.exceptions
+import elasticsearch.helpers
+
+import django.conf
+
+import core.search_index
+import core.search_queue
+
+
+@celery.shared_task(
+    bind=True, max_retries=django.conf.settings.SEARCH_INDEX_MAX_RETRIES
+)
+def flush_search_index(self: celery.Task) -> int:
+    """
+    выгружаем измененные записи в elastic bulk запросами
+    при ошибке elastic повторяем с увеличивающейся задержкой,
+    записи при этом остаются в очереди
+    возвращаем количество обновленных документов
+    """
+    try:
+        return core.search_queue.flush_search_index()
+    except (
+        elasticsearch.exceptions.TransportError,
+        elasticsearch.helpers.BulkIndexError,
+    ) as error:
+        if self.request.is_eager:
+            raise
+        raise self.retry(exc=error, countdown=2**self.request.retries)
+
+
+@celery.shared_task
+def rebuild_search_indexes(aliases: list = None) -> typing.Optional[dict]:
+    """
+    пересобираем индексы elastic за алиасами
+    возвращаем имена новых индексов и количество документов,
+    None - индексы уже пересобирает другой процесс
+    """
+    return core.search_index.rebuild_indexes(
+        core.search_index.get_documents(aliases)
+    )
@@ -0,0 +1,588 @@
+import io
+import os
+import unittest
+
+import elasticsearch.exceptions
+import mock
+import redis.exceptions
+
+import django.core.management
+import django.db.models
+import django.test
+import django.urls
+import django.utils.timezone
+
+import core.elastic_services
+import core.redis_rervices
+import core.resilience
+import core.search_backends
+import core.search_index
+import core.search_queue
+import core.search_vectors
+import core.tasks
+import core.text_services
+import organization.documents
+import organization.models
+import quiz.documents
+import quiz.models
+import users.models
+
+
+class SearchTestCase(django.test.TestCase):
+    """записи, которые попадают в поиск, и пустая очередь изменений"""
+
+    def setUp(self) -> None:
+        """подготовка к тестированию, создание тестовых данных"""
+        for breaker in core.resilience.BREAKERS.values():
+            breaker.reset()
+        self.clear_queue()
+        self.user = users.models.User.objects.create(
+            username='member', email='member@gmail.com'
+        )
+        self.organization = organization.models.Organization.objects.create(
+            name='organization', description='description', is_active=True
+        )
+        self.membership = (
+            organization.models.OrganizationToUser.objects.create(
+                organization=self.organization, user=self.user, role=1
+            )
+        )
+        self.quiz = quiz.models.Quiz.objects.create(
+            name='quiz',
+            description='description',
+            organized_by=self.organization,
+            start_time=django.utils.timezone.now(),
+        )
+        self.clear_queue()
+        super().setUp()
+
+    def clear_queue(self) -> None:
+        """удаляем очередь измененных записей"""
+        core.redis_rervices.redis_connection.delete(
+            core.search_queue.DIRTY_KEY,
+            core.search_queue.PROCESSING_KEY,
+            core.search_queue.FLUSH_SCHEDULED_KEY,
+            core.search_queue.REBUILDING_KEY,
+            core.search_queue.JOURNAL_KEY,
+        )
+
+    def get_queue(self) -> dict:
+        """очередь измененных записей"""
+        return {
+            field.decode(): action.decode()
+            for field, action in core.redis_rervices.redis_connection.hgetall(
+                core.search_queue.DIRTY_KEY
+            ).items()
+        }
+
+    def tearDown(self) -> None:
+        """удаляем очередь из redis"""
+        self.clear_queue()
+        super().tearDown()
+
+
+class SearchQueueTests(SearchTestCase):
+    """тестируем отложенное обновление elastic"""
+
+    def test_repeated_saves_coalesced(self) -> None:
+        """повторные сохранения записи попадают в очередь один раз"""
+        for index in range(3):
+            self.quiz.name = f'quiz {index}'
+            self.quiz.save()
+        self.assertEqual(
+            self.get_queue(), {f'quiz.quiz:{self.quiz.pk}': 'index'}
+        )
+
+    def test_not_indexed_model_skipped(self) -> None:
+        """модели без документов в очередь не попадают"""
+        users.models.User.objects.create(
+            username='user', email='user@gmail.com'
+        )
+        self.assertEqual(self.get_queue(), {})
+
+    def test_related_delete_queued(self) -> None:
+        """
+        при удалении участника организация и ее викторины
+        попадают в очередь до удаления связи
+        """
+        self.membership.delete()
+        self.assertEqual(
+            self.get_queue(),
+            {
+                f'organization.organization:{self.organization.pk}': 'index',
+                f'quiz.quiz:{self.quiz.pk}': 'index',
+            },
+        )
+
+    def test_delete_queued(self) -> None:
+        """удаленная запись попадает в очередь на удаление документа"""
+        quiz_pk = self.quiz.pk
+        self.quiz.delete()
+        self.assertEqual(self.get_queue(), {f'quiz.quiz:{quiz_pk}': 'delete'})
+
+    def test_flush(self) -> None:
+        """очередь выгружается в elastic bulk запросами и очищается"""
+        self.quiz.save()
+        with mock.patch.object(
+            quiz.documents.QuizDocument, 'update'
+        ) as update:
+            self.assertEqual(core.search_queue.flush_search_index(), 1)
+        update.assert_called_once_with([self.quiz], refresh=False)
+        self.assertEqual(self.get_queue(), {})
+
+    def test_flush_error_requeued(self) -> None:
+        """
+        при ошибке elastic записи возвращаются в очередь,
+        но не затирают новые изменения
+        """
+        self.organization.save()
+        with mock.patch.object(
+            organization.documents.OrganizationDocument,
+            'update',
+            side_effect=elasticsearch.exceptions.ConnectionError,
+        ):
+            with self.assertRaises(elasticsearch.exceptions.ConnectionError):
+                core.search_queue.flush_search_index()
+        self.assertEqual(
+            self.get_queue(),
+            {f'organization.organization:{self.organization.pk}': 'index'},
+        )
+
+
+class SearchIndexTests(SearchTestCase):
+    """тестируем пересборку индексов за алиасами"""
+
+    def test_chunks(self) -> None:
+        """записи достаются пачками по первичному ключу"""
+        for index in range(2):
+            quiz.models.Quiz.objects.create(
+                name=f'quiz {index}', description='description'
+            )
+        chunks = list(
+            core.search_index.iterate_chunks(quiz.documents.QuizDocument, 2)
+        )
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertLess(chunks[0][-1].pk, chunks[1][0].pk)
+
+    def test_index_actions_member_ids(self) -> None:
+        """участники организаций выбираются одним запросом на пачку"""
+        other_organization = organization.models.Organization.objects.create(
+            name='other', description='description', is_active=True
+        )
+        for organization_obj in (self.organization, other_organization):
+            quiz.models.Quiz.objects.create(
+                name='quiz',
+                description='description',
+                organized_by=organization_obj,
+            )
+        # пачка, участники ее организаций и пустая следующая пачка
+        with self.assertNumQueries(3):
+            actions = list(
+                core.search_index.get_index_actions(
+                    quiz.documents.QuizDocument, 'викторины-1', 10
+                )
+            )
+        self.assertEqual(
+            [action['_source']['member_ids'] for action in actions],
+            [[self.user.pk], [self.user.pk], []],
+        )
+
+    def test_catch_up(self) -> None:
+        """записи, измененные во время сборки, догоняются после нее"""
+        core.search_index.start_rebuilding()
+        self.quiz.save()
+        with mock.patch.object(
+            quiz.documents.QuizDocument, 'update'
+        ) as update:
+            self.assertEqual(core.search_index.catch_up(), 1)
+        update.assert_called_once_with([self.quiz], refresh=False)
+        self.quiz.save()
+        self.assertFalse(
+            core.redis_rervices.redis_connection.exists(
+                core.search_queue.JOURNAL_KEY
+            )
+        )
+
+    def test_rebuild_locked(self) -> None:
+        """пока индексы пересобираются, вторая сборка не запускается"""
+        lock = core.redis_rervices.redis_connection.lock(
+            core.search_index.REBUILD_LOCK_KEY, timeout=60
+        )
+        lock.acquire()
+        try:
+            with mock.patch.object(
+                core.search_index, 'build_index'
+            ) as build_index, mock.patch.object(
+                core.tasks.rebuild_search_indexes, 'delay'
+            ) as delay, mock.patch(
+                'elasticsearch_dsl.connections.get_connection'
+            ):
+                self.assertIsNone(
+                    core.search_index.rebuild_indexes(
+                        [quiz.documents.QuizDocument]
+                    )
+                )
+                django.core.management.call_command(
+                    'reindex_search', check=True, stdout=io.StringIO()
+                )
+            build_index.assert_not_called()
+            delay.assert_not_called()
+        finally:
+            lock.release()
+
+    def test_swap_alias(self) -> None:
+        """алиас атомарно переключается на новый индекс"""
+        connection = mock.MagicMock()
+        connection.indices.get_alias.return_value = {'викторины-1': {}}
+        with mock.patch.object(
+            quiz.documents.QuizDocument,
+            '_get_connection',
+            return_value=connection,
+        ):
+            core.search_index.swap_alias(
+                quiz.documents.QuizDocument, 'викторины-2'
+            )
+        connection.indices.update_aliases.assert_called_once_with(
+            body={
+                'actions': [
+                    {'remove': {'index': 'викторины-1', 'alias': 'викторины'}},
+                    {'add': {'index': 'викторины-2', 'alias': 'викторины'}},
+                ]
+            }
+        )
+        connection.indices.delete.assert_called_once_with(
+            index='викторины-1', ignore_unavailable=True
+        )
+
+    def test_swap_rebuilt_index(self) -> None:
+        """индекс, созданный search_index --rebuild, заменяется алиасом"""
+        connection = mock.MagicMock()
+        connection.indices.get_alias.side_effect = (
+            elasticsearch.exceptions.NotFoundError
+        )
+        connection.indices.exists.return_value = True
+        with mock.patch.object(
+            quiz.documents.QuizDocument,
+            '_get_connection',
+            return_value=connection,
+        ):
+            core.search_index.swap_alias(
+                quiz.documents.QuizDocument, 'викторины-2'
+            )
+        connection.indices.update_aliases.assert_called_once_with(
+            body={
+                'actions': [
+                    {'remove_index': {'index': 'викторины'}},
+                    {'add': {'index': 'викторины-2', 'alias': 'викторины'}},
+                ]
+            }
+        )
+
+
+class HtmlToTextTests(SearchTestCase):
+    """тестируем подготовку текста ckeditor к индексации"""
+
+    def test_html_to_text(self) -> None:
+        """теги, атрибуты и скрипты убираются, сущности раскрываются"""
+        self.assertEqual(
+            core.text_services.html_to_text(
+                '<p>Вопрос&nbsp;про <b>Пушкина</b></p><p>и&nbsp;&laquo;Онегина'
+                '&raquo;</p><img alt="картинка" src="/media/images/a.png">'
+                '<br><script>alert(1)</script>'
+            ),
+            'Вопрос про Пушкина и «Онегина»',
+        )
+        self.assertEqual(core.text_services.html_to_text(''), '')
+
+    def test_document_prepared_without_markup(self) -> None:
+        """в документ викторины попадает описание без разметки"""
+        self.quiz.description = '<h2>Тема</h2><p>история&nbsp;России</p>'
+        prepared = quiz.documents.QuizDocument().prepare(self.quiz)
+        self.assertEqual(prepared['description'], 'Тема история России')
+
+
+class SearchVectorTests(SearchTestCase):
+    """тестируем поисковые векторы postgres"""
+
+    def get_vector(self, instance: django.db.models.Model) -> str:
+        """поисковый вектор записи из базы"""
+        instance.refresh_from_db(fields=['search_vector'])
+        return instance.search_vector
+
+    def test_vector_weights(self) -> None:
+        """название, организация и текст без разметки с разными весами"""
+        self.quiz.name = 'История'
+        self.quiz.description = '<p>Вопросы <img src="/media/a.png"></p>'
+        self.quiz.save()
+        self.assertEqual(
+            self.get_vector(self.quiz),
+            "'organ':2B 'вопрос':3C 'истор':1A",
+        )
+
+    def test_organization_renamed(self) -> None:
+        """новое название организации попадает в векторы ее викторин"""
+        self.organization.name = 'Клуб знатоков'
+        self.organization.save()
+        self.assertEqual(
+            self.get_vector(self.quiz),
+            "'descript':3C 'quiz':1A 'знаток':5B 'клуб':4B",
+        )
+
+    def test_unrelated_update_skipped(self) -> None:
+        """сохранение других полей вектор не пересчитывает"""
+        with self.assertNumQueries(1):
+            self.quiz.save(update_fields=['is_ended'])
+
+
+class SearchBackendRelevanceMixin:
+    """
+    одинаковые проверки релевантности для каждого движка поиска
+    на одном наборе викторин
+    """
+
+    backend_name: str
+    backend_options: dict = dict()
+
+    def setUp(self) -> None:
+        """викторины с разными совпадениями и приватная организация"""
+        super().setUp()
+        self.backend = core.search_backends.get_search_backend(
+            self.backend_name, **self.backend_options
+        )
+        start_time = django.utils.timezone.now()
+        self.by_name = quiz.models.Quiz.objects.create(
+            name='История России',
+            description='<p>Вопросы о царях</p>',
+            organized_by=self.organization,
+            start_time=start_time,
+        )
+        self.by_description = quiz.models.Quiz.objects.create(
+            name='Викторина выходного дня',
+            description=(
+                '<p>Немного <b>истории</b> и&nbsp;географии</p>'
+                '<img alt="history" src="/media/images/history.png">'
+            ),
+            organized_by=self.organization,
+            start_time=start_time,
+        )
+        self.other = quiz.models.Quiz.objects.create(
+            name='Математика',
+            description='<p>Задачи на логику</p>',
+            organized_by=self.organization,
+            start_time=start_time,
+        )
+        private_organization = organization.models.Organization.objects.create(
+            name='Закрытый клуб',
+            description='description',
+            is_active=True,
+            is_private=True,
+        )
+        self.private = quiz.models.Quiz.objects.create(
+            name='История Рима',
+            description='<p>Вопросы о Цезаре</p>',
+            organized_by=private_organization,
+            start_time=start_time,
+        )
+        self.stranger = users.models.User.objects.create(
+            username='stranger', email='stranger@gmail.com'
+        )
+        organization.models.OrganizationToUser.objects.create(
+            organization=private_organization, user=self.user, role=1
+        )
+        self.index_dataset()
+
+    def index_dataset(self) -> None:
+        """движку, которому нужен отдельный индекс, передаем викторины"""
+
+    def search(
+        self, query_text: str, fields: list = None, user_pk: int = None
+    ) -> list:
+        """id найденных викторин"""
+        return self.backend.get_hit_ids(
+            quiz.documents.QuizDocument,
+            fields or ['name^3', 'organized_by.name^2', 'description'],
+            query_text,
+            user_pk,
+        )
+
+    def test_name_ranked_above_description(self) -> None:
+        """совпадение в названии выше совпадения в описании"""
+        self.assertEqual(
+            self.search('история', user_pk=self.stranger.pk),
+            [self.by_name.pk, self.by_description.pk],
+        )
+
+    def test_word_forms(self) -> None:
+        """другие формы слова находятся без нечеткого поиска"""
+        self.assertIn(self.by_name.pk, self.search('историей'))
+        self.assertIn(self.by_name.pk, self.search('россию'))
+
+    def test_markup_not_indexed(self) -> None:
+        """теги, атрибуты и адреса картинок не ищутся"""
+        for query_text in ('img', 'png', 'images', 'nbsp'):
+            self.assertEqual(self.search(query_text), [])
+
+    def test_search_by_field(self) -> None:
+        """поиск только по описанию"""
+        self.assertEqual(
+            self.search('истории', ['description']),
+            [self.by_description.pk],
+        )
+
+    def test_private_hidden(self) -> None:
+        """приватные викторины видят только участники организации"""
+        self.assertEqual(self.search('рима'), [])
+        self.assertEqual(self.search('рима', user_pk=self.stranger.pk), [])
+        self.assertEqual(
+            self.search('рима', user_pk=self.user.pk), [self.private.pk]
+        )
+
+    def test_suggestions(self) -> None:
+        """подсказки по началу слов названия без приватных викторин"""
+        suggestions = self.backend.get_suggestions(
+            quiz.documents.QuizDocument, 'истор', None
+        )
+        self.assertEqual(
+            suggestions, [{'id': self.by_name.pk, 'name': 'История России'}]
+        )
+
+
+class PostgresSearchBackendTests(SearchBackendRelevanceMixin, SearchTestCase):
+    """релевантность полнотекстового поиска postgres"""
+
+    backend_name = 'postgres'
+
+
+@unittest.skipUnless(
+    os.getenv('SEARCH_TEST_ELASTIC'),
+    'нужен отдельный elasticsearch с созданными индексами',
+)
+class ElasticSearchBackendTests(SearchBackendRelevanceMixin, SearchTestCase):
+    """
+    релевантность поиска elastic на тех же викторинах
+    документы пишутся в рабочие индексы и удаляются после теста
+    """
+
+    backend_name = 'elastic'
+    backend_options = {'use_cache': False, 'use_fallback': False}
+
+    def get_dataset(self) -> list:
+        """викторины набора"""
+        return [self.by_name, self.by_description, self.other, self.private]
+
+    def index_dataset(self) -> None:
+        quiz.documents.QuizDocument().update(self.get_dataset(), refresh=True)
+
+    def tearDown(self) -> None:
+        """удаляем документы набора из индекса"""
+        quiz.documents.QuizDocument().update(
+            self.get_dataset(),
+            action='delete',
+            refresh=True,
+            raise_on_error=False,
+        )
+        super().tearDown()
+
+
+class CircuitBreakerTests(django.test.TestCase):
+    """тестируем предохранители внешних сервисов"""
+
+    def setUp(self) -> None:
+        """предохранитель, который размыкается после двух ошибок"""
+        self.breaker = core.resilience.CircuitBreaker(
+            'test',
+            exceptions=(ConnectionError,),
+            failure_threshold=2,
+            reset_timeout=30,
+        )
+        self.failing = mock.Mock(side_effect=ConnectionError)
+        self.fallback = mock.Mock(return_value='fallback')
+        super().setUp()
+
+    def tearDown(self) -> None:
+        """замыкаем цепь redis"""
+        core.redis_rervices.redis_breaker.reset()
+        core.redis_rervices.buffered_counters.clear()
+        super().tearDown()
+
+    def test_trip_and_short_circuit(self) -> None:
+        """после ошибок подряд сервис не вызывается"""
+        for _ in range(2):
+            self.assertEqual(
+                self.breaker.call(self.failing, fallback=self.fallback),
+                'fallback',
+            )
+        self.breaker.call(self.failing, fallback=self.fallback)
+        self.assertEqual(self.failing.call_count, 2)
+        self.assertEqual(
+            self.breaker.get_metrics(),
+            {'state': 'open', 'failures': 2, 'trips': 1, 'short_circuits': 1},
+        )
+        with self.assertRaises(core.resilience.CircuitOpenError):
+            self.breaker.call(self.failing)
+
+    def test_half_open_probe(self) -> None:
+        """
+        после reset_timeout проходит один пробный вызов:
+        ошибка снова размыкает цепь, успех замыкает
+        """
+        with mock.patch('time.monotonic', return_value=100):
+            for _ in range(2):
+                self.breaker.call(self.failing, fallback=self.fallback)
+        with mock.patch('time.monotonic', return_value=130):
+            self.assertEqual(self.breaker.get_state(), 'half_open')
+            self.breaker.call(self.failing, fallback=self.fallback)
+            self.assertEqual(self.breaker.get_state(), 'open')
+        self.assertEqual(self.breaker.trips, 2)
+        with mock.patch('time.monotonic', return_value=160):
+            self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.breaker.get_state(), 'closed')
+
+    def test_redis_open_circuit(self) -> None:
+        """
+        при разомкнутой цепи redis команды сразу падают ошибкой соединения,
+        просмотры копятся в памяти и дописываются потом
+        """
+        key = 'test:total_views'
+        core.redis_rervices.redis_connection.delete(key)
+        breaker = core.redis_rervices.redis_breaker
+        breaker.failures = breaker.failure_threshold
+        breaker.record_failure()
+        with self.assertRaises(redis.exceptions.ConnectionError):
+            core.redis_rervices.redis_connection.get(key)
+        for _ in range(2):
+            self.assertIsNone(core.redis_rervices.incr_buffered(key))
+        breaker.reset()
+        self.assertEqual(core.redis_rervices.incr_buffered(key), 3)
+        self.assertEqual(core.redis_rervices.buffered_counters, {})
+        core.redis_rervices.redis_connection.delete(key)
+
+
+class SearchFallbackTests(SearchTestCase):
+    """тестируем поиск, когда elastic недоступен"""
+
+    def test_postgres_fallback(self) -> None:
+        """ошибка elastic - ищем в postgres"""
+        with mock.patch(
+            'core.elastic_services.get_hits',
+            side_effect=elasticsearch.exceptions.ConnectionTimeout,
+        ):
+            hit_ids = core.search_backends.get_search_backend(
+                'elastic'
+            ).get_hit_ids(quiz.documents.QuizDocument, ['name'], 'quiz', None)
+        self.assertEqual(hit_ids, [self.quiz.pk])
+        self.assertEqual(
+            core.elastic_services.elastic_breaker.get_metrics()['failures'], 1
+        )
+
+    def test_metrics_for_staff(self) -> None:
+        """метрики предохранителей видит только персонал"""
+        url = django.urls.reverse('circuit_breaker_metrics')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(
+            response.json()['breakers']['elastic']['state'], 'closed'
+        )
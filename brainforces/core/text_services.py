@@ -0,0 +1,30 @@
+import html
+import re
+
+import django.utils.html
+
+
+# содержимое этих тегов не текст, его выкидываем целиком
+HIDDEN_TAGS_RE = re.compile(
+    r'<(script|style)\b[^>]*>.*?</\1\s*>', flags=re.IGNORECASE | re.DOTALL
+)
+# блочные теги разделяют слова: <p>раз</p><p>два</p> - это "раз два"
+BLOCK_TAGS_RE = re.compile(
+    r'<\s*/?\s*(br|p|div|li|ul|ol|h[1-6]|tr|td|th|table|blockquote|pre)\b'
+    r'[^>]*>',
+    flags=re.IGNORECASE,
+)
+
+
+def html_to_text(html_text: str) -> str:
+    """
+    текст из html ckeditor для индексации:
+    без тегов, атрибутов и ссылок на картинки,
+    с раскрытыми сущностями (&nbsp;, &laquo;) и схлопнутыми пробелами
+    """
+    if not html_text:
+        return ''
+    text = HIDDEN_TAGS_RE.sub(' ', html_text)
+    text = BLOCK_TAGS_RE.sub(' ', text)
+    text = html.unescape(django.utils.html.strip_tags(text))
+    return ' '.join(text.split())
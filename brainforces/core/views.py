@@ -1,13 +1,25 @@
 import http
+import os
+import typing
 
 import django_elasticsearch_dsl
 
+import django.conf
+import django.contrib.auth.mixins
 import django.db.models
 import django.http
 import django.shortcuts
+import django.urls
+import django.utils.cache
 import django.views.generic
 
 import core.elastic_services
+import core.facets
+import core.forms
+import core.redis_rervices
+import core.resilience
+import core.search_backends
+import core.search_cache
 
 
 def custom_404(
@@ -31,10 +43,23 @@ def custom_500(request: django.http.HttpRequest) -> django.http.HttpResponse:
 
 
 class ElasticSearchListView(django.views.generic.ListView):
-    """класс для поиска записей вместе с elasticsearch"""
+    """
+    класс для поиска записей движком SEARCH_BACKEND
+    по поисковому запросу доступ и порядок считает движок,
+    записи страницы достаются из базы по найденным id
+    """
 
     document_class: django_elasticsearch_dsl.Document  # документ для поиска
-    search_fields: list  # список полей для поиска
+    search_fields: list  # поля для поиска с весами (name^3)
+    # варианты поиска для формы: (значение search_by, название, поля)
+    search_by_choices: tuple = ()
+    suggest_url: str = None  # адрес подсказок при наборе запроса
+    # фасеты (core.facets) по имени GET параметра
+    facets: typing.Dict[str, core.facets.Facet] = dict()
+    is_search = False  # список строится по поисковому запросу
+    selected_facets: dict = dict()  # выбранные значения фасетов
+    facet_counts: dict = dict()  # счетчики фасетов от движка поиска
+    is_hits_limited = False  # найдено больше SEARCH_MAX_HITS записей
 
     def get_default_queryset(self) -> django.db.models.QuerySet:
         """
@@ -43,15 +68,171 @@ class ElasticSearchListView(django.views.generic.ListView):
         """
         ...
 
-    def get_queryset(self) -> django.db.models.QuerySet:
-        """получаем нужный queryset по поиску или без"""
-        queryset = self.get_default_queryset()
+    def get_search_queryset(self) -> django.db.models.QuerySet:
+        """
+        кверисет, из которого достаем найденные записи
+        доступ уже проверил движок поиска, поэтому без filter_user_access
+        """
+        ...
+
+    def get_search_fields(self) -> list:
+        """поля для выбранного search_by, по умолчанию - все search_fields"""
+        search_by = self.request.GET.get('search_by')
+        for value, _, fields in self.search_by_choices:
+            if str(value) == search_by:
+                return fields
+        return self.search_fields
+
+    def get_selected_facets(self) -> dict:
+        """допустимые значения фасетов из GET параметров"""
+        selected = dict()
+        for name, facet in self.facets.items():
+            value = facet.clean(self.request.GET.get(name, ''))
+            if value is not None:
+                selected[name] = value
+        return selected
+
+    def get_queryset(self) -> typing.Union[django.db.models.QuerySet, list]:
+        """
+        получаем нужный queryset без поиска
+        или список id найденных записей по поиску или фасетам
+        счетчики фасетов приходят в том же ответе движка,
+        без поиска движок только считает их (max_hits=0)
+        """
         query = self.request.GET.get('query')
-        if query:
-            search_queryset = core.elastic_services.make_search_results(
-                document_class=self.document_class,
-                fields=['name', 'description'],
-                query_text=query,
-            ).distinct()
-            queryset = queryset & search_queryset
-        return queryset
+        self.selected_facets = self.get_selected_facets()
+        self.is_search = bool(query or self.selected_facets)
+        if not self.is_search and not self.facets:
+            return self.get_default_queryset()
+        (
+            hit_ids,
+            self.facet_counts,
+        ) = core.search_backends.get_search_backend().get_hits(
+            document_class=self.document_class,
+            fields=self.get_search_fields(),
+            query_text=query or '',
+            user_pk=self.request.user.pk,
+            facets=self.facets,
+            selected=self.selected_facets,
+            max_hits=None if self.is_search else 0,
+        )
+        if not self.is_search:
+            return self.get_default_queryset()
+        # движок отдает не больше SEARCH_MAX_HITS id: если список полный,
+        # дальше могли быть еще записи - показываем, что он обрезан
+        self.is_hits_limited = (
+            len(hit_ids) >= django.conf.settings.SEARCH_MAX_HITS
+        )
+        return hit_ids
+
+    def paginate_queryset(
+        self, queryset: typing.Union[django.db.models.QuerySet, list], *args
+    ) -> tuple:
+        """
+        при поиске страница - срез списка id,
+        записи страницы достаем из базы одним запросом
+        """
+        paginator, page, object_list, is_paginated = super().paginate_queryset(
+            queryset, *args
+        )
+        if self.is_search:
+            page.object_list = core.elastic_services.get_objects_in_order(
+                self.get_search_queryset(), list(object_list)
+            )
+            object_list = page.object_list
+        return paginator, page, object_list, is_paginated
+
+    def get_context_data(self, *args, **kwargs) -> dict:
+        """
+        дополняем контекст формой поиска
+        и параметрами поиска для ссылок на страницы
+        """
+        context = super().get_context_data(*args, **kwargs)
+        form = core.forms.SearchForm(initial=self.request.GET.dict())
+        form.fields['search_by'].choices = [
+            (value, name) for value, name, _ in self.search_by_choices
+        ]
+        context['form'] = form
+        if self.suggest_url:
+            context['suggest_url'] = django.urls.reverse(self.suggest_url)
+        context['facets'] = [
+            {
+                'name': name,
+                'title': facet.title,
+                'choices': facet.get_choices(
+                    self.facet_counts.get(name),
+                    self.selected_facets.get(name),
+                ),
+            }
+            for name, facet in self.facets.items()
+        ]
+        if self.is_search:
+            search_params = self.request.GET.copy()
+            search_params.pop('page', None)
+            context['search_params'] = f'{search_params.urlencode()}&'
+        if self.is_hits_limited:
+            context['hits_limit'] = django.conf.settings.SEARCH_MAX_HITS
+        return context
+
+
+class ElasticSuggestView(django.views.generic.View):
+    """подсказки по началу названия при наборе поискового запроса"""
+
+    document_class: django_elasticsearch_dsl.Document  # документ для поиска
+    url_name: str  # адрес записи по pk
+
+    def get(
+        self, request: django.http.HttpRequest
+    ) -> django.http.JsonResponse:
+        """названия и ссылки первых найденных записей"""
+        prefix = core.search_cache.normalize_query(
+            request.GET.get('query', '')
+        )
+        suggestions = list()
+        if len(prefix) >= django.conf.settings.SEARCH_SUGGEST_MIN_LENGTH:
+            backend = core.search_backends.get_search_backend()
+            suggestions = [
+                {
+                    'name': suggestion['name'],
+                    'url': django.urls.reverse(
+                        self.url_name, kwargs={'pk': suggestion['id']}
+                    ),
+                }
+                for suggestion in backend.get_suggestions(
+                    self.document_class, prefix, request.user.pk
+                )
+            ]
+        response = django.http.JsonResponse({'suggestions': suggestions})
+        django.utils.cache.patch_cache_control(
+            response,
+            private=True,
+            max_age=django.conf.settings.SEARCH_SUGGEST_TTL,
+        )
+        return response
+
+
+class CircuitBreakerMetricsView(
+    django.contrib.auth.mixins.UserPassesTestMixin, django.views.generic.View
+):
+    """
+    состояние предохранителей внешних сервисов для мониторинга
+    у каждого процесса gunicorn свои предохранители, поэтому отдаем pid
+    """
+
+    def test_func(self) -> bool:
+        """метрики видит только персонал"""
+        return self.request.user.is_staff
+
+    def get(
+        self, request: django.http.HttpRequest
+    ) -> django.http.JsonResponse:
+        """состояние, ошибки подряд, размыкания и вызовы в обход сервиса"""
+        return django.http.JsonResponse(
+            {
+                'pid': os.getpid(),
+                'breakers': core.resilience.get_metrics(),
+                'buffered_counters': len(
+                    core.redis_rervices.buffered_counters
+                ),
+            }
+        )
@@ -13,9 +13,15 @@ class HomeView(core.views.ElasticSearchListView):
     context_object_name = 'posts'
     paginate_by = 10
     document_class = organization.documents.OrganizationPostDocument
-    search_fields = ['name', 'text']
+    search_fields = ['name^2', 'posted_by.name', 'text']
 
     def get_default_queryset(self) -> django.db.models.QuerySet:
         return organization.models.OrganizationPost.objects.filter_user_access(
             user_pk=self.request.user.pk
         ).order_by('-id')
+
+    def get_search_queryset(self) -> django.db.models.QuerySet:
+        post_manager = organization.models.OrganizationPost.objects
+        return post_manager.get_only_useful_fields(
+            user_pk=self.request.user.pk
+        )
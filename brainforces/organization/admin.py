@@ -1,6 +1,9 @@
 import django.contrib.admin
+import django.db.models
+import django.http
 
 import organization.models
+import organization.services
 
 
 @django.contrib.admin.register(organization.models.Organization)
@@ -11,6 +14,54 @@ class OrganizationAdmin(django.contrib.admin.ModelAdmin):
     list_display_links = ('id',)
     list_editable = ('is_private', 'is_active')
     list_filter = ('is_active',)
+    actions = ('activate', 'deactivate', 'make_private', 'make_public')
+
+    def update_flags(
+        self,
+        request: django.http.HttpRequest,
+        queryset: django.db.models.QuerySet,
+        **flags,
+    ) -> None:
+        """
+        меняем флаги выбранных организаций одним update,
+        видимость их викторин и постов пересчитывается каскадом
+        """
+        updated = organization.services.update_organizations_flags(
+            queryset, **flags
+        )
+        self.message_user(request, f'Обновлено организаций: {updated}')
+
+    @django.contrib.admin.action(description='Сделать активными')
+    def activate(
+        self,
+        request: django.http.HttpRequest,
+        queryset: django.db.models.QuerySet,
+    ) -> None:
+        self.update_flags(request, queryset, is_active=True)
+
+    @django.contrib.admin.action(description='Сделать неактивными')
+    def deactivate(
+        self,
+        request: django.http.HttpRequest,
+        queryset: django.db.models.QuerySet,
+    ) -> None:
+        self.update_flags(request, queryset, is_active=False)
+
+    @django.contrib.admin.action(description='Сделать приватными')
+    def make_private(
+        self,
+        request: django.http.HttpRequest,
+        queryset: django.db.models.QuerySet,
+    ) -> None:
+        self.update_flags(request, queryset, is_private=True)
+
+    @django.contrib.admin.action(description='Сделать публичными')
+    def make_public(
+        self,
+        request: django.http.HttpRequest,
+        queryset: django.db.models.QuerySet,
+    ) -> None:
+        self.update_flags(request, queryset, is_private=False)
 
 
 @django.contrib.admin.register(organization.models.OrganizationToUser)
@@ -7,3 +7,7 @@ class OrganizationConfig(django.apps.AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'organization'
     verbose_name = 'организация'
+
+    def ready(self) -> None:
+        """подключаем сигналы"""
+        import organization.signals  # noqa: F401
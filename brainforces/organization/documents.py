@@ -1,16 +1,94 @@
+import typing
+
 import django_elasticsearch_dsl
+import django_elasticsearch_dsl.fields
 import django_elasticsearch_dsl.registries
 
+import django.db.models
+
+import core.elastic_services
 import organization.models
+import organization.roles
+
+
+# участники организации, заранее выбранные пачкой для сборки индекса
+MEMBERSHIPS_ATTR = 'member_memberships'
+
+
+def get_members_prefetch(lookup: str) -> django.db.models.Prefetch:
+    """
+    участники организаций всей пачки записей одним запросом
+    lookup - путь до участников организации ('organized_by__users')
+    """
+    return django.db.models.Prefetch(
+        lookup,
+        queryset=organization.models.OrganizationToUser.objects.filter(
+            role__in=organization.roles.MEMBER_ROLES
+        ).only('pk', 'user_id', 'organization_id'),
+        to_attr=MEMBERSHIPS_ATTR,
+    )
+
+
+def get_member_ids(
+    organization_obj: typing.Optional[organization.models.Organization],
+    related_to_ignore: typing.Optional[django.db.models.Model] = None,
+) -> typing.List[int]:
+    """
+    id участников организации для фильтра доступа в elastic
+    при сборке индекса участники уже выбраны для всей пачки
+    (get_members_prefetch), иначе - запрос на организацию
+    related_to_ignore - удаляемое членство, которое еще есть в базе
+    """
+    if organization_obj is None:
+        return list()
+    ignored_pk = None
+    if isinstance(related_to_ignore, organization.models.OrganizationToUser):
+        ignored_pk = related_to_ignore.pk
+    memberships = getattr(organization_obj, MEMBERSHIPS_ATTR, None)
+    if memberships is not None:
+        return [
+            membership.user_id
+            for membership in memberships
+            if membership.pk != ignored_pk
+        ]
+    memberships = organization_obj.users.filter(
+        role__in=organization.roles.MEMBER_ROLES
+    )
+    if ignored_pk is not None:
+        memberships = memberships.exclude(pk=ignored_pk)
+    return list(memberships.values_list('user_id', flat=True))
+
+
+def get_organization_field() -> django_elasticsearch_dsl.fields.ObjectField:
+    """организация вместе с полями, от которых зависит доступ"""
+    return django_elasticsearch_dsl.fields.ObjectField(
+        properties={
+            'id': django_elasticsearch_dsl.fields.IntegerField(),
+            'name': core.elastic_services.make_text_field(),
+            'is_active': django_elasticsearch_dsl.fields.BooleanField(),
+            'is_private': django_elasticsearch_dsl.fields.BooleanField(),
+        }
+    )
 
 
 @django_elasticsearch_dsl.registries.registry.register_document
 class OrganizationDocument(django_elasticsearch_dsl.Document):
     """документ elasticsearch для модели Organization"""
 
-    description = django_elasticsearch_dsl.fields.TextField(
+    name = core.elastic_services.make_name_field()
+    description = core.elastic_services.make_text_field(
         attr='description_to_string_for_elastic'
     )
+    member_ids = django_elasticsearch_dsl.fields.IntegerField(multi=True)
+
+    # условия доступа для core.elastic_services.make_access_query
+    access_required_fields = {'is_active': True}
+    access_public_fields = {'is_private': False}
+    access_organization_field = 'pk'
+    # порядок без поискового запроса
+    default_sort = ('-id',)
+    # что выбирать пачкой при сборке индекса (core.search_index)
+    indexing_prefetch = (get_members_prefetch('users'),)
 
     class Index:
         name = 'организации'
@@ -18,22 +96,39 @@ class OrganizationDocument(django_elasticsearch_dsl.Document):
 
     class Django:
         model = organization.models.Organization
-        fields = ('name',)
+        fields = ('id', 'is_active', 'is_private')
+        related_models = (organization.models.OrganizationToUser,)
+
+    def prepare_member_ids_with_related(
+        self,
+        instance: organization.models.Organization,
+        related_to_ignore: typing.Optional[django.db.models.Model] = None,
+    ) -> typing.List[int]:
+        return get_member_ids(instance, related_to_ignore)
+
+    def get_instances_from_related(
+        self, related_instance: organization.models.OrganizationToUser
+    ) -> organization.models.Organization:
+        """участники организации изменились - переиндексируем ее"""
+        return related_instance.organization
 
 
 @django_elasticsearch_dsl.registries.registry.register_document
 class OrganizationPostDocument(django_elasticsearch_dsl.Document):
     """документ elasticsearch для модели OrganizationPost"""
 
-    posted_by = django_elasticsearch_dsl.fields.ObjectField(
-        properties={
-            'id': django_elasticsearch_dsl.fields.IntegerField(),
-            'name': django_elasticsearch_dsl.fields.TextField(),
-        }
-    )
-    text = django_elasticsearch_dsl.fields.TextField(
+    posted_by = get_organization_field()
+    name = core.elastic_services.make_text_field()
+    text = core.elastic_services.make_text_field(
         attr='text_to_string_for_elastic'
     )
+    member_ids = django_elasticsearch_dsl.fields.IntegerField(multi=True)
+
+    access_required_fields = {'posted_by.is_active': True}
+    access_public_fields = {'posted_by.is_private': False, 'is_private': False}
+    access_organization_field = 'posted_by'
+    default_sort = ('-id',)
+    indexing_prefetch = (get_members_prefetch('posted_by__users'),)
 
     class Index:
         name = 'пост'
@@ -41,4 +136,29 @@ class OrganizationPostDocument(django_elasticsearch_dsl.Document):
 
     class Django:
         model = organization.models.OrganizationPost
-        fields = ('name',)
+        fields = ('id', 'is_private')
+        related_models = (
+            organization.models.Organization,
+            organization.models.OrganizationToUser,
+        )
+
+    def get_queryset(self) -> django.db.models.QuerySet:
+        return super().get_queryset().select_related('posted_by')
+
+    def prepare_member_ids_with_related(
+        self,
+        instance: organization.models.OrganizationPost,
+        related_to_ignore: typing.Optional[django.db.models.Model] = None,
+    ) -> typing.List[int]:
+        return get_member_ids(instance.posted_by, related_to_ignore)
+
+    def get_instances_from_related(
+        self, related_instance: django.db.models.Model
+    ) -> django.db.models.QuerySet:
+        """
+        организация или ее участники изменились -
+        переиндексируем посты организации
+        """
+        if isinstance(related_instance, organization.models.Organization):
+            return related_instance.posts.all()
+        return related_instance.organization.posts.all()
@@ -0,0 +1,298 @@
+import json
+import typing
+
+import django.core.management.base
+import django.db
+import django.db.models
+import django.utils.timezone
+
+import organization.models
+import organization.visibility
+import quiz.models
+import users.models
+
+
+# узлы плана, которые группируют строки: distinct или group by
+GROUPING_NODES = {'Unique', 'HashAggregate', 'GroupAggregate'}
+
+
+def legacy_quizzes(user_pk: int) -> django.db.models.QuerySet:
+    """прежний доступ к викторинам: join по участникам и distinct"""
+    return (
+        quiz.models.Quiz.objects.get_only_useful_list_fields()
+        .filter(
+            django.db.models.Q(organized_by__is_private=False)
+            & django.db.models.Q(is_private=False)
+            | django.db.models.Q(organized_by__users__user__pk=user_pk)
+        )
+        .distinct()
+    )
+
+
+def legacy_organizations(user_pk: int) -> django.db.models.QuerySet:
+    """прежний доступ к организациям: join по участникам и distinct"""
+    return (
+        organization.models.Organization.objects.get_only_useful_fields()
+        .filter(
+            django.db.models.Q(
+                users__user__pk=user_pk, users__role__in=(1, 2, 3)
+            )
+            | django.db.models.Q(is_private=False)
+        )
+        .distinct()
+    )
+
+
+def legacy_posts(user_pk: int) -> django.db.models.QuerySet:
+    """прежний доступ к постам: join по участникам и distinct"""
+    return (
+        organization.models.OrganizationPost.objects.get_only_useful_fields(
+            user_pk=user_pk
+        )
+        .filter(
+            django.db.models.Q(posted_by__is_private=False)
+            & django.db.models.Q(is_private=False)
+            | django.db.models.Q(posted_by__users__user__pk=user_pk)
+        )
+        .distinct()
+    )
+
+
+def get_plan_nodes(plan: dict) -> typing.Set[str]:
+    """типы всех узлов плана, агрегаты - с их стратегией"""
+    node = plan['Node Type']
+    if node == 'Aggregate':
+        node = {'Hashed': 'HashAggregate', 'Sorted': 'GroupAggregate'}.get(
+            plan.get('Strategy'), node
+        )
+    nodes = {node}
+    for child in plan.get('Plans', ()):
+        nodes |= get_plan_nodes(child)
+    return nodes
+
+
+def explain(sql: str, params: tuple) -> dict:
+    """план запроса с реальным временем выполнения"""
+    with django.db.connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+class Command(django.core.management.base.BaseCommand):
+    """
+    сравниваем планы проверки доступа к викторинам, организациям и постам:
+    прежний join по участникам с distinct и подзапрос exists
+    для страницы списка и count пагинатора
+    тестовые данные создаются в транзакции и откатываются
+    """
+
+    help = 'Замер проверки доступа к записям организаций'
+
+    def add_arguments(
+        self, parser: django.core.management.base.CommandParser
+    ) -> None:
+        parser.add_argument(
+            '--organizations',
+            type=int,
+            default=10000,
+            help='количество организаций',
+        )
+        parser.add_argument(
+            '--memberships',
+            type=int,
+            default=1000000,
+            help='количество участников организаций',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=50000,
+            help='количество пользователей',
+        )
+        parser.add_argument(
+            '--quizzes',
+            type=int,
+            default=5,
+            help='викторин и постов у каждой организации',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=15,
+            help='размер страницы списка',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='размер пачки при создании тестовых данных',
+        )
+
+    def create_data(self, options: dict) -> int:
+        """
+        организации (каждая третья приватная), их викторины и посты
+        (каждая пятая приватная), участники с разными ролями
+        возвращаем pk пользователя, от имени которого проверяем доступ
+        """
+        batch_size = options['batch_size']
+        user_pks = [
+            user_obj.pk
+            for user_obj in users.models.User.objects.bulk_create(
+                (
+                    users.models.User(
+                        username=f'visibility_{index}',
+                        email=f'visibility_{index}@brainforces.ru',
+                    )
+                    for index in range(options['users'])
+                ),
+                batch_size=batch_size,
+            )
+        ]
+        organization_pks = [
+            organization_obj.pk
+            for organization_obj in (
+                organization.models.Organization.objects.bulk_create(
+                    (
+                        organization.models.Organization(
+                            name=f'organization {index}',
+                            description='description',
+                            is_active=True,
+                            is_private=index % 3 == 0,
+                        )
+                        for index in range(options['organizations'])
+                    ),
+                    batch_size=batch_size,
+                )
+            )
+        ]
+        # bulk_create не отправляет сигналы: время окончания задаем сами,
+        # видимость пересчитываем после создания постов
+        start_time = django.utils.timezone.now()
+        quiz.models.Quiz.objects.bulk_create(
+            (
+                quiz.models.Quiz(
+                    name=f'quiz {index}',
+                    description='description',
+                    organized_by_id=organization_pk,
+                    start_time=start_time,
+                    end_time=start_time
+                    + django.utils.timezone.timedelta(minutes=10),
+                    is_private=index % 5 == 0,
+                )
+                for organization_pk in organization_pks
+                for index in range(options['quizzes'])
+            ),
+            batch_size=batch_size,
+        )
+        organization.models.OrganizationPost.objects.bulk_create(
+            (
+                organization.models.OrganizationPost(
+                    name=f'post {index}',
+                    text='text',
+                    posted_by_id=organization_pk,
+                    is_private=index % 5 == 0,
+                )
+                for organization_pk in organization_pks
+                for index in range(options['quizzes'])
+            ),
+            batch_size=batch_size,
+        )
+        organization.visibility.update_organization_visibility(
+            organization.models.Organization.objects.filter(
+                pk__in=organization_pks
+            )
+        )
+        # i-е участие: пользователь i % users в организации,
+        # сдвинутой на шаг для каждого следующего круга по пользователям,
+        # поэтому пары (пользователь, организация) не повторяются
+        organizations_per_user = -(-options['memberships'] // len(user_pks))
+        step = max(len(organization_pks) // organizations_per_user, 1)
+        membership_table = organization.models.OrganizationToUser._meta
+        with django.db.connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {membership_table.db_table} '
+                '(organization_id, user_id, role) '
+                'SELECT (%s::int[])[1 + (i %% %s + i / %s * %s) %% %s], '
+                '(%s::int[])[1 + i %% %s], i %% 4 '
+                'FROM generate_series(0, %s - 1) AS i '
+                'ON CONFLICT DO NOTHING',
+                (
+                    organization_pks,
+                    len(user_pks),
+                    len(user_pks),
+                    step,
+                    len(organization_pks),
+                    user_pks,
+                    len(user_pks),
+                    options['memberships'],
+                ),
+            )
+            for model in (
+                users.models.User,
+                organization.models.Organization,
+                organization.models.OrganizationToUser,
+                organization.models.OrganizationPost,
+                quiz.models.Quiz,
+            ):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        return user_pks[0]
+
+    def report(
+        self, name: str, variant: str, queryset: django.db.models.QuerySet
+    ) -> None:
+        """планы страницы списка и count пагинатора"""
+        page_sql, page_params = queryset[
+            : self.page_size
+        ].query.sql_with_params()
+        count_sql, count_params = queryset.values('pk').query.sql_with_params()
+        for query_name, sql, params in (
+            ('page', page_sql, page_params),
+            (
+                'count',
+                f'SELECT COUNT(*) FROM ({count_sql}) AS subquery',
+                count_params,
+            ),
+        ):
+            result = explain(sql, params)
+            nodes = get_plan_nodes(result['Plan'])
+            self.stdout.write(
+                f'{name} {query_name}\t{variant}\t'
+                f'{result["Planning Time"]:.2f}\t'
+                f'{result["Execution Time"]:.2f}\t'
+                f'{", ".join(sorted(nodes & GROUPING_NODES)) or "-"}'
+            )
+
+    def handle(self, *args, **options) -> None:
+        self.page_size = options['page_size']
+        organization_manager = organization.models.Organization.objects
+        post_manager = organization.models.OrganizationPost.objects
+        with django.db.transaction.atomic():
+            user_pk = self.create_data(options)
+            self.stdout.write(
+                'query\tvariant\tplanning ms\texecution ms\tgrouping nodes'
+            )
+            for name, legacy_queryset, queryset in (
+                (
+                    'quizzes',
+                    legacy_quizzes(user_pk),
+                    quiz.models.Quiz.objects.filter_user_access(user_pk),
+                ),
+                (
+                    'organizations',
+                    legacy_organizations(user_pk),
+                    organization_manager.filter_user_access(user_pk),
+                ),
+                (
+                    'posts',
+                    legacy_posts(user_pk),
+                    post_manager.filter_user_access(user_pk),
+                ),
+            ):
+                legacy_queryset = legacy_queryset.order_by('-id')
+                queryset = queryset.order_by('-id')
+                self.report(name, 'join+distinct', legacy_queryset)
+                self.report(name, 'exists', queryset)
+            django.db.transaction.set_rollback(True)
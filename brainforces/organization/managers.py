@@ -1,5 +1,7 @@
 import django.db.models
 
+import organization.visibility
+
 
 class OrganizationManager(django.db.models.Manager):
     """менеджер модели Organization"""
@@ -18,16 +20,11 @@ class OrganizationManager(django.db.models.Manager):
         либо группа не приватная,
         либо пользователь в ней состоит
         """
-        return (
-            self.get_only_useful_fields()
-            .filter(
-                django.db.models.Q(
-                    users__user__pk=user_pk,
-                    users__role__in=(1, 2, 3),
-                )
-                | django.db.models.Q(is_private=False)
-            )
-            .distinct()
+        return organization.visibility.filter_visible(
+            self.get_only_useful_fields(),
+            django.db.models.Q(is_private=False),
+            'pk',
+            user_pk,
         )
 
 
@@ -35,8 +32,13 @@ class OrganizationPostManager(django.db.models.Manager):
     """менеджер модели OrganizationPost"""
 
     def get_posts_with_active_organizations(self) -> django.db.models.QuerySet:
-        """посты только активных организаций"""
-        return self.get_queryset().filter(posted_by__is_active=True)
+        """
+        посты только активных организаций
+        по денормализованной видимости, без join организации
+        """
+        return self.get_queryset().filter(
+            visibility__gt=organization.visibility.Visibility.HIDDEN
+        )
 
     def get_only_useful_fields(
         self, user_pk: int
@@ -69,14 +71,17 @@ class OrganizationPostManager(django.db.models.Manager):
         либо оргация не приватная,
         либо пользователь ее участник
         """
-        posts_queryset = self.get_only_useful_fields(user_pk=user_pk).filter(
-            django.db.models.Q(posted_by__is_private=False)
-            & django.db.models.Q(is_private=False)
-            | django.db.models.Q(posted_by__users__user__pk=user_pk)
+        posts_queryset = organization.visibility.filter_visible(
+            self.get_only_useful_fields(user_pk=user_pk),
+            django.db.models.Q(
+                visibility=organization.visibility.Visibility.PUBLIC
+            ),
+            'posted_by',
+            user_pk,
         )
         if org_pk != -1:
             posts_queryset = posts_queryset.filter(posted_by__pk=org_pk)
-        return posts_queryset.distinct()
+        return posts_queryset
 
 
 class OrganizationToUserManager(django.db.models.Manager):
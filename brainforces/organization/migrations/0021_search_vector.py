@@ -0,0 +1,64 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:21
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+import core.search_vectors
+import core.text_services
+
+
+def fill_search_vectors(apps, schema_editor):
+    """векторы уже созданных организаций и постов"""
+    core.search_vectors.backfill_search_vectors(
+        apps.get_model('organization', 'Organization').objects.all(),
+        lambda organization_obj: [
+            (organization_obj.name, core.search_vectors.NAME_WEIGHT),
+            (
+                core.text_services.html_to_text(organization_obj.description),
+                core.search_vectors.TEXT_WEIGHT,
+            ),
+        ],
+    )
+    core.search_vectors.backfill_search_vectors(
+        apps.get_model('organization', 'OrganizationPost')
+        .objects.select_related('posted_by')
+        .all(),
+        lambda post: [
+            (post.name, core.search_vectors.NAME_WEIGHT),
+            (post.posted_by.name, core.search_vectors.ORGANIZATION_WEIGHT),
+            (
+                core.text_services.html_to_text(post.text),
+                core.search_vectors.TEXT_WEIGHT,
+            ),
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organization', '0020_alter_organizationpost_text'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Название и текст для полнотекстового поиска postgres', null=True, verbose_name='поисковый вектор'),
+        ),
+        migrations.AddField(
+            model_name='organizationpost',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Название и текст для полнотекстового поиска postgres', null=True, verbose_name='поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='organization',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='organization_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='organizationpost',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='post_search_vector_idx'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organization', '0021_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationpost',
+            name='visibility',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Никому'), (1, 'Участникам организации'), (2, 'Всем')], default=0, editable=False, help_text='Кому виден пост: по его флагам и флагам организации', verbose_name='видимость'),
+        ),
+        migrations.AddIndex(
+            model_name='organizationpost',
+            index=models.Index(condition=models.Q(('visibility__gt', 0)), fields=['-id'], name='post_visible_idx'),
+        ),
+    ]
@@ -1,7 +1,10 @@
+import typing
+
 import django.http
 import django.views.generic
 
 import organization.models
+import organization.roles
 
 
 class OrganizationMixin(django.views.generic.View):
@@ -24,24 +27,33 @@ class OrganizationMixin(django.views.generic.View):
 class UserIsOrganizationMemberMixin(OrganizationMixin):
     """пользователь - участник организации"""
 
+    # представление что-то меняет даже на GET - роль всегда из базы
+    role_from_db = False
+
+    def get_user_role(self) -> typing.Optional[int]:
+        """
+        роль пользователя в организации
+        для изменений (не GET) - из базы, кеш ролей может отставать
+        """
+        return organization.roles.get_user_role(
+            org_pk=self.kwargs['pk'],
+            user_pk=self.request.user.pk,
+            fresh=self.role_from_db or self.request.method != 'GET',
+        )
+
     def get_context_data(self, *args, **kwargs) -> dict:
         """
-        добавляем в контекст переменные объекта organization_to_user,
+        добавляем в контекст роль пользователя в организации,
         является ли пользователь участником группы
         и является ли он ее администратором
         """
         context = super().get_context_data(*args, **kwargs)
-        org_user_manager = organization.models.OrganizationToUser.objects
-        org_user_obj = org_user_manager.get_organization_member(
-            org_pk=self.kwargs['pk'], user_pk=self.request.user.pk
-        ).first()
-        context['organization_to_user'] = org_user_obj
-        context['is_group_member'] = org_user_obj is not None
-        context['user_is_admin'] = (
-            org_user_obj.role in (2, 3)
-            if context['is_group_member']
-            else False
+        user_role = self.get_user_role()
+        context['user_role'] = user_role
+        context['is_group_member'] = (
+            user_role in organization.roles.MEMBER_ROLES
         )
+        context['user_is_admin'] = user_role in organization.roles.ADMIN_ROLES
         return context
 
 
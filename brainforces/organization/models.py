@@ -1,9 +1,14 @@
 import ckeditor_uploader.fields
 
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
 import django.db.models
 import django.urls
 
+import core.search_vectors
+import core.text_services
 import organization.managers
+import organization.visibility
 import users.models
 
 
@@ -36,9 +41,22 @@ class Organization(django.db.models.Model):
         help_text='активная организация или нет',
     )
 
+    search_vector = django.contrib.postgres.search.SearchVectorField(
+        verbose_name='поисковый вектор',
+        help_text='Название и текст для полнотекстового поиска postgres',
+        null=True,
+        editable=False,
+    )
+
     class Meta:
         verbose_name = 'организация'
         verbose_name_plural = 'организации'
+        indexes = (
+            django.contrib.postgres.indexes.GinIndex(
+                fields=('search_vector',),
+                name='organization_search_vector_idx',
+            ),
+        )
 
     def __str__(self) -> str:
         """строковое представление"""
@@ -52,10 +70,20 @@ class Organization(django.db.models.Model):
 
     def description_to_string_for_elastic(self) -> str:
         """
-        elastic не может проиндексировать RichTextUploadingField
-        поэтому прописываем его сами
+        elastic не может проиндексировать RichTextUploadingField,
+        поэтому индексируем текст описания без разметки
         """
-        return self.description
+        return core.text_services.html_to_text(self.description)
+
+    def get_search_texts(self) -> list:
+        """тексты с весами для поискового вектора postgres"""
+        return [
+            (self.name, core.search_vectors.NAME_WEIGHT),
+            (
+                self.description_to_string_for_elastic(),
+                core.search_vectors.TEXT_WEIGHT,
+            ),
+        ]
 
 
 class OrganizationToUser(django.db.models.Model):
@@ -133,9 +161,37 @@ class OrganizationPost(django.db.models.Model):
         related_name='posts',
     )
 
+    visibility = django.db.models.PositiveSmallIntegerField(
+        choices=organization.visibility.Visibility.choices,
+        default=organization.visibility.Visibility.HIDDEN,
+        verbose_name='видимость',
+        help_text='Кому виден пост: по его флагам и флагам организации',
+        editable=False,
+    )
+
+    search_vector = django.contrib.postgres.search.SearchVectorField(
+        verbose_name='поисковый вектор',
+        help_text='Название и текст для полнотекстового поиска postgres',
+        null=True,
+        editable=False,
+    )
+
     class Meta:
         verbose_name = 'пост'
         verbose_name_plural = 'посты'
+        indexes = (
+            django.contrib.postgres.indexes.GinIndex(
+                fields=('search_vector',), name='post_search_vector_idx'
+            ),
+            # списки видимых постов от новых к старым без join организации
+            django.db.models.Index(
+                fields=('-id',),
+                name='post_visible_idx',
+                condition=django.db.models.Q(
+                    visibility__gt=organization.visibility.Visibility.HIDDEN
+                ),
+            ),
+        )
 
     def __str__(self) -> str:
         """строковое представление"""
@@ -144,9 +200,20 @@ class OrganizationPost(django.db.models.Model):
     def text_to_string_for_elastic(self) -> str:
         """
         elastic не может проиндексировать RichTextField,
-        поэтому прописываем его сами
+        поэтому индексируем текст поста без разметки
         """
-        return self.text
+        return core.text_services.html_to_text(self.text)
+
+    def get_search_texts(self) -> list:
+        """тексты с весами для поискового вектора postgres"""
+        return [
+            (self.name, core.search_vectors.NAME_WEIGHT),
+            (self.posted_by.name, core.search_vectors.ORGANIZATION_WEIGHT),
+            (
+                self.text_to_string_for_elastic(),
+                core.search_vectors.TEXT_WEIGHT,
+            ),
+        ]
 
 
 class CommentToOrganizationPost(django.db.models.Model):
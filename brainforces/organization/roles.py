@@ -0,0 +1,126 @@
+import time
+import typing
+
+import redis.exceptions
+
+import django.conf
+
+import core.local_cache
+import core.redis_rervices
+import organization.models
+
+
+MEMBER_ROLES = (1, 2, 3)
+ADMIN_ROLES = (2, 3)
+# в redis нельзя положить None, поэтому отсутствие роли храним так
+NO_ROLE = -1
+
+# роли пользователей в памяти процесса
+# {(org_pk, user_pk): (роль, время проверки)}
+_local_roles = core.local_cache.LocalCache('ORGANIZATION_ROLES_LOCAL_MAX_SIZE')
+
+
+def get_version_key(org_pk: int) -> str:
+    """ключ версии ролей участников организации"""
+    return f'organization:{org_pk}:roles:version'
+
+
+def get_roles_key(org_pk: int) -> str:
+    """ключ хеша (пользователь - версия и роль)"""
+    return f'organization:{org_pk}:roles'
+
+
+def load_user_role(org_pk: int, user_pk: int) -> typing.Optional[int]:
+    """
+    роль пользователя в активной организации из базы
+    приглашенный - 0, не состоит в организации - None
+    """
+    org_user_manager = organization.models.OrganizationToUser.objects
+    return (
+        org_user_manager.get_organization_member_or_invited(
+            org_pk=org_pk, user_pk=user_pk
+        )
+        .values_list('role', flat=True)
+        .first()
+    )
+
+
+def _get_shared_user_role(org_pk: int, user_pk: int) -> typing.Optional[int]:
+    """
+    роль пользователя из redis
+    если ее нет или она записана для другой версии - берем из базы
+    """
+    connection = core.redis_rervices.redis_connection
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.get(get_version_key(org_pk))
+    pipeline.hget(get_roles_key(org_pk), user_pk)
+    version, cached_role = pipeline.execute()
+    version = int(version or 0)
+    if cached_role:
+        cached_version, role = map(int, cached_role.split(b':'))
+        if cached_version == version:
+            return None if role == NO_ROLE else role
+    role = load_user_role(org_pk, user_pk)
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.hset(
+        get_roles_key(org_pk),
+        user_pk,
+        f'{version}:{NO_ROLE if role is None else role}',
+    )
+    pipeline.expire(
+        get_roles_key(org_pk),
+        django.conf.settings.ORGANIZATION_ROLES_REDIS_TTL,
+    )
+    pipeline.execute()
+    return role
+
+
+def get_user_role(
+    org_pk: int, user_pk: int, fresh: bool = False
+) -> typing.Optional[int]:
+    """
+    роль пользователя в организации
+    сначала смотрим в память процесса, версию в redis
+    сверяем не чаще, чем раз в ORGANIZATION_ROLES_LOCAL_TTL секунд
+    fresh - роль из базы в обход кешей: проверки перед изменениями
+    не должны пропускать разжалованного или удаленного админа
+    """
+    if user_pk is None:
+        return None
+    org_pk, user_pk = int(org_pk), int(user_pk)
+    if fresh:
+        return load_user_role(org_pk, user_pk)
+    now = time.monotonic()
+    local_ttl = django.conf.settings.ORGANIZATION_ROLES_LOCAL_TTL
+    local_role = _local_roles.get((org_pk, user_pk))
+    if local_role and now - local_role[1] < local_ttl:
+        return local_role[0]
+    try:
+        role = _get_shared_user_role(org_pk, user_pk)
+    except redis.exceptions.RedisError:
+        return load_user_role(org_pk, user_pk)
+    _local_roles.set((org_pk, user_pk), (role, now))
+    # давно не читанные просроченные роли больше не нужны
+    _local_roles.evict_stale(
+        lambda local_role: now - local_role[1] >= local_ttl
+    )
+    return role
+
+
+def is_member(org_pk: int, user_pk: int, fresh: bool = False) -> bool:
+    """пользователь - участник организации"""
+    return get_user_role(org_pk, user_pk, fresh) in MEMBER_ROLES
+
+
+def is_admin(org_pk: int, user_pk: int, fresh: bool = False) -> bool:
+    """пользователь - админ организации"""
+    return get_user_role(org_pk, user_pk, fresh) in ADMIN_ROLES
+
+
+def invalidate_organization_roles(org_pk: int) -> None:
+    """участники или сама организация изменились - повышаем версию ролей"""
+    _local_roles.evict(lambda key, local_role: key[0] == org_pk)
+    try:
+        core.redis_rervices.redis_connection.incr(get_version_key(org_pk))
+    except redis.exceptions.RedisError:
+        pass
@@ -1,10 +1,19 @@
 import typing
 
+import django_elasticsearch_dsl.apps
+import django_elasticsearch_dsl.registries
+import redis.exceptions
+
 import django.contrib.messages
+import django.db
+import django.db.models
 import django.http
 import django.shortcuts
 
+import core.search_queue
 import organization.models
+import organization.roles
+import organization.visibility
 import quiz.forms
 
 
@@ -21,6 +30,43 @@ def get_post_by_user_organization_post_or_404(
     )
 
 
+def update_organizations_flags(
+    queryset: django.db.models.QuerySet, **flags
+) -> int:
+    """
+    меняем is_active или is_private сразу у многих организаций:
+    один update организаций и каскадный пересчет видимости
+    их викторин и постов
+    сигналов save при этом нет, поэтому роли участников
+    и документы поиска сбрасываем здесь же
+    возвращаем количество обновленных организаций
+    """
+    organizations = organization.models.Organization.objects.filter(
+        pk__in=list(queryset.values_list('pk', flat=True))
+    )
+    with django.db.transaction.atomic():
+        updated = organizations.update(**flags)
+        organization.visibility.update_organization_visibility(organizations)
+        organization_objects = list(organizations)
+        for organization_obj in organization_objects:
+            django.db.transaction.on_commit(
+                lambda org_pk=organization_obj.pk: (
+                    organization.roles.invalidate_organization_roles(org_pk)
+                )
+            )
+        if django_elasticsearch_dsl.apps.DEDConfig.autosync_enabled():
+            try:
+                core.search_queue.mark_dirty(
+                    organization_objects, core.search_queue.INDEX_ACTION
+                )
+            except redis.exceptions.RedisError:
+                registry = django_elasticsearch_dsl.registries.registry
+                for organization_obj in organization_objects:
+                    registry.update(organization_obj)
+                    registry.update_related(organization_obj)
+    return updated
+
+
 def process_quiz_creation_error(
     request: django.http.HttpRequest,
     question_formset: django.forms.BaseInlineFormSet,
@@ -0,0 +1,133 @@
+import typing
+
+import django.db
+import django.db.models.signals
+import django.dispatch
+
+import core.search_vectors
+import organization.models
+import organization.roles
+import organization.visibility
+
+
+# поля поста, от которых зависит его видимость
+POST_VISIBILITY_FIELDS = ('is_private', 'posted_by')
+
+
+def invalidate_organization_roles_on_commit(org_pk: int) -> None:
+    """сбрасываем роли участников организации после коммита транзакции"""
+    django.db.transaction.on_commit(
+        lambda: organization.roles.invalidate_organization_roles(org_pk)
+    )
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.post_save,
+    sender=organization.models.OrganizationToUser,
+)
+@django.dispatch.receiver(
+    django.db.models.signals.post_delete,
+    sender=organization.models.OrganizationToUser,
+)
+def organization_to_user_changed(
+    sender: type, instance: organization.models.OrganizationToUser, **kwargs
+) -> None:
+    """участник вступил, вышел или сменил роль - роли устарели"""
+    invalidate_organization_roles_on_commit(instance.organization_id)
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.post_save,
+    sender=organization.models.Organization,
+)
+@django.dispatch.receiver(
+    django.db.models.signals.post_delete,
+    sender=organization.models.Organization,
+)
+def organization_changed(
+    sender: type, instance: organization.models.Organization, **kwargs
+) -> None:
+    """
+    организация изменилась (например, стала неактивной)
+    или удалена - роли ее участников устарели
+    """
+    invalidate_organization_roles_on_commit(instance.pk)
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.post_save,
+    sender=organization.models.Organization,
+)
+def organization_saved(
+    sender: type,
+    instance: organization.models.Organization,
+    raw: bool = False,
+    update_fields: typing.Optional[frozenset] = None,
+    **kwargs,
+) -> None:
+    """
+    пересчитываем видимость викторин и постов организации
+    (и при загрузке фикстур - их записи могли загрузиться раньше)
+    и поисковый вектор организации,
+    название организации есть и в векторах ее викторин и постов
+    """
+    if core.search_vectors.should_update(
+        update_fields, ('is_active', 'is_private')
+    ):
+        organization.visibility.update_organization_visibility(
+            organization.models.Organization.objects.filter(pk=instance.pk)
+        )
+    if not raw and core.search_vectors.should_update(
+        update_fields, ('name', 'description')
+    ):
+        core.search_vectors.update_search_vector(instance)
+    if not raw and core.search_vectors.should_update(update_fields, ('name',)):
+        core.search_vectors.update_organization_name(
+            instance.quizzes.all(), instance.name
+        )
+        core.search_vectors.update_organization_name(
+            instance.posts.all(), instance.name
+        )
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.pre_save,
+    sender=organization.models.OrganizationPost,
+)
+def organization_post_visibility(
+    sender: type,
+    instance: organization.models.OrganizationPost,
+    update_fields: typing.Optional[frozenset] = None,
+    **kwargs,
+) -> None:
+    """видимость поста по его флагам и флагам организации"""
+    if core.search_vectors.should_update(
+        update_fields, POST_VISIBILITY_FIELDS
+    ):
+        instance.visibility = organization.visibility.get_visibility(
+            instance.posted_by_id,
+            is_hidden=False,
+            is_private=instance.is_private,
+        )
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.post_save,
+    sender=organization.models.OrganizationPost,
+)
+def organization_post_saved(
+    sender: type,
+    instance: organization.models.OrganizationPost,
+    raw: bool = False,
+    update_fields: typing.Optional[frozenset] = None,
+    **kwargs,
+) -> None:
+    """название или текст поста изменились - пересчитываем вектор"""
+    if not raw and core.search_vectors.should_update(
+        update_fields, ('name', 'text', 'posted_by')
+    ):
+        core.search_vectors.update_search_vector(instance)
+    if core.search_vectors.should_update(
+        update_fields, POST_VISIBILITY_FIELDS
+    ):
+        organization.visibility.save_visibility(instance, update_fields)
@@ -1,3 +1,5 @@
+import time
+import typing
 import zoneinfo
 
 import mock
@@ -10,6 +12,9 @@ import django.urls
 import django.utils.timezone
 
 import organization.models
+import organization.roles
+import organization.services
+import organization.visibility
 import quiz.models
 import users.models
 
@@ -680,3 +685,240 @@ class OrganizationTest(django.test.TransactionTestCase):
         users.models.User.objects.all().delete()
         organization.models.Organization.objects.all().delete()
         super().tearDown()
+
+
+class OrganizationRolesTests(django.test.TransactionTestCase):
+    """тестируем кеш ролей участников организаций"""
+
+    reset_sequences = True
+
+    fixtures = ['fixtures/organization/test.json']
+
+    def setUp(self) -> None:
+        """роли из прошлых тестов не должны влиять на текущий"""
+        for org_pk in range(1, 5):
+            organization.roles.invalidate_organization_roles(org_pk)
+        super().setUp()
+
+    @parameterized.parameterized.expand(
+        [[2, 1, 3], [2, 5, 0], [1, 2, 1], [1, 1, None], [3, 1, None]]
+    )
+    def test_user_role(
+        self, org_pk: int, user_pk: int, expected: typing.Optional[int]
+    ) -> None:
+        """роль в активной организации, в неактивной ролей нет"""
+        self.assertEqual(
+            organization.roles.get_user_role(org_pk, user_pk), expected
+        )
+
+    def test_user_role_cached(self) -> None:
+        """повторно роль берется из кеша без запросов к базе"""
+        organization.roles.get_user_role(2, 3)
+        with self.assertNumQueries(0):
+            self.assertTrue(organization.roles.is_member(2, 3))
+        organization.roles._local_roles.clear()
+        with self.assertNumQueries(0):
+            self.assertFalse(organization.roles.is_admin(2, 3))
+
+    @django.test.override_settings(ORGANIZATION_ROLES_LOCAL_MAX_SIZE=2)
+    def test_local_roles_bounded(self) -> None:
+        """в памяти процесса хранятся только недавно прочитанные роли"""
+        organization.roles._local_roles.clear()
+        for user_pk in range(1, 4):
+            organization.roles.get_user_role(2, user_pk)
+        self.assertEqual(len(organization.roles._local_roles), 2)
+        self.assertNotIn((2, 1), organization.roles._local_roles)
+
+    def test_local_roles_expired(self) -> None:
+        """просроченные роли вытесняются, не дожидаясь переполнения"""
+        organization.roles.get_user_role(2, 1)
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 60):
+            organization.roles.get_user_role(2, 3)
+        self.assertNotIn((2, 1), organization.roles._local_roles)
+        self.assertIn((2, 3), organization.roles._local_roles)
+
+    def test_fresh_role(self) -> None:
+        """проверка перед изменением не верит устаревшему кешу"""
+        self.assertTrue(organization.roles.is_admin(2, 1))
+        # update не шлет сигналов - кеш остается устаревшим
+        organization.models.OrganizationToUser.objects.filter(
+            organization__pk=2, user__pk=1
+        ).update(role=1)
+        self.assertTrue(organization.roles.is_admin(2, 1))
+        with self.assertNumQueries(1):
+            self.assertFalse(organization.roles.is_admin(2, 1, fresh=True))
+
+    def test_role_changed(self) -> None:
+        """смена роли сбрасывает кеш"""
+        self.assertFalse(organization.roles.is_admin(2, 3))
+        org_user_obj = organization.models.OrganizationToUser.objects.get(
+            organization__pk=2, user__pk=3
+        )
+        org_user_obj.role = 2
+        org_user_obj.save()
+        self.assertTrue(organization.roles.is_admin(2, 3))
+
+    def test_user_deleted_from_organization(self) -> None:
+        """удаление участника сбрасывает кеш"""
+        self.assertTrue(organization.roles.is_member(1, 2))
+        organization.models.OrganizationToUser.objects.filter(
+            organization__pk=1, user__pk=2
+        ).delete()
+        self.assertFalse(organization.roles.is_member(1, 2))
+
+    def test_organization_deactivated(self) -> None:
+        """неактивная организация сбрасывает роли участников"""
+        self.assertTrue(organization.roles.is_member(2, 1))
+        organization_obj = organization.models.Organization.objects.get(pk=2)
+        organization_obj.is_active = False
+        organization_obj.save()
+        self.assertFalse(organization.roles.is_member(2, 1))
+
+    def tearDown(self) -> None:
+        """удаление тестовых данных"""
+        users.models.User.objects.all().delete()
+        organization.models.Organization.objects.all().delete()
+        super().tearDown()
+
+
+class VisibilityTests(django.test.TestCase):
+    """тестируем доступ к записям приватных организаций"""
+
+    def setUp(self) -> None:
+        """приватная организация с тремя участниками и приглашенным"""
+        self.organization = organization.models.Organization.objects.create(
+            name='private',
+            description='description',
+            is_private=True,
+            is_active=True,
+        )
+        self.members = [
+            users.models.User.objects.create(
+                username=f'member_{index}', email=f'member_{index}@gmail.com'
+            )
+            for index in range(3)
+        ]
+        for member in self.members:
+            organization.models.OrganizationToUser.objects.create(
+                organization=self.organization, user=member, role=1
+            )
+        self.invited = users.models.User.objects.create(
+            username='invited', email='invited@gmail.com'
+        )
+        organization.models.OrganizationToUser.objects.create(
+            organization=self.organization, user=self.invited, role=0
+        )
+        self.quiz = quiz.models.Quiz.objects.create(
+            name='quiz',
+            description='description',
+            organized_by=self.organization,
+        )
+        self.post = organization.models.OrganizationPost.objects.create(
+            name='post', text='text', posted_by=self.organization
+        )
+        organization.models.OrganizationPostLike.objects.create(
+            user=self.members[0], post=self.post
+        )
+        super().setUp()
+
+    def test_member_sees_without_duplicates(self) -> None:
+        """участник видит запись один раз, лайки не размножаются"""
+        user_pk = self.members[0].pk
+        self.assertEqual(
+            list(quiz.models.Quiz.objects.filter_user_access(user_pk)),
+            [self.quiz],
+        )
+        self.assertEqual(
+            list(
+                organization.models.Organization.objects.filter_user_access(
+                    user_pk
+                )
+            ),
+            [self.organization],
+        )
+        posts = list(
+            organization.models.OrganizationPost.objects.filter_user_access(
+                user_pk
+            )
+        )
+        self.assertEqual(posts, [self.post])
+        self.assertEqual(posts[0].likes_num, 1)
+        self.assertEqual(posts[0].is_liked_by_user, 1)
+
+    @parameterized.parameterized.expand([['invited'], ['anonymous']])
+    def test_not_member_does_not_see(self, user_kind: str) -> None:
+        """приглашенный и аноним не видят записи приватной организации"""
+        user_pk = self.invited.pk if user_kind == 'invited' else None
+        self.assertFalse(
+            quiz.models.Quiz.objects.filter_user_access(user_pk).exists()
+        )
+        self.assertFalse(
+            organization.models.Organization.objects.filter_user_access(
+                user_pk
+            ).exists()
+        )
+        self.assertFalse(
+            organization.models.OrganizationPost.objects.filter_user_access(
+                user_pk
+            ).exists()
+        )
+
+    def test_no_distinct(self) -> None:
+        """доступ проверяется подзапросом exists без distinct"""
+        sql = str(
+            quiz.models.Quiz.objects.filter_user_access(
+                self.members[0].pk
+            ).query
+        )
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def assert_visibility(
+        self, quiz_visibility: int, post_visibility: int
+    ) -> None:
+        """видимость викторины и поста в базе"""
+        self.quiz.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(self.quiz.visibility, quiz_visibility)
+        self.assertEqual(self.post.visibility, post_visibility)
+
+    def test_visibility_on_save(self) -> None:
+        """видимость пересчитывается при сохранении записи и организации"""
+        visibility = organization.visibility.Visibility
+        self.assert_visibility(visibility.MEMBERS, visibility.MEMBERS)
+        self.organization.is_private = False
+        self.organization.save()
+        self.assert_visibility(visibility.PUBLIC, visibility.PUBLIC)
+        self.quiz.is_published = False
+        self.quiz.save(update_fields=['is_published'])
+        self.post.is_private = True
+        self.post.save(update_fields=['is_private'])
+        self.assert_visibility(visibility.HIDDEN, visibility.MEMBERS)
+
+    def test_bulk_flags_cascade(self) -> None:
+        """массовое изменение организаций в админке пересчитывает видимость"""
+        visibility = organization.visibility.Visibility
+        queryset = organization.models.Organization.objects.filter(
+            pk=self.organization.pk
+        )
+        organization.services.update_organizations_flags(
+            queryset, is_private=False
+        )
+        self.assert_visibility(visibility.PUBLIC, visibility.PUBLIC)
+        organization.services.update_organizations_flags(
+            queryset, is_active=False
+        )
+        self.assert_visibility(visibility.HIDDEN, visibility.HIDDEN)
+
+    def test_lists_filter_without_organization(self) -> None:
+        """списки фильтруют видимость без условий на организацию"""
+        for queryset in (
+            quiz.models.Quiz.objects.get_active_and_published_quizzes(),
+            organization.models.OrganizationPost.objects.filter_user_access(
+                None
+            ),
+        ):
+            self.assertNotIn(
+                f'"{organization.models.Organization._meta.db_table}".',
+                str(queryset.query).rsplit('WHERE', 1)[1].split('GROUP BY')[0],
+            )
@@ -41,6 +41,11 @@ urlpatterns = [
         organization.views.OrganizationListView.as_view(),
         name='list',
     ),
+    django.urls.path(
+        'suggest/',
+        organization.views.OrganizationSuggestView.as_view(),
+        name='suggest',
+    ),
     django.urls.path(
         '<int:pk>/posts/',
         organization.views.OrganizationPostsView.as_view(),
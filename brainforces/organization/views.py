@@ -1,3 +1,4 @@
+import django.conf
 import django.contrib.auth.mixins
 import django.contrib.messages
 import django.db.models
@@ -5,6 +6,7 @@ import django.forms
 import django.http
 import django.shortcuts
 import django.urls
+import django.utils.timezone
 import django.views.generic
 
 import core.elastic_services
@@ -14,9 +16,11 @@ import organization.documents
 import organization.forms
 import organization.mixins
 import organization.models
+import organization.roles
 import organization.services
 import quiz.forms
 import quiz.models
+import quiz.tasks
 
 
 class OrganizationMainView(django.views.generic.DetailView):
@@ -38,18 +42,13 @@ class OrganizationMainView(django.views.generic.DetailView):
         является ли он ее администратором
         """
         context = super().get_context_data(*args, **kwargs)
-        org_user_manager = organization.models.OrganizationToUser.objects
-        org_user_obj = (
-            org_user_manager.get_organization_member(
-                org_pk=self.kwargs['pk'], user_pk=self.request.user.pk
-            )
-            .only('role')
-            .first()
+        user_role = organization.roles.get_user_role(
+            org_pk=self.kwargs['pk'], user_pk=self.request.user.pk
+        )
+        context['is_group_member'] = (
+            user_role in organization.roles.MEMBER_ROLES
         )
-        context['is_group_member'] = org_user_obj is not None
-        context['user_is_admin'] = context[
-            'is_group_member'
-        ] and org_user_obj.role in (2, 3)
+        context['user_is_admin'] = user_role in organization.roles.ADMIN_ROLES
         return context
 
 
@@ -60,7 +59,8 @@ class OrganizationListView(core.views.ElasticSearchListView):
     paginate_by = 5
     context_object_name = 'organizations'
     document_class = organization.documents.OrganizationDocument
-    search_fields = ['name', 'description']
+    search_fields = ['name^2', 'description']
+    suggest_url = 'organization:suggest'
 
     def get_default_queryset(self) -> django.db.models.QuerySet:
         return (
@@ -71,6 +71,18 @@ class OrganizationListView(core.views.ElasticSearchListView):
             .order_by('-count_users')
         )
 
+    def get_search_queryset(self) -> django.db.models.QuerySet:
+        return (
+            organization.models.Organization.objects.get_only_useful_fields()
+        )
+
+
+class OrganizationSuggestView(core.views.ElasticSuggestView):
+    """подсказки названий организаций"""
+
+    document_class = organization.documents.OrganizationDocument
+    url_name = 'organization:profile'
+
 
 class OrganizationUsersView(
     organization.mixins.UserIsOrganizationMemberMixin,
@@ -115,22 +127,14 @@ class OrganizationUsersView(
             request.POST or None
         )
         if form.is_valid():
-            org_user_manager = organization.models.OrganizationToUser.objects
-            user_obj = (
-                org_user_manager.get_organization_admin(
-                    org_pk=pk, user_pk=request.user.pk
-                )
-                .select_related('organization')
-                .only('id', 'organization__id')
-                .first()
-            )
-
-            if user_obj:
+            if organization.roles.is_admin(
+                org_pk=pk, user_pk=request.user.pk, fresh=True
+            ):
                 try:
                     organization.models.OrganizationToUser.objects.create(
                         user=form.cleaned_data['user_obj'],
                         role=0,
-                        organization=user_obj.organization,
+                        organization_id=pk,
                     )
                     django.contrib.messages.success(
                         request, 'Приглашение отправлено'
@@ -153,6 +157,8 @@ class JoinOrganizationView(
 ):
     """юзер присоединяется к публичной орге"""
 
+    role_from_db = True
+
     def get(
         self, request: django.http.HttpRequest, pk: int
     ) -> django.http.HttpResponsePermanentRedirect:
@@ -197,7 +203,7 @@ class OrganizationQuizzesView(
 
 class ActionWithUserView(django.views.generic.View):
     """
-    получаем модель organizationtouser
+    получаем роли в организации
     того кто спрашивает
     и того о ком спрашивают
     """
@@ -205,19 +211,24 @@ class ActionWithUserView(django.views.generic.View):
     def get(
         self, request: django.http.HttpRequest, pk: int, user_pk: int
     ) -> None:
-        org_user_manager = organization.models.OrganizationToUser.objects
-        self.self_user = (
-            org_user_manager.get_organization_member_or_invited(
-                org_pk=pk, user_pk=self.request.user.pk
-            )
-            .only('role')
-            .first()
+        # роли для изменения участников - из базы, без кеша
+        self.self_role = organization.roles.get_user_role(
+            org_pk=pk, user_pk=self.request.user.pk, fresh=True
+        )
+        self.target_role = organization.roles.get_user_role(
+            org_pk=pk, user_pk=user_pk, fresh=True
         )
-        self.target_user = (
+
+    def get_target_user(
+        self, pk: int, user_pk: int
+    ) -> organization.models.OrganizationToUser:
+        """модель organizationtouser того, о ком спрашивают"""
+        org_user_manager = organization.models.OrganizationToUser.objects
+        return (
             org_user_manager.get_organization_member_or_invited(
                 org_pk=pk, user_pk=user_pk
             )
-            .only('role')
+            .only('role', 'organization_id')
             .first()
         )
 
@@ -235,16 +246,19 @@ class DeleteUserFromOrganizationView(ActionWithUserView):
         либо пользователь выходит из организации сам
         """
         super().get(request, pk, user_pk)
+        target_user = None
         if (
-            self.self_user
-            and self.target_user
+            self.self_role is not None
+            and self.target_role is not None
             and (
-                self.self_user.role > self.target_user.role
-                and self.self_user.role != 1
+                self.self_role > self.target_role
+                and self.self_role != 1
                 or self.request.user.pk == user_pk
             )
         ):
-            self.target_user.delete()
+            target_user = self.get_target_user(pk, user_pk)
+        if target_user:
+            target_user.delete()
             django.contrib.messages.success(request, 'Успешно')
         else:
             django.contrib.messages.error(request, 'Ошибка')
@@ -269,18 +283,21 @@ class UpdateUserOrganizationRoleView(ActionWithUserView):
         обновляющий статус должен быть выше по роли
         или пользователь принимает приглашение (с 0 до 1)
         """
+        target_user = None
         if (
             new_role in (1, 2)
-            and self.self_user
-            and self.target_user
+            and self.self_role is not None
+            and self.target_role is not None
             and (
-                self.self_user.role > self.target_user.role
+                self.self_role > self.target_role
                 or self.request.user.pk == user_pk
                 and new_role == 1
             )
         ):
-            self.target_user.role = new_role
-            self.target_user.save()
+            target_user = self.get_target_user(pk, user_pk)
+        if target_user:
+            target_user.role = new_role
+            target_user.save()
             django.contrib.messages.success(request, 'Успешно')
         else:
             django.contrib.messages.error(request, 'Ошибка')
@@ -331,10 +348,10 @@ class PostCommentsView(
         )
         if context['post'] is None:
             raise django.http.Http404()
-        total_views = core.redis_rervices.redis_connection.incr(
+        # пока redis недоступен, просмотры копятся в памяти процесса
+        context['total_views'] = core.redis_rervices.incr_buffered(
             f'organization_post:{self.kwargs["post_pk"]}:total_views'
         )
-        context['total_views'] = total_views
         return context
 
     def get_queryset(self) -> django.db.models.QuerySet:
@@ -465,6 +482,13 @@ class QuizCreateView(
             quiz_obj.save()
             quiz.models.Question.objects.bulk_create(question_objects)
             quiz.models.Variant.objects.bulk_create(variants_objects)
+            quiz.tasks.warm_up_answer_key.apply_async(
+                args=(quiz_obj.pk,),
+                eta=quiz_obj.start_time
+                - django.utils.timezone.timedelta(
+                    seconds=django.conf.settings.QUIZ_ANSWER_KEY_WARM_UP_LEAD
+                ),
+            )
 
             message_text = 'Викторина отправлена на модерацию'
             if quiz_obj.is_published:
@@ -501,16 +525,12 @@ class CreatePostView(
         """
         form = self.form_class(request.POST or None)
         if form.is_valid():
-            org_user_manager = organization.models.OrganizationToUser.objects
-            user_obj = django.shortcuts.get_object_or_404(
-                org_user_manager.get_organization_admin(
-                    org_pk=pk, user_pk=request.user.pk
-                )
-                .select_related('organization')
-                .only('id', 'organization__id')
-            )
+            if not organization.roles.is_admin(
+                org_pk=pk, user_pk=request.user.pk, fresh=True
+            ):
+                raise django.http.Http404()
             post_obj = form.save(commit=False)
-            post_obj.posted_by = user_obj.organization
+            post_obj.posted_by_id = pk
             post_obj.save()
             return django.shortcuts.redirect(self.get_success_url())
         context = self.get_context_data()
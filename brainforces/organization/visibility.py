@@ -0,0 +1,173 @@
+import typing
+
+import django.apps
+import django.apps.registry
+import django.db.models
+
+import organization.roles
+
+
+class Visibility(django.db.models.IntegerChoices):
+    """
+    кому видна викторина или пост: выводится из флагов записи
+    и флагов ее организации, чтобы списки не join-или организации
+    """
+
+    HIDDEN = 0, 'Никому'
+    MEMBERS = 1, 'Участникам организации'
+    PUBLIC = 2, 'Всем'
+
+
+# записи организаций с видимостью:
+# модель, поле организации, условия "скрыта" и "приватна"
+VISIBILITY_MODELS = (
+    (
+        'quiz.Quiz',
+        'organized_by',
+        django.db.models.Q(is_published=False),
+        django.db.models.Q(is_private=True),
+    ),
+    (
+        'organization.OrganizationPost',
+        'posted_by',
+        None,
+        django.db.models.Q(is_private=True),
+    ),
+)
+
+
+def get_visibility(
+    organization_pk: typing.Optional[int], is_hidden: bool, is_private: bool
+) -> int:
+    """видимость записи по ее флагам и флагам организации"""
+    organization_model = django.apps.apps.get_model(
+        'organization', 'Organization'
+    )
+    flags = (
+        organization_model.objects.filter(pk=organization_pk)
+        .values('is_active', 'is_private')
+        .first()
+    )
+    if flags is None or not flags['is_active'] or is_hidden:
+        return Visibility.HIDDEN
+    if flags['is_private'] or is_private:
+        return Visibility.MEMBERS
+    return Visibility.PUBLIC
+
+
+def save_visibility(
+    instance: django.db.models.Model,
+    update_fields: typing.Optional[typing.Iterable],
+) -> None:
+    """
+    при save(update_fields=...) без visibility видимость,
+    пересчитанная в pre_save, не записалась - дописываем ее
+    """
+    if update_fields is not None and 'visibility' not in update_fields:
+        instance.__class__._default_manager.filter(pk=instance.pk).update(
+            visibility=instance.visibility
+        )
+
+
+def get_visibility_expression(
+    is_active: bool,
+    is_private: bool,
+    hidden: typing.Optional[django.db.models.Q],
+    private: django.db.models.Q,
+) -> django.db.models.Case:
+    """видимость записей организации с флагами is_active и is_private"""
+    whens = list()
+    default = Visibility.PUBLIC
+    if not is_active:
+        default = Visibility.HIDDEN
+    elif is_private:
+        default = Visibility.MEMBERS
+    if is_active and hidden is not None:
+        whens.append(
+            django.db.models.When(hidden, then=Visibility.HIDDEN.value)
+        )
+    if is_active and not is_private:
+        whens.append(
+            django.db.models.When(private, then=Visibility.MEMBERS.value)
+        )
+    return django.db.models.Case(
+        *whens,
+        default=django.db.models.Value(default.value),
+        output_field=django.db.models.PositiveSmallIntegerField(),
+    )
+
+
+def update_organization_visibility(
+    organizations: django.db.models.QuerySet,
+    apps: django.apps.registry.Apps = django.apps.apps,
+) -> int:
+    """
+    пересчитываем видимость викторин и постов организаций
+    организации группируются по флагам, поэтому на каждую модель
+    не больше четырех update, а не по запросу на организацию;
+    записи, видимость которых не изменилась, не перезаписываются
+    apps - реестр моделей (в миграциях - исторический)
+    возвращаем количество обновленных записей
+    """
+    groups = dict()
+    for organization_pk, is_active, is_private in organizations.values_list(
+        'pk', 'is_active', 'is_private'
+    ):
+        groups.setdefault((is_active, is_private), list()).append(
+            organization_pk
+        )
+    updated = 0
+    for label, organization_field, hidden, private in VISIBILITY_MODELS:
+        model = apps.get_model(label)
+        for (is_active, is_private), organization_pks in groups.items():
+            visibility = get_visibility_expression(
+                is_active, is_private, hidden, private
+            )
+            updated += (
+                model._default_manager.filter(
+                    **{f'{organization_field}__in': organization_pks}
+                )
+                .exclude(visibility=visibility)
+                .update(visibility=visibility)
+            )
+    return updated
+
+
+def get_membership_exists(
+    organization_field: str, user_pk: int
+) -> django.db.models.Exists:
+    """
+    пользователь - участник организации из поля organization_field
+    коррелированный подзапрос по индексу (user, organization):
+    в отличие от join по участникам не размножает строки,
+    поэтому distinct не нужен
+    """
+    # модели организации импортируют менеджеры, а менеджеры - этот модуль
+    membership_model = django.apps.apps.get_model(
+        'organization', 'OrganizationToUser'
+    )
+    return django.db.models.Exists(
+        membership_model.objects.filter(
+            organization=django.db.models.OuterRef(organization_field),
+            user_id=user_pk,
+            role__in=organization.roles.MEMBER_ROLES,
+        )
+    )
+
+
+def filter_visible(
+    queryset: django.db.models.QuerySet,
+    public: django.db.models.Q,
+    organization_field: str,
+    user_pk: typing.Optional[int],
+) -> django.db.models.QuerySet:
+    """
+    записи, которые видит пользователь:
+    публичные (public) или из организации, в которой он участник
+    аноним видит только публичные
+    """
+    if user_pk is None:
+        return queryset.filter(public)
+    return queryset.alias(
+        is_member=get_membership_exists(organization_field, user_pk)
+    ).filter(public | django.db.models.Q(is_member=True))
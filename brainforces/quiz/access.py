@@ -0,0 +1,133 @@
+import django.db.models
+import django.http
+import django.shortcuts
+import django.utils.timezone
+
+import organization.models
+import organization.visibility
+import quiz.models
+
+
+class QuizAccessContext:
+    """
+    права пользователя в викторине:
+    статус викторины, регистрация, членство в организации
+    и является ли пользователь создателем
+    все считается одним запросом к базе
+    """
+
+    def __init__(
+        self, quiz_obj: quiz.models.Quiz, user_pk: int = None
+    ) -> None:
+        self.quiz = quiz_obj
+        self.status = quiz_obj.get_quiz_status()
+        self.is_registered = quiz_obj.is_registered
+        self.is_organization_member = quiz_obj.is_organization_member
+        self.is_creator = (
+            user_pk is not None and quiz_obj.creator_id == user_pk
+        )
+
+    @property
+    def can_access_quiz(self) -> bool:
+        """
+        может ли пользователь зайти в викторину
+        она не приватная, пользователь ее создатель
+        или участник проводящей организации
+        """
+        return (
+            not self.quiz.is_private
+            or self.is_creator
+            or self.is_organization_member
+        )
+
+    @property
+    def can_access_questions(self) -> bool:
+        """
+        может ли пользователь решать вопросы
+        до начала - нет, во время - только зарегистрированный,
+        после окончания - если есть доступ к викторине
+        """
+        if self.status == 1:
+            return False
+        if self.status == 2:
+            return self.is_registered
+        return self.can_access_quiz
+
+    @property
+    def end_time(self) -> django.utils.timezone.datetime:
+        """время окончания викторины"""
+        return self.quiz.end_time
+
+    def get_context(self) -> dict:
+        """контекст для шаблонов викторины"""
+        return {
+            'quiz': self.quiz,
+            'can_participate': self.is_registered,
+            'can_access_questions': self.can_access_questions,
+            'quiz_status': self.status,
+            'now_time': str(django.utils.timezone.now()),
+            'end_time': str(self.end_time),
+        }
+
+
+def get_quiz_with_access_queryset(user_pk: int) -> django.db.models.QuerySet:
+    """
+    викторины, видимые пользователю,
+    с пометками о регистрации и членстве в организации
+    приглашенный, но не вступивший, закрытые викторины не видит
+    """
+    return (
+        quiz.models.Quiz.objects.get_active_and_published_quizzes()
+        .select_related('creator', 'organized_by')
+        .annotate(
+            is_organization_member=(
+                organization.visibility.get_membership_exists(
+                    'organized_by', user_pk
+                )
+            ),
+            is_registered=django.db.models.Exists(
+                quiz.models.QuizResults.objects.filter(
+                    quiz_id=django.db.models.OuterRef('pk'), user_id=user_pk
+                )
+            ),
+        )
+        .filter(
+            django.db.models.Q(
+                visibility=organization.visibility.Visibility.PUBLIC
+            )
+            | django.db.models.Q(is_organization_member=True)
+        )
+        .only(
+            'name',
+            'description',
+            'start_time',
+            'duration',
+            'end_time',
+            'is_rated',
+            'is_private',
+            'is_ended',
+            'creator__username',
+            'organized_by__name',
+        )
+    )
+
+
+def get_quiz_access_context(
+    request: django.http.HttpRequest, quiz_pk: int
+) -> QuizAccessContext:
+    """
+    права пользователя в викторине
+    запоминаем на запросе, чтобы миксины и вью
+    не ходили в базу повторно
+    """
+    quiz_access_contexts = getattr(request, 'quiz_access_contexts', None)
+    if quiz_access_contexts is None:
+        quiz_access_contexts = request.quiz_access_contexts = dict()
+    if quiz_pk not in quiz_access_contexts:
+        quiz_obj = django.shortcuts.get_object_or_404(
+            get_quiz_with_access_queryset(request.user.pk), pk=quiz_pk
+        )
+        quiz_access_contexts[quiz_pk] = QuizAccessContext(
+            quiz_obj, request.user.pk
+        )
+    return quiz_access_contexts[quiz_pk]
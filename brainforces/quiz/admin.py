@@ -62,3 +62,26 @@ class QuizResultsAdmin(django.contrib.admin.ModelAdmin):
 
     list_display = ('id', 'user', 'quiz', 'place')
     list_display_links = ('id',)
+
+
+@django.contrib.admin.register(quiz.models.QuizFinalization)
+class QuizFinalizationAdmin(django.contrib.admin.ModelAdmin):
+    """отображение подведения итогов в админке"""
+
+    list_display = (
+        'id',
+        'quiz',
+        'finished_at',
+        'duration',
+        'places_updated',
+        'profiles_updated',
+    )
+    list_display_links = ('id',)
+
+
+@django.contrib.admin.register(quiz.models.RatingChange)
+class RatingChangeAdmin(django.contrib.admin.ModelAdmin):
+    """отображение истории рейтинга в админке"""
+
+    list_display = ('id', 'user', 'quiz', 'rating_before', 'rating_after')
+    list_display_links = ('id',)
@@ -0,0 +1,158 @@
+import json
+import time
+import typing
+
+import redis.exceptions
+
+import django.conf
+
+import core.local_cache
+import core.redis_rervices
+import quiz.models
+
+
+# ключи ответов викторин в памяти процесса, давно не нужные вытесняются
+# {quiz_pk: {'version': ..., 'questions': ..., 'checked_at': ...}}
+_local_answer_keys = core.local_cache.LocalCache(
+    'QUIZ_ANSWER_KEY_LOCAL_MAX_SIZE'
+)
+
+
+def get_version_key(quiz_pk: int) -> str:
+    """ключ версии ключа ответов викторины"""
+    return f'quiz:{quiz_pk}:answer_key:version'
+
+
+def get_payload_key(quiz_pk: int) -> str:
+    """ключ, по которому в redis лежит сам ключ ответов"""
+    return f'quiz:{quiz_pk}:answer_key'
+
+
+def load_answer_key(quiz_pk: int) -> typing.Dict[int, dict]:
+    """
+    собираем ключ ответов викторины из базы
+    {question_pk: {'variants': {pk верных вариантов}, 'difficulty': ...}}
+    """
+    questions = {
+        question_pk: {'variants': set(), 'difficulty': difficulty}
+        for question_pk, difficulty in quiz.models.Question.objects.filter(
+            quiz__pk=quiz_pk
+        ).values_list('pk', 'difficulty')
+    }
+    correct_variants = quiz.models.Variant.objects.filter(
+        question__quiz__pk=quiz_pk, is_correct=True
+    ).values_list('question_id', 'pk')
+    for question_pk, variant_pk in correct_variants:
+        questions[question_pk]['variants'].add(variant_pk)
+    return questions
+
+
+def _dump_answer_key(version: int, questions: dict) -> str:
+    """сериализуем ключ ответов для redis"""
+    return json.dumps(
+        {
+            'version': version,
+            'questions': {
+                question_pk: {
+                    'variants': list(question['variants']),
+                    'difficulty': question['difficulty'],
+                }
+                for question_pk, question in questions.items()
+            },
+        }
+    )
+
+
+def _load_dumped_answer_key(payload: bytes, version: int) -> dict:
+    """
+    десериализуем ключ ответов из redis
+    если он собран для другой версии - возвращаем None
+    """
+    data = json.loads(payload)
+    if data['version'] != version:
+        return None
+    return {
+        int(question_pk): {
+            'variants': set(question['variants']),
+            'difficulty': question['difficulty'],
+        }
+        for question_pk, question in data['questions'].items()
+    }
+
+
+def _get_shared_answer_key(quiz_pk: int) -> typing.Tuple[int, dict]:
+    """
+    ключ ответов из redis,
+    при отсутствии или устаревшей версии собираем его из базы
+    """
+    connection = core.redis_rervices.redis_connection
+    version, payload = connection.mget(
+        get_version_key(quiz_pk), get_payload_key(quiz_pk)
+    )
+    version = int(version or 0)
+    local_key = _local_answer_keys.get(quiz_pk)
+    if local_key and local_key['version'] == version:
+        return version, local_key['questions']
+    questions = None
+    if payload:
+        questions = _load_dumped_answer_key(payload, version)
+    if questions is None:
+        questions = load_answer_key(quiz_pk)
+        connection.set(
+            get_payload_key(quiz_pk),
+            _dump_answer_key(version, questions),
+            ex=django.conf.settings.QUIZ_ANSWER_KEY_REDIS_TTL,
+        )
+    return version, questions
+
+
+def get_answer_key(quiz_pk: int) -> typing.Dict[int, dict]:
+    """
+    ключ ответов викторины
+    сначала смотрим в память процесса, версию в redis
+    сверяем не чаще, чем раз в QUIZ_ANSWER_KEY_LOCAL_TTL секунд
+    """
+    now = time.monotonic()
+    local_key = _local_answer_keys.get(quiz_pk)
+    if (
+        local_key
+        and now - local_key['checked_at']
+        < django.conf.settings.QUIZ_ANSWER_KEY_LOCAL_TTL
+    ):
+        return local_key['questions']
+    try:
+        version, questions = _get_shared_answer_key(quiz_pk)
+    except redis.exceptions.RedisError:
+        return load_answer_key(quiz_pk)
+    _local_answer_keys.set(
+        quiz_pk,
+        {'version': version, 'questions': questions, 'checked_at': now},
+    )
+    return questions
+
+
+def check_answer(
+    answer_key: typing.Dict[int, dict], question_pk: int, variant_pk: str
+) -> bool:
+    """верный ли вариант ответа на вопрос"""
+    try:
+        variant_pk = int(variant_pk)
+    except (TypeError, ValueError):
+        return False
+    question = answer_key.get(question_pk)
+    return question is not None and variant_pk in question['variants']
+
+
+def invalidate_answer_key(quiz_pk: int) -> None:
+    """вопросы или варианты изменились - повышаем версию ключа"""
+    _local_answer_keys.pop(quiz_pk)
+    try:
+        core.redis_rervices.redis_connection.incr(get_version_key(quiz_pk))
+    except redis.exceptions.RedisError:
+        pass
+
+
+def warm_up_answer_key(quiz_pk: int) -> None:
+    """заранее собираем ключ ответов, чтобы старт не ждал базу"""
+    _local_answer_keys.pop(quiz_pk)
+    get_answer_key(quiz_pk)
@@ -0,0 +1,368 @@
+import collections
+import itertools
+import json
+import typing
+
+import redis.exceptions
+
+import django.conf
+import django.db
+import django.db.models
+import django.utils.dateparse
+import django.utils.timezone
+
+import core.redis_rervices
+import quiz.models
+import quiz.standings
+import quiz.tasks
+import users.models
+
+
+STREAM_KEY = 'quiz_answers:stream'
+GROUP_NAME = 'quiz_answers:flushers'
+CONSUMER_NAME = 'flusher'
+FLUSH_LOCK_KEY = 'quiz_answers:flush_lock'
+FLUSH_SCHEDULED_KEY = 'quiz_answers:flush_scheduled'
+
+
+def get_answered_questions_key(quiz_pk: int, user_pk: int) -> str:
+    """ключ множества вопросов, на которые пользователь уже ответил"""
+    return f'quiz:{quiz_pk}:user:{user_pk}:answered_questions'
+
+
+def get_pending_answers_key(quiz_pk: int, user_pk: int) -> str:
+    """ключ хеша с ответами пользователя, еще не записанными в базу"""
+    return f'quiz:{quiz_pk}:user:{user_pk}:pending_answers'
+
+
+# отметка об ответе, запись в поток и в хеш невыгруженных ответов
+# выполняются атомарно: ответ не может остаться отмеченным,
+# но не попавшим в поток
+# KEYS: отвеченные вопросы, невыгруженные ответы, поток
+# ARGV: вопрос, срок жизни ключей, невыгруженный ответ, поля записи потока
+PUSH_ANSWER_SCRIPT = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('XADD', KEYS[3], '*', unpack(ARGV, 4))
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('EXPIREAT', KEYS[1], ARGV[2])
+redis.call('EXPIREAT', KEYS[2], ARGV[2])
+return 1
+"""
+
+push_answer_script = core.redis_rervices.redis_connection.register_script(
+    PUSH_ANSWER_SCRIPT
+)
+
+
+def push_answer(
+    quiz_obj: quiz.models.Quiz,
+    question_pk: int,
+    user_pk: int,
+    is_correct: bool,
+    rating: int,
+) -> bool:
+    """
+    кладем ответ пользователя в поток redis
+    вместо синхронной записи в базу
+    rating - на сколько вырастет рейтинг при верном ответе
+    во время викторины на вопрос можно ответить один раз,
+    поэтому повторный ответ не попадает в поток и возвращается False
+    при ошибке redis отметку об ответе снимаем и пробрасываем ошибку,
+    чтобы ответ записался в базу синхронно; если скрипт все же
+    выполнился, повтор отбросит выгрузка (flush_answers)
+    """
+    answered_key = get_answered_questions_key(quiz_obj.pk, user_pk)
+    time_answered = django.utils.timezone.now()
+    entry = {
+        'quiz_id': quiz_obj.pk,
+        'user_id': user_pk,
+        'question_id': question_pk,
+        'is_correct': int(is_correct),
+        'rating': rating if is_correct else 0,
+        'time_answered': time_answered.isoformat(),
+    }
+    expire_at = quiz_obj.start_time + django.utils.timezone.timedelta(
+        minutes=quiz_obj.duration, days=1
+    )
+    pending_answer = json.dumps(
+        {'is_correct': is_correct, 'time_answered': entry['time_answered']}
+    )
+    try:
+        is_pushed = push_answer_script(
+            keys=[
+                answered_key,
+                get_pending_answers_key(quiz_obj.pk, user_pk),
+                STREAM_KEY,
+            ],
+            args=[
+                question_pk,
+                int(expire_at.timestamp()),
+                pending_answer,
+                *itertools.chain.from_iterable(entry.items()),
+            ],
+        )
+        if is_pushed:
+            schedule_answers_flush()
+    except redis.exceptions.RedisError:
+        try:
+            core.redis_rervices.redis_connection.srem(
+                answered_key, question_pk
+            )
+        except redis.exceptions.RedisError:
+            pass
+        raise
+    return bool(is_pushed)
+
+
+def schedule_answers_flush() -> None:
+    """
+    ставим задачу на выгрузку потока в базу,
+    если она еще не поставлена
+    """
+    if core.redis_rervices.redis_connection.set(
+        FLUSH_SCHEDULED_KEY, 1, nx=True, ex=60
+    ):
+        quiz.tasks.flush_answers_stream.apply_async(countdown=1)
+
+
+def get_pending_answers(
+    quiz_pk: int, user_obj: users.models.User
+) -> typing.List[quiz.models.UserAnswer]:
+    """
+    ответы пользователя, которые еще не записаны в базу,
+    от новых к старым
+    """
+    pending_answers = core.redis_rervices.redis_connection.hgetall(
+        get_pending_answers_key(quiz_pk, user_obj.pk)
+    )
+    if not pending_answers:
+        return list()
+    question_objects = quiz.models.Question.objects.only('name').in_bulk(
+        [int(question_pk) for question_pk in pending_answers]
+    )
+    answers = list()
+    for question_pk, answer_data in pending_answers.items():
+        answer_data = json.loads(answer_data)
+        answers.append(
+            quiz.models.UserAnswer(
+                user=user_obj,
+                question=question_objects.get(int(question_pk)),
+                is_correct=answer_data['is_correct'],
+                time_answered=django.utils.dateparse.parse_datetime(
+                    answer_data['time_answered']
+                ),
+            )
+        )
+    return sorted(
+        answers, key=lambda answer: answer.time_answered, reverse=True
+    )
+
+
+def _create_group() -> None:
+    """создаем группу читателей потока, если ее еще нет"""
+    try:
+        core.redis_rervices.redis_connection.xgroup_create(
+            STREAM_KEY, GROUP_NAME, id='0', mkstream=True
+        )
+    except redis.exceptions.ResponseError as error:
+        if 'BUSYGROUP' not in str(error):
+            raise
+
+
+def _read_entries(batch_size: int, last_id: str) -> list:
+    """
+    читаем пачку записей из потока
+    last_id = '0' - прочитанные, но не подтвержденные записи
+    last_id = '>' - новые записи
+    """
+    response = core.redis_rervices.redis_connection.xreadgroup(
+        GROUP_NAME, CONSUMER_NAME, {STREAM_KEY: last_id}, count=batch_size
+    )
+    if not response:
+        return list()
+    return response[0][1]
+
+
+def _parse_entries(entries: list) -> typing.Tuple[list, dict]:
+    """
+    ответы из записей потока:
+    список (ответ, рейтинг за верный ответ)
+    и поля хешей невыгруженных ответов по ключам
+    """
+    answer_entries = list()
+    pending_fields = collections.defaultdict(list)
+    for _, fields in entries:
+        fields = {
+            key.decode(): value.decode() for key, value in fields.items()
+        }
+        quiz_pk, user_pk = int(fields['quiz_id']), int(fields['user_id'])
+        answer_entries.append(
+            (
+                quiz.models.UserAnswer(
+                    user_id=user_pk,
+                    question_id=int(fields['question_id']),
+                    quiz_id=quiz_pk,
+                    is_correct=fields['is_correct'] == '1',
+                    time_answered=django.utils.dateparse.parse_datetime(
+                        fields['time_answered']
+                    ),
+                ),
+                int(fields['rating']),
+            )
+        )
+        pending_fields[get_pending_answers_key(quiz_pk, user_pk)].append(
+            fields['question_id']
+        )
+    return answer_entries, pending_fields
+
+
+def _get_saved_answers(answer_objects: list) -> set:
+    """
+    ответы на вопросы пачки, уже записанные в базу во время
+    викторины: (пользователь, вопрос, время ответа)
+    во время викторины на вопрос отвечают один раз, но такой ответ
+    мог прийти синхронно (QUIZ_ANSWERS_WRITE_BEHIND переключили
+    или redis потерял отметки) или уже быть выгружен до падения
+    между коммитом и подтверждением записей в потоке
+    """
+    return set(
+        quiz.models.UserAnswer.objects.filter(
+            user_id__in={answer.user_id for answer in answer_objects},
+            question_id__in={answer.question_id for answer in answer_objects},
+            time_answered__lte=django.db.models.F('quiz__end_time'),
+        ).values_list('user_id', 'question_id', 'time_answered')
+    )
+
+
+def flush_answers(batch_size: int) -> int:
+    """
+    записываем пачку ответов из потока в базу
+    ответы создаются одним bulk_create,
+    результаты пользователей обновляются одним запросом
+    на пару (викторина, пользователь)
+    ответ на вопрос, на который в базе уже есть ответ (или который
+    повторяется в пачке), не создается и не засчитывается
+    возвращаем количество прочитанных записей
+    """
+    _create_group()
+    entries = _read_entries(batch_size, '0')
+    is_replay = bool(entries)
+    if not is_replay:
+        entries = _read_entries(batch_size, '>')
+    if not entries:
+        return 0
+    answer_entries, pending_fields = _parse_entries(entries)
+    solved_delta = collections.Counter()
+    results_delta = collections.defaultdict(lambda: [0, 0])
+    with django.db.transaction.atomic():
+        saved_answers = _get_saved_answers(
+            [answer_obj for answer_obj, _ in answer_entries]
+        )
+        answered = {
+            (user_pk, question_pk) for user_pk, question_pk, _ in saved_answers
+        }
+        answer_objects = list()
+        for answer_obj, rating in answer_entries:
+            participant = (answer_obj.quiz_id, answer_obj.user_id)
+            answer = (answer_obj.user_id, answer_obj.question_id)
+            if answer in answered:
+                # положение в redis обновляется после подтверждения,
+                # поэтому при повторе засчитываем в нем ответы,
+                # записанные из этой же записи потока
+                if (
+                    is_replay
+                    and answer_obj.is_correct
+                    and (*answer, answer_obj.time_answered) in saved_answers
+                ):
+                    solved_delta[participant] += 1
+                continue
+            answered.add(answer)
+            answer_objects.append(answer_obj)
+            if answer_obj.is_correct:
+                solved_delta[participant] += 1
+                results_delta[participant][0] += 1
+                results_delta[participant][1] += rating
+        quiz.models.UserAnswer.objects.bulk_create(answer_objects)
+        for (quiz_pk, user_pk), (solved, rating) in results_delta.items():
+            quiz.models.QuizResults.objects.filter(
+                quiz__pk=quiz_pk, user__pk=user_pk
+            ).update(
+                solved=django.db.models.F('solved') + solved,
+                rating_after=django.db.models.F('rating_after') + rating,
+            )
+
+    entry_ids = [entry_id for entry_id, _ in entries]
+    pipeline = core.redis_rervices.redis_connection.pipeline()
+    pipeline.xack(STREAM_KEY, GROUP_NAME, *entry_ids)
+    pipeline.xdel(STREAM_KEY, *entry_ids)
+    for pending_key, question_pks in pending_fields.items():
+        pipeline.hdel(pending_key, *question_pks)
+    pipeline.execute()
+    quiz.standings.add_solved_many(dict(solved_delta))
+    return len(entries)
+
+
+def flush_answers_stream(
+    blocking_timeout: typing.Optional[float] = None,
+) -> typing.Optional[int]:
+    """
+    выгружаем весь поток ответов в базу пачками
+    одновременно поток выгружает только один процесс
+    blocking_timeout - сколько секунд ждать процесс, который уже
+    выгружает поток, по умолчанию не ждем
+    задачи, не получившие блокировку, ничего не делают, поэтому
+    после ее снятия проверяем, не добавились ли записи после
+    последнего чтения, и ставим выгрузку снова
+    возвращаем количество записанных ответов
+    или None, если блокировку взять не удалось
+    """
+    connection = core.redis_rervices.redis_connection
+    connection.delete(FLUSH_SCHEDULED_KEY)
+    lock = connection.lock(FLUSH_LOCK_KEY, timeout=300)
+    if not lock.acquire(
+        blocking=blocking_timeout is not None,
+        blocking_timeout=blocking_timeout,
+    ):
+        return None
+    total = 0
+    try:
+        batch_size = django.conf.settings.QUIZ_ANSWERS_STREAM_BATCH_SIZE
+        flushed = flush_answers(batch_size)
+        while flushed:
+            total += flushed
+            flushed = flush_answers(batch_size)
+    finally:
+        lock.release()
+    # выгруженные записи удаляются из потока
+    if connection.xlen(STREAM_KEY):
+        schedule_answers_flush()
+    return total
+
+
+def has_quiz_entries(quiz_pk: int) -> bool:
+    """
+    есть ли в потоке ответы викторины
+    выгруженные записи удаляются, поэтому поток короткий
+    """
+    quiz_id = str(quiz_pk).encode()
+    return any(
+        fields.get(b'quiz_id') == quiz_id
+        for _, fields in core.redis_rervices.redis_connection.xrange(
+            STREAM_KEY
+        )
+    )
+
+
+def flush_quiz_answers(quiz_pk: int) -> bool:
+    """
+    выгружаем поток перед подведением итогов викторины:
+    ждем процесс, который уже выгружает поток,
+    не дольше QUIZ_ANSWERS_FLUSH_WAIT секунд
+    True - все ответы викторины записаны в базу
+    """
+    flushed = flush_answers_stream(
+        blocking_timeout=django.conf.settings.QUIZ_ANSWERS_FLUSH_WAIT
+    )
+    return flushed is not None and not has_quiz_entries(quiz_pk)
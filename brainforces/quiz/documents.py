@@ -1,22 +1,93 @@
+import typing
+
 import django_elasticsearch_dsl
 import django_elasticsearch_dsl.fields
 import django_elasticsearch_dsl.registries
+import elasticsearch_dsl
+
+import django.db.models
 
+import core.elastic_services
+import core.facets
+import organization.documents
+import organization.models
+import quiz.managers
 import quiz.models
 
 
+# фасеты списка викторин: счетчики приходят агрегациями elastic
+# в одном ответе с найденными викторинами, статус считается от now
+FACETS = {
+    'organization': core.facets.TermsFacet(
+        'Организация', 'organized_by.id', label_field='organized_by.name'
+    ),
+    'status': core.facets.FiltersFacet(
+        'Статус',
+        {
+            'upcoming': core.facets.FacetOption(
+                'Не начата',
+                elasticsearch_dsl.Q('range', start_time={'gt': 'now'}),
+                lambda: quiz.managers.get_status_filters()[
+                    quiz.managers.UPCOMING
+                ],
+            ),
+            'running': core.facets.FacetOption(
+                'Идет',
+                elasticsearch_dsl.Q('range', start_time={'lte': 'now'})
+                & elasticsearch_dsl.Q('range', end_time={'gt': 'now'}),
+                lambda: quiz.managers.get_status_filters()[
+                    quiz.managers.RUNNING
+                ],
+            ),
+            'finished': core.facets.FacetOption(
+                'Закончена',
+                elasticsearch_dsl.Q('range', end_time={'lte': 'now'}),
+                lambda: quiz.managers.get_status_filters()[
+                    quiz.managers.FINISHED
+                ],
+            ),
+        },
+    ),
+    'rated': core.facets.TermsFacet(
+        'Рейтинговая',
+        'is_rated',
+        labels={'true': 'Рейтинговые', 'false': 'Без рейтинга'},
+    ),
+    'private': core.facets.TermsFacet(
+        'Доступ',
+        'is_private',
+        labels={'false': 'Открытые', 'true': 'Приватные'},
+    ),
+}
+
+
 @django_elasticsearch_dsl.registries.registry.register_document
 class QuizDocument(django_elasticsearch_dsl.Document):
     """документ elasticsearch для модели Quiz"""
 
-    description = django_elasticsearch_dsl.fields.TextField(
+    description = core.elastic_services.make_text_field(
         attr='description_to_string_for_elastic'
     )
-    organized_by = django_elasticsearch_dsl.fields.ObjectField(
-        properties={
-            'id': django_elasticsearch_dsl.fields.IntegerField(),
-            'name': django_elasticsearch_dsl.fields.TextField(),
-        }
+    name = core.elastic_services.make_name_field()
+    organized_by = organization.documents.get_organization_field()
+    member_ids = django_elasticsearch_dsl.fields.IntegerField(multi=True)
+
+    # условия доступа для core.elastic_services.make_access_query
+    access_required_fields = {
+        'is_published': True,
+        'organized_by.is_active': True,
+    }
+    access_public_fields = {
+        'organized_by.is_private': False,
+        'is_private': False,
+    }
+    # участники этой организации видят приватные викторины
+    access_organization_field = 'organized_by'
+    # порядок без поискового запроса, как у списка викторин
+    default_sort = ('-start_time', '-id')
+    # участники организаций пачки для member_ids (core.search_index)
+    indexing_prefetch = (
+        organization.documents.get_members_prefetch('organized_by__users'),
     )
 
     class Index:
@@ -25,4 +96,38 @@ class QuizDocument(django_elasticsearch_dsl.Document):
 
     class Django:
         model = quiz.models.Quiz
-        fields = ('name',)
+        fields = (
+            'id',
+            'is_private',
+            'is_published',
+            'is_rated',
+            'start_time',
+            'end_time',
+        )
+        related_models = (
+            organization.models.Organization,
+            organization.models.OrganizationToUser,
+        )
+
+    def get_queryset(self) -> django.db.models.QuerySet:
+        return super().get_queryset().select_related('organized_by')
+
+    def prepare_member_ids_with_related(
+        self,
+        instance: quiz.models.Quiz,
+        related_to_ignore: typing.Optional[django.db.models.Model] = None,
+    ) -> typing.List[int]:
+        return organization.documents.get_member_ids(
+            instance.organized_by, related_to_ignore
+        )
+
+    def get_instances_from_related(
+        self, related_instance: django.db.models.Model
+    ) -> django.db.models.QuerySet:
+        """
+        организация или ее участники изменились -
+        переиндексируем викторины организации
+        """
+        if isinstance(related_instance, organization.models.Organization):
+            return related_instance.quizzes.all()
+        return related_instance.organization.quizzes.all()
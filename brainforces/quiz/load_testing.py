@@ -0,0 +1,240 @@
+import concurrent.futures
+import dataclasses
+import random
+import time
+import typing
+import uuid
+
+import numpy
+
+import django.conf
+import django.db
+import django.test
+import django.test.utils
+import django.urls
+import django.utils.timezone
+
+import organization.models
+import quiz.answer_keys
+import quiz.models
+import users.models
+
+
+# REMOTE_ADDR не из INTERNAL_IPS, чтобы debug toolbar не влиял на замеры
+CLIENT_REMOTE_ADDR = '192.0.2.1'
+
+
+@dataclasses.dataclass
+class LoadTestQuiz:
+    """викторина с синтетическими участниками для нагрузочного теста"""
+
+    quiz_pk: int
+    organization_pk: int
+    user_pks: typing.List[int]
+    # {pk вопроса: (pk верного варианта, pk неверного варианта)}
+    variants: typing.Dict[int, typing.Tuple[int, int]]
+
+
+@dataclasses.dataclass
+class RequestSample:
+    """замер одного запроса"""
+
+    view: str
+    latency: float
+    queries: int
+    status_code: int
+
+
+def seed_quiz(
+    participants: int, questions: int, batch_size: int = 1000
+) -> LoadTestQuiz:
+    """
+    создаем идущую викторину с вопросами
+    и пользователей, которые будут в ней участвовать
+    """
+    run_id = uuid.uuid4().hex[:8]
+    user_objects = users.models.User.objects.bulk_create(
+        (
+            users.models.User(
+                username=f'load_test_{run_id}_{index}',
+                email=f'load_test_{run_id}_{index}@brainforces.ru',
+            )
+            for index in range(participants)
+        ),
+        batch_size=batch_size,
+    )
+    users.models.Profile.objects.bulk_create(
+        (users.models.Profile(user=user_obj) for user_obj in user_objects),
+        batch_size=batch_size,
+    )
+    organization_obj = organization.models.Organization.objects.create(
+        name=f'load test {run_id}', description='load test', is_active=True
+    )
+    quiz_obj = quiz.models.Quiz.objects.create(
+        name=f'load test {run_id}',
+        description='load test',
+        organized_by=organization_obj,
+        creator=user_objects[0],
+        start_time=django.utils.timezone.now(),
+        duration=60,
+    )
+    question_objects = quiz.models.Question.objects.bulk_create(
+        quiz.models.Question(
+            name=f'question {index}',
+            text='load test',
+            quiz=quiz_obj,
+            difficulty=random.randint(1, 10),
+        )
+        for index in range(questions)
+    )
+    variant_objects = quiz.models.Variant.objects.bulk_create(
+        quiz.models.Variant(
+            text=str(is_correct), question=question_obj, is_correct=is_correct
+        )
+        for question_obj in question_objects
+        for is_correct in (True, False)
+    )
+    # bulk_create не отправляет сигналы, поэтому сбрасываем ключ ответов сами
+    quiz.answer_keys.invalidate_answer_key(quiz_obj.pk)
+    return LoadTestQuiz(
+        quiz_pk=quiz_obj.pk,
+        organization_pk=organization_obj.pk,
+        user_pks=[user_obj.pk for user_obj in user_objects],
+        variants={
+            question_obj.pk: (
+                variant_objects[index * 2].pk,
+                variant_objects[index * 2 + 1].pk,
+            )
+            for index, question_obj in enumerate(question_objects)
+        },
+    )
+
+
+def cleanup(load_test_quiz: LoadTestQuiz) -> None:
+    """удаляем все, что создал нагрузочный тест"""
+    quiz.models.Quiz.objects.filter(pk=load_test_quiz.quiz_pk).delete()
+    organization.models.Organization.objects.filter(
+        pk=load_test_quiz.organization_pk
+    ).delete()
+    users.models.User.objects.filter(pk__in=load_test_quiz.user_pks).delete()
+
+
+def get_client_kwargs() -> dict:
+    """заголовки клиента, с которыми запрос пройдет проверку хоста"""
+    kwargs = {'REMOTE_ADDR': CLIENT_REMOTE_ADDR}
+    allowed_hosts = django.conf.settings.ALLOWED_HOSTS
+    if allowed_hosts and '*' not in allowed_hosts:
+        kwargs['HTTP_HOST'] = allowed_hosts[0].lstrip('.')
+    return kwargs
+
+
+def measure(view: str, request: typing.Callable[[], object]) -> RequestSample:
+    """выполняем запрос и замеряем время и количество sql запросов"""
+    with django.test.utils.CaptureQueriesContext(
+        django.db.connection
+    ) as queries:
+        start = time.perf_counter()
+        response = request()
+        latency = time.perf_counter() - start
+    return RequestSample(
+        view=view,
+        latency=latency,
+        queries=len(queries),
+        status_code=response.status_code,
+    )
+
+
+def run_participant(
+    load_test_quiz: LoadTestQuiz, user_pk: int
+) -> typing.List[RequestSample]:
+    """
+    сценарий участника в начале викторины:
+    регистрация, список вопросов, ответы на все вопросы, положение
+    """
+    client = django.test.Client(**get_client_kwargs())
+    client.force_login(users.models.User.objects.get(pk=user_pk))
+    quiz_pk = load_test_quiz.quiz_pk
+    samples = [
+        measure(
+            'register',
+            lambda: client.get(
+                django.urls.reverse('quiz:register', kwargs={'pk': quiz_pk})
+            ),
+        ),
+        measure(
+            'questions',
+            lambda: client.get(
+                django.urls.reverse('quiz:questions', kwargs={'pk': quiz_pk})
+            ),
+        ),
+    ]
+    for question_pk, variants in load_test_quiz.variants.items():
+        url = django.urls.reverse(
+            'quiz:question_detail',
+            kwargs={'pk': quiz_pk, 'question_pk': question_pk},
+        )
+        answer = random.choice(variants)
+        samples.append(
+            measure(
+                'answer',
+                lambda: client.post(url, data={'answer': answer}),
+            )
+        )
+    samples.append(
+        measure(
+            'standings',
+            lambda: client.get(
+                django.urls.reverse(
+                    'quiz:standings_list', kwargs={'pk': quiz_pk}
+                )
+            ),
+        )
+    )
+    django.db.connection.close()
+    return samples
+
+
+def summarize(samples: typing.List[RequestSample], elapsed: float) -> dict:
+    """перцентили задержки, пропускная способность и запросы к базе"""
+    latencies = numpy.array([sample.latency for sample in samples]) * 1000
+    p50, p95, p99 = numpy.percentile(latencies, (50, 95, 99))
+    return {
+        'requests': len(samples),
+        'errors': sum(sample.status_code >= 400 for sample in samples),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'throughput_rps': round(len(samples) / elapsed, 2),
+        'queries_per_request': round(
+            sum(sample.queries for sample in samples) / len(samples), 2
+        ),
+    }
+
+
+def run_burst(load_test_quiz: LoadTestQuiz, concurrency: int) -> dict:
+    """
+    все участники одновременно начинают викторину
+    возвращаем отчет по каждому представлению и по всем запросам
+    """
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        samples = [
+            sample
+            for participant_samples in executor.map(
+                lambda user_pk: run_participant(load_test_quiz, user_pk),
+                load_test_quiz.user_pks,
+            )
+            for sample in participant_samples
+        ]
+    elapsed = time.perf_counter() - start
+    views = dict()
+    for sample in samples:
+        views.setdefault(sample.view, list()).append(sample)
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'total': summarize(samples, elapsed),
+        'views': {
+            view: summarize(view_samples, elapsed)
+            for view, view_samples in views.items()
+        },
+    }
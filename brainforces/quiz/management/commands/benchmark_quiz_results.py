@@ -0,0 +1,100 @@
+import random
+import time
+
+import django.core.management.base
+import django.db
+import django.utils.timezone
+
+import quiz.models
+import quiz.services
+import users.models
+
+
+class Command(django.core.management.base.BaseCommand):
+    """
+    замеряем подведение итогов викторины
+    для разного количества участников
+    тестовые данные создаются в транзакции и откатываются,
+    статистику таблиц обновляем, чтобы план запросов был как на проде
+    """
+
+    help = 'Замер подведения итогов викторины'
+
+    def add_arguments(
+        self, parser: django.core.management.base.CommandParser
+    ) -> None:
+        parser.add_argument(
+            '--participants',
+            nargs='+',
+            type=int,
+            default=[1000, 10000, 100000],
+            help='количество участников викторины',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='размер пачки при создании тестовых данных',
+        )
+
+    def create_quiz(
+        self, participants: int, batch_size: int
+    ) -> quiz.models.Quiz:
+        """закончившаяся рейтинговая викторина с участниками"""
+        user_objects = users.models.User.objects.bulk_create(
+            (
+                users.models.User(
+                    username=f'benchmark_{index}',
+                    email=f'benchmark_{index}@brainforces.ru',
+                )
+                for index in range(participants)
+            ),
+            batch_size=batch_size,
+        )
+        users.models.Profile.objects.bulk_create(
+            (
+                users.models.Profile(user=user_obj, rating=100)
+                for user_obj in user_objects
+            ),
+            batch_size=batch_size,
+        )
+        quiz_obj = quiz.models.Quiz.objects.create(
+            name='benchmark',
+            description='benchmark',
+            start_time=django.utils.timezone.now()
+            - django.utils.timezone.timedelta(days=1),
+        )
+        solved_values = [random.randint(0, 50) for _ in user_objects]
+        quiz.models.QuizResults.objects.bulk_create(
+            (
+                quiz.models.QuizResults(
+                    quiz=quiz_obj,
+                    user=user_obj,
+                    solved=solved,
+                    rating_before=100,
+                    rating_after=100 + solved,
+                )
+                for user_obj, solved in zip(user_objects, solved_values)
+            ),
+            batch_size=batch_size,
+        )
+        with django.db.connection.cursor() as cursor:
+            for model in (users.models.Profile, quiz.models.QuizResults):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        return quiz_obj
+
+    def handle(self, *args, **options) -> None:
+        self.stdout.write('participants\tseconds\tplaces\tprofiles')
+        for participants in options['participants']:
+            with django.db.transaction.atomic():
+                quiz_obj = self.create_quiz(
+                    participants, options['batch_size']
+                )
+                start = time.perf_counter()
+                rows = quiz.services.make_quiz_results(quiz_obj.pk)
+                elapsed = time.perf_counter() - start
+                django.db.transaction.set_rollback(True)
+            self.stdout.write(
+                f'{participants}\t{elapsed:.3f}\t'
+                f'{rows["places_updated"]}\t{rows["profiles_updated"]}'
+            )
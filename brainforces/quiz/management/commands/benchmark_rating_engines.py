@@ -0,0 +1,93 @@
+import time
+import typing
+
+import numpy
+
+import django.core.management.base
+
+import quiz.ratings
+
+
+def naive_elo(
+    rating_before: list, solved: list, k_factor: int
+) -> typing.List[int]:
+    """рейтинг Эло попарным перебором участников на python"""
+    participants = len(rating_before)
+    rating_after = list()
+    for i in range(participants):
+        actual, expected = 0, 0
+        for j in range(participants):
+            if i == j:
+                continue
+            if solved[i] > solved[j]:
+                actual += 1
+            elif solved[i] == solved[j]:
+                actual += 0.5
+            expected += 1 / (
+                1 + 10 ** ((rating_before[j] - rating_before[i]) / 400)
+            )
+        delta = k_factor * (actual - expected) / (participants - 1)
+        rating_after.append(max(round(rating_before[i] + delta), 0))
+    return rating_after
+
+
+class Command(django.core.management.base.BaseCommand):
+    """
+    сравниваем движки рейтинга
+    на случайных участниках разного количества
+    """
+
+    help = 'Замер движков рейтинга'
+
+    def add_arguments(
+        self, parser: django.core.management.base.CommandParser
+    ) -> None:
+        parser.add_argument(
+            '--participants',
+            nargs='+',
+            type=int,
+            default=[1000, 10000, 50000],
+            help='количество участников викторины',
+        )
+        parser.add_argument(
+            '--naive-limit',
+            type=int,
+            default=5000,
+            help='до скольких участников замерять попарный перебор',
+        )
+
+    def measure(self, function: typing.Callable, *args) -> float:
+        """время выполнения функции в секундах"""
+        start = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options) -> None:
+        random_generator = numpy.random.default_rng(0)
+        elo_engine = quiz.ratings.EloRatingEngine()
+        additive_engine = quiz.ratings.AdditiveRatingEngine()
+        self.stdout.write('participants\tadditive\telo\tnaive elo')
+        for participants in options['participants']:
+            rating_before = random_generator.integers(0, 3000, participants)
+            solved = random_generator.integers(0, 50, participants)
+            rating_after = rating_before + solved
+            additive_time = self.measure(
+                additive_engine.compute, rating_before, solved, rating_after
+            )
+            elo_time = self.measure(
+                elo_engine.compute, rating_before, solved, rating_after
+            )
+            naive_time = '-'
+            if participants <= options['naive_limit']:
+                naive_time = '{:.3f}'.format(
+                    self.measure(
+                        naive_elo,
+                        rating_before.tolist(),
+                        solved.tolist(),
+                        elo_engine.k_factor,
+                    )
+                )
+            self.stdout.write(
+                f'{participants}\t{additive_time:.3f}\t'
+                f'{elo_time:.3f}\t{naive_time}'
+            )
@@ -0,0 +1,131 @@
+import time
+import typing
+
+import elasticsearch_dsl
+import numpy
+
+import django.core.management.base
+
+import core.elastic_services
+import core.search_index
+import quiz.documents
+import quiz.models
+import quiz.views
+
+
+def legacy_search(query_text: str, user_pk: typing.Optional[int]) -> list:
+    """
+    поиск, как он работал раньше: нечеткий multi_match
+    по name и description, пересечение с filter_user_access в базе
+    """
+    search = quiz.documents.QuizDocument.search().query(
+        elasticsearch_dsl.Q(
+            'multi_match',
+            query=query_text,
+            fields=['name', 'description'],
+            fuzziness='auto',
+        )
+    )
+    queryset = quiz.models.Quiz.objects.filter_user_access(
+        user_pk=user_pk
+    ).order_by('-id')
+    return list(
+        (queryset & search.to_queryset().distinct())[
+            : quiz.views.QuizListView.paginate_by
+        ]
+    )
+
+
+def scoped_search(
+    query_text: str, user_pk: typing.Optional[int], fields: list
+) -> list:
+    """
+    поиск по выбранным полям с весами без кеша,
+    доступ проверяет elastic
+    """
+    hit_ids = core.elastic_services.get_hit_ids(
+        document_class=quiz.documents.QuizDocument,
+        fields=fields,
+        query_text=query_text,
+        user_pk=user_pk,
+    )
+    return core.elastic_services.get_objects_in_order(
+        quiz.models.Quiz.objects.get_only_useful_list_fields(),
+        hit_ids[: quiz.views.QuizListView.paginate_by],
+    )
+
+
+class Command(django.core.management.base.BaseCommand):
+    """
+    сравниваем задержку поиска викторин:
+    прежний поиск и поиск по каждому варианту search_by,
+    и размер индексов поиска
+    нужны elastic с проиндексированными викторинами и база
+    """
+
+    help = 'Замер поиска викторин'
+
+    def add_arguments(
+        self, parser: django.core.management.base.CommandParser
+    ) -> None:
+        parser.add_argument(
+            '--queries',
+            nargs='+',
+            default=['викторина', 'математика', 'история'],
+            help='поисковые запросы',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='сколько раз выполнять каждый запрос',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            default=None,
+            help='pk пользователя, от имени которого ищем',
+        )
+
+    def measure(self, function: typing.Callable, *args) -> float:
+        """время выполнения функции в миллисекундах"""
+        start = time.perf_counter()
+        function(*args)
+        return (time.perf_counter() - start) * 1000
+
+    def report(self, name: str, latencies: list) -> None:
+        """средняя задержка и перцентили"""
+        p50, p95 = numpy.percentile(latencies, (50, 95))
+        self.stdout.write(
+            f'{name}\t{numpy.mean(latencies):.2f}\t{p50:.2f}\t{p95:.2f}'
+        )
+
+    def report_index_sizes(self) -> None:
+        """количество документов и размер каждого индекса на диске"""
+        self.stdout.write('index\tdocuments\tsize kb')
+        for document_class in core.search_index.get_documents():
+            alias = document_class._index._name
+            stats = document_class._get_connection().indices.stats(
+                index=alias, metric=['docs', 'store']
+            )['_all']['primaries']
+            self.stdout.write(
+                f'{alias}\t{stats["docs"]["count"]}'
+                f'\t{stats["store"]["size_in_bytes"] / 1024:.1f}'
+            )
+
+    def handle(self, *args, **options) -> None:
+        self.report_index_sizes()
+        modes = [('legacy', legacy_search, tuple())] + [
+            (name, scoped_search, (fields,))
+            for _, name, fields in quiz.views.QuizListView.search_by_choices
+        ]
+        self.stdout.write('mode\tmean ms\tp50 ms\tp95 ms')
+        for name, function, extra_args in modes:
+            latencies = [
+                self.measure(
+                    function, query_text, options['user'], *extra_args
+                )
+                for query_text in options['queries']
+                for _ in range(options['repeat'])
+            ]
+            self.report(name, latencies)
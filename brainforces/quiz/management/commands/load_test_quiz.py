@@ -0,0 +1,80 @@
+import json
+
+import django.conf
+import django.core.management.base
+import django.test
+import django.utils.timezone
+
+import quiz.load_testing
+
+
+class Command(django.core.management.base.BaseCommand):
+    """
+    нагрузочный тест начала викторины:
+    участники одновременно регистрируются, открывают вопросы,
+    отвечают на них и смотрят положение
+    нужны только postgres и redis, elasticsearch на время теста
+    не обновляется
+    """
+
+    help = 'Нагрузочный тест начала викторины, отчет в json'
+
+    def add_arguments(
+        self, parser: django.core.management.base.CommandParser
+    ) -> None:
+        parser.add_argument(
+            '--participants',
+            type=int,
+            default=100,
+            help='количество участников',
+        )
+        parser.add_argument(
+            '--questions',
+            type=int,
+            default=10,
+            help='количество вопросов',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='сколько участников отправляют запросы одновременно',
+        )
+        parser.add_argument(
+            '--output', help='файл для отчета, по умолчанию - stdout'
+        )
+        parser.add_argument(
+            '--keep-data',
+            action='store_true',
+            help='не удалять созданные данные после теста',
+        )
+
+    def handle(self, *args, **options) -> None:
+        started_at = django.utils.timezone.now()
+        with django.test.override_settings(ELASTICSEARCH_DSL_AUTOSYNC=False):
+            load_test_quiz = quiz.load_testing.seed_quiz(
+                options['participants'], options['questions']
+            )
+            try:
+                report = quiz.load_testing.run_burst(
+                    load_test_quiz, options['concurrency']
+                )
+            finally:
+                if not options['keep_data']:
+                    quiz.load_testing.cleanup(load_test_quiz)
+        report['config'] = {
+            'participants': options['participants'],
+            'questions': options['questions'],
+            'concurrency': options['concurrency'],
+            'quiz_answers_write_behind': (
+                django.conf.settings.QUIZ_ANSWERS_WRITE_BEHIND
+            ),
+            'quiz_live_standings': django.conf.settings.QUIZ_LIVE_STANDINGS,
+            'started_at': started_at.isoformat(),
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,86 @@
+import typing
+
+import django.core.management.base
+import django.db.models
+
+import quiz.models
+import quiz.services
+
+
+class Command(django.core.management.base.BaseCommand):
+    """
+    пересчитываем рейтинг пользователей,
+    начиная с выбранной викторины
+    викторины идут по порядку начала и читаются пачками,
+    в памяти - только результаты одной викторины
+    """
+
+    help = 'Пересчет рейтинга начиная с выбранной викторины'
+
+    def add_arguments(
+        self, parser: django.core.management.base.CommandParser
+    ) -> None:
+        parser.add_argument(
+            'quiz_pk', type=int, help='викторина, с которой начать пересчет'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='сколько викторин читать из базы за раз',
+        )
+
+    def get_rated_quizzes(
+        self, first_quiz: quiz.models.Quiz, chunk_size: int
+    ) -> typing.Iterator[quiz.models.Quiz]:
+        """
+        подведенные рейтинговые викторины, начиная с данной,
+        по порядку начала
+        """
+        queryset = (
+            quiz.models.Quiz.objects.filter(
+                is_ended=True,
+                is_rated=True,
+                is_private=False,
+                start_time__isnull=False,
+            )
+            .only('start_time')
+            .order_by('start_time', 'pk')
+        )
+        start_time, start_pk = first_quiz.start_time, first_quiz.pk
+        while True:
+            chunk = list(
+                queryset.filter(
+                    django.db.models.Q(start_time__gt=start_time)
+                    | django.db.models.Q(
+                        start_time=start_time, pk__gte=start_pk
+                    )
+                )[:chunk_size]
+            )
+            if not chunk:
+                return
+            yield from chunk
+            start_time, start_pk = chunk[-1].start_time, chunk[-1].pk + 1
+
+    def handle(self, *args, **options) -> None:
+        first_quiz = quiz.models.Quiz.objects.filter(
+            pk=options['quiz_pk'], start_time__isnull=False
+        ).first()
+        if first_quiz is None:
+            raise django.core.management.base.CommandError(
+                'Викторина не найдена'
+            )
+        quizzes_count, results_count = 0, 0
+        for quiz_obj in self.get_rated_quizzes(
+            first_quiz, options['chunk_size']
+        ):
+            results_count += quiz.services.recompute_quiz_ratings(quiz_obj)
+            quizzes_count += 1
+        profiles_count = quiz.services.update_profile_ratings_from_history(
+            first_quiz.start_time
+        )
+        self.stdout.write(
+            f'Викторин: {quizzes_count}, '
+            f'результатов: {results_count}, '
+            f'профилей: {profiles_count}'
+        )
@@ -1,15 +1,58 @@
+import datetime
+import typing
+
 import django.db.models
 import django.db.models.expressions
 import django.utils.timezone
 
+import organization.visibility
+
+
+# статусы викторины, как в Quiz.get_quiz_status
+UPCOMING = 1
+RUNNING = 2
+FINISHED = 3
+
+
+def get_status_filters(
+    now: typing.Optional[datetime.datetime] = None,
+) -> typing.Dict[int, django.db.models.Q]:
+    """
+    условия статусов по сохраненным start_time и end_time:
+    сравнения с константой, поэтому идут по индексам диапазоном
+    """
+    if now is None:
+        now = django.utils.timezone.now()
+    return {
+        UPCOMING: django.db.models.Q(start_time__gt=now),
+        RUNNING: django.db.models.Q(start_time__lte=now, end_time__gt=now),
+        FINISHED: django.db.models.Q(end_time__lte=now),
+    }
+
+
+def get_status_expression(
+    now: typing.Optional[datetime.datetime] = None,
+) -> django.db.models.Case:
+    """статус викторины выражением sql для аннотации списков"""
+    return django.db.models.Case(
+        *(
+            django.db.models.When(status_filter, then=status)
+            for status, status_filter in get_status_filters(now).items()
+        ),
+        output_field=django.db.models.PositiveSmallIntegerField(),
+    )
+
 
 class QuizManager(django.db.models.Manager):
     """менеджер модели Quiz"""
 
     def get_active_and_published_quizzes(self) -> None:
-        """получаем викторины, к=организации которых активные"""
+        """
+        получаем опубликованные викторины активных организаций
+        по денормализованной видимости, без join организации
+        """
         return self.get_queryset().filter(
-            organized_by__is_active=True, is_published=True
+            visibility__gt=organization.visibility.Visibility.HIDDEN
         )
 
     def get_only_useful_list_fields(self) -> django.db.models.QuerySet:
@@ -23,39 +66,66 @@ class QuizManager(django.db.models.Manager):
                 'creator__username',
                 'duration',
                 'start_time',
+                'end_time',
                 'organized_by__name',
                 'is_private',
                 'is_ended',
             )
+            .annotate(status=get_status_expression())
             .order_by('-start_time')
         )
 
+    def get_upcoming_quizzes(self) -> django.db.models.QuerySet:
+        """еще не начавшиеся викторины"""
+        return self.get_queryset().filter(get_status_filters()[UPCOMING])
+
+    def get_running_quizzes(self) -> django.db.models.QuerySet:
+        """идущие викторины"""
+        return self.get_queryset().filter(get_status_filters()[RUNNING])
+
+    def get_finished_quizzes(self) -> django.db.models.QuerySet:
+        """закончившиеся викторины"""
+        return self.get_queryset().filter(get_status_filters()[FINISHED])
+
+    def get_waiting_for_results(self) -> django.db.models.QuerySet:
+        """закончившиеся викторины без подведенных итогов"""
+        return (
+            self.get_queryset()
+            .filter(is_ended=False, end_time__lt=django.utils.timezone.now())
+            .order_by('start_time')
+        )
+
     def filter_user_access(
         self, user_pk: int, org_pk: int = -1
     ) -> django.db.models.QuerySet:
         """
         доступ пользователя к квизу
-        либо оргация не приватная,
-        либо пользователь ее участник
+        либо оргация и квиз не приватные,
+        либо пользователь участник организации
         """
-        posts_queryset = self.get_only_useful_list_fields().filter(
-            django.db.models.Q(organized_by__is_private=False)
-            & django.db.models.Q(is_private=False)
-            | django.db.models.Q(organized_by__users__user__pk=user_pk)
+        quizzes_queryset = organization.visibility.filter_visible(
+            self.get_only_useful_list_fields(),
+            django.db.models.Q(
+                visibility=organization.visibility.Visibility.PUBLIC
+            ),
+            'organized_by',
+            user_pk,
         )
         if org_pk != -1:
-            posts_queryset = posts_queryset.filter(organized_by__pk=org_pk)
-        return posts_queryset.distinct()
+            quizzes_queryset = quizzes_queryset.filter(organized_by__pk=org_pk)
+        return quizzes_queryset
 
 
 class UserAnswerManager(django.db.models.Manager):
     """менеджер модели UserAnswer"""
 
     def get_active_and_published_answers(self) -> django.db.models.QuerySet:
-        """ответы к опубликованным викторинам с активными организациями"""
+        """
+        ответы к опубликованным викторинам с активными организациями
+        по викторине ответа, без join вопроса
+        """
         return self.get_queryset().filter(
-            question__quiz__is_published=True,
-            question__quiz__organized_by__is_active=True,
+            quiz__visibility__gt=organization.visibility.Visibility.HIDDEN
         )
 
     def get_only_useful_list_fields(self) -> django.db.models.QuerySet:
@@ -81,7 +151,7 @@ class QuizResultsManager(django.db.models.Manager):
     ) -> django.db.models.QuerySet:
         """результаты с опубликованной викториной и активной оргой"""
         return self.get_queryset().filter(
-            quiz__is_published=True, quiz__organized_by__is_active=True
+            quiz__visibility__gt=organization.visibility.Visibility.HIDDEN
         )
 
     def get_only_useful_list_fields(self) -> django.db.models.QuerySet:
@@ -110,9 +180,7 @@ class QuestionManager(django.db.models.Manager):
     def get_visible_questions(self) -> django.db.models.QuerySet:
         """викторина закончена, квиз не приватный и опубликованный"""
         return self.get_queryset().filter(
-            quiz__start_time__lte=django.utils.timezone.now()
-            - django.utils.timezone.timedelta(minutes=1)
-            * django.db.models.F('quiz__duration'),
+            quiz__end_time__lte=django.utils.timezone.now(),
             quiz__is_private=False,
             quiz__is_published=True,
         )
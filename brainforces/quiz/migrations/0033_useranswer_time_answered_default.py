@@ -0,0 +1,19 @@
+# Generated by Django 3.2.16 on 2026-10-18 16:46
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0032_auto_20230705_2319'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useranswer',
+            name='time_answered',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, editable=False, help_text='Время, когда пользователь ответил на вопрос', null=True, verbose_name='время'),
+        ),
+    ]
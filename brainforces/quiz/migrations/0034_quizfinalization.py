@@ -0,0 +1,29 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0033_useranswer_time_answered_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizFinalization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('finished_at', models.DateTimeField(auto_now_add=True, help_text='Время подведения итогов', verbose_name='время')),
+                ('duration', models.FloatField(help_text='Сколько секунд подводились итоги', verbose_name='длительность')),
+                ('places_updated', models.PositiveIntegerField(help_text='Количество результатов, у которых изменилось место', verbose_name='обновлено мест')),
+                ('profiles_updated', models.PositiveIntegerField(help_text='Количество профилей, у которых изменился рейтинг', verbose_name='обновлено рейтингов')),
+                ('quiz', models.OneToOneField(help_text='Викторина, итоги которой подведены', on_delete=django.db.models.deletion.CASCADE, related_name='finalization', to='quiz.quiz', verbose_name='викторина')),
+            ],
+            options={
+                'verbose_name': 'подведение итогов',
+                'verbose_name_plural': 'подведения итогов',
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.16 on 2026-10-18 17:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0034_quizfinalization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quiz_start_time', models.DateTimeField(help_text='Время начала викторины', verbose_name='время викторины')),
+                ('rating_before', models.PositiveIntegerField(help_text='Рейтинг пользователя до викторины', verbose_name='рейтинг до')),
+                ('rating_after', models.PositiveIntegerField(help_text='Рейтинг пользователя после викторины', verbose_name='рейтинг после')),
+                ('quiz', models.ForeignKey(help_text='Викторина, после которой изменился рейтинг', on_delete=django.db.models.deletion.CASCADE, related_name='rating_changes', to='quiz.quiz', verbose_name='викторина')),
+                ('user', models.ForeignKey(help_text='Пользователь, у которого изменился рейтинг', on_delete=django.db.models.deletion.CASCADE, related_name='rating_changes', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'изменение рейтинга',
+                'verbose_name_plural': 'изменения рейтинга',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ratingchange',
+            index=models.Index(fields=['user', 'quiz_start_time'], name='rating_change_user_time_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ratingchange',
+            unique_together={('user', 'quiz')},
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO quiz_ratingchange
+                    (user_id, quiz_id, quiz_start_time,
+                     rating_before, rating_after)
+                SELECT results.user_id, results.quiz_id, quiz.start_time,
+                    results.rating_before, results.rating_after
+                FROM quiz_quizresults AS results
+                JOIN quiz_quiz AS quiz ON quiz.id = results.quiz_id
+                WHERE quiz.is_ended AND quiz.is_rated AND NOT quiz.is_private
+                    AND quiz.start_time IS NOT NULL
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.16 on 2026-10-18 18:21
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+import core.search_vectors
+import core.text_services
+
+
+def fill_search_vectors(apps, schema_editor):
+    """векторы уже созданных викторин"""
+    core.search_vectors.backfill_search_vectors(
+        apps.get_model('quiz', 'Quiz').objects.select_related('organized_by'),
+        lambda quiz_obj: [
+            (quiz_obj.name, core.search_vectors.NAME_WEIGHT),
+            (
+                quiz_obj.organized_by.name if quiz_obj.organized_by else '',
+                core.search_vectors.ORGANIZATION_WEIGHT,
+            ),
+            (
+                core.text_services.html_to_text(quiz_obj.description),
+                core.search_vectors.TEXT_WEIGHT,
+            ),
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organization', '0021_search_vector'),
+        ('quiz', '0035_ratingchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Название и текст для полнотекстового поиска postgres', null=True, verbose_name='поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='quiz_search_vector_idx'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
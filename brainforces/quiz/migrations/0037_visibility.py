@@ -0,0 +1,33 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+import organization.visibility
+
+
+def fill_visibility(apps, schema_editor):
+    """видимость уже созданных викторин и постов по флагам организаций"""
+    organization.visibility.update_organization_visibility(
+        apps.get_model('organization', 'Organization').objects.all(), apps
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organization', '0022_visibility'),
+        ('quiz', '0036_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='visibility',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Никому'), (1, 'Участникам организации'), (2, 'Всем')], default=0, editable=False, help_text='Кому видна викторина: по ее флагам и флагам организации', verbose_name='видимость'),
+        ),
+        migrations.RunPython(fill_visibility, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(condition=models.Q(('visibility__gt', 0)), fields=['-id'], name='quiz_visible_idx'),
+        ),
+    ]
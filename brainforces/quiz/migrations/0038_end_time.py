@@ -0,0 +1,42 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:22
+
+import datetime
+
+from django.db import migrations, models
+
+
+def fill_end_time(apps, schema_editor):
+    """время окончания уже созданных викторин одним update"""
+    apps.get_model('quiz', 'Quiz').objects.filter(
+        start_time__isnull=False
+    ).update(
+        end_time=models.ExpressionWrapper(
+            models.F('start_time')
+            + models.F('duration') * datetime.timedelta(minutes=1),
+            output_field=models.DateTimeField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0037_visibility'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='end_time',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Время начала плюс продолжительность, пересчитывается при сохранении', null=True, verbose_name='время окончания'),
+        ),
+        migrations.RunPython(fill_end_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['start_time'], name='quiz_start_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['end_time'], name='quiz_end_time_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:28
+
+import django.contrib.postgres.operations
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    # индекс на самой большой таблице строится без блокировки записи,
+    # а concurrently нельзя выполнять в транзакции;
+    # поле заполняет миграция 0041_user_answer_quiz_not_null
+    atomic = False
+
+    dependencies = [
+        ('quiz', '0038_end_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useranswer',
+            name='quiz',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, help_text='Викторина вопроса, на который дан ответ', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='quiz.quiz', verbose_name='викторина'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='useranswer',
+            index=models.Index(fields=['quiz', 'user', '-time_answered'], name='answer_quiz_user_time_idx'),
+        ),
+    ]
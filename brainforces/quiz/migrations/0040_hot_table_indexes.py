@@ -0,0 +1,109 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:34
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+from django.db import IntegrityError, migrations, models
+
+
+# повторы результатов не одинаковы: ответы обновляли только первую
+# попавшуюся строку (викторина, пользователь), поэтому оставляем ту,
+# в которой больше всего решено, затем с большим рейтингом после
+DELETE_DUPLICATE_RESULTS = """
+DELETE FROM quiz_quizresults
+WHERE id IN (
+    SELECT id FROM (
+        SELECT
+            id,
+            ROW_NUMBER() OVER (
+                PARTITION BY quiz_id, user_id
+                ORDER BY solved DESC, rating_after DESC, id
+            ) AS position
+        FROM quiz_quizresults
+    ) AS ranked
+    WHERE ranked.position > 1
+)
+"""
+
+DROP_RESULTS_UNIQUE_INDEX = (
+    'DROP INDEX CONCURRENTLY IF EXISTS quiz_results_quiz_user_uniq'
+)
+
+CREATE_RESULTS_UNIQUE_INDEX = (
+    'CREATE UNIQUE INDEX CONCURRENTLY quiz_results_quiz_user_uniq '
+    'ON quiz_quizresults (quiz_id, user_id)'
+)
+
+# сколько раз пробуем построить уникальный индекс
+UNIQUE_INDEX_ATTEMPTS = 5
+
+
+def create_results_unique_index(apps, schema_editor):
+    """
+    уникальный индекс строится без блокировки записи, поэтому
+    между удалением повторов и постройкой регистрация может
+    вставить новый повтор - тогда индекс остается недостроенным:
+    удаляем его, снова убираем повторы и строим заново
+    """
+    for attempt in range(UNIQUE_INDEX_ATTEMPTS):
+        schema_editor.execute(DROP_RESULTS_UNIQUE_INDEX)
+        schema_editor.execute(DELETE_DUPLICATE_RESULTS)
+        try:
+            schema_editor.execute(CREATE_RESULTS_UNIQUE_INDEX)
+        except IntegrityError:
+            if attempt == UNIQUE_INDEX_ATTEMPTS - 1:
+                raise
+        else:
+            return
+
+
+def drop_results_unique_index(apps, schema_editor):
+    schema_editor.execute(DROP_RESULTS_UNIQUE_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    # индексы горячих таблиц строятся concurrently,
+    # а его нельзя выполнять в транзакции
+    atomic = False
+
+    dependencies = [
+        ('quiz', '0039_user_answer_quiz'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='quizresults',
+            index=models.Index(fields=['quiz', '-solved'], name='results_quiz_solved_idx'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='useranswer',
+            index=models.Index(fields=['user', 'question', 'is_correct'], name='answer_user_question_idx'),
+        ),
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='useranswer',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['time_answered'], name='answer_time_brin_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            # уникальный индекс строится без блокировки записи
+            # и становится ограничением; недостроенный индекс
+            # прерванной миграции сначала удаляется
+            database_operations=[
+                migrations.RunPython(
+                    create_results_unique_index, drop_results_unique_index
+                ),
+                migrations.RunSQL(
+                    'ALTER TABLE quiz_quizresults '
+                    'ADD CONSTRAINT quiz_results_quiz_user_uniq '
+                    'UNIQUE USING INDEX quiz_results_quiz_user_uniq',
+                    'ALTER TABLE quiz_quizresults '
+                    'DROP CONSTRAINT quiz_results_quiz_user_uniq',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='quizresults',
+                    constraint=models.UniqueConstraint(fields=('quiz', 'user'), name='quiz_results_quiz_user_uniq'),
+                ),
+            ],
+        ),
+    ]
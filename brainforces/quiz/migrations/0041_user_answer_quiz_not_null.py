@@ -0,0 +1,81 @@
+# Generated by Django 3.2.16 on 2026-10-18 21:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# сколько ответов заполнять одним update
+FILL_BATCH_SIZE = 10000
+
+# not null на большой таблице: сначала проверка not valid
+# (без обхода таблицы), ее валидация не блокирует запись,
+# а set not null по проверенному ограничению таблицу уже не обходит
+SET_QUIZ_NOT_NULL = [
+    # проверка, оставшаяся от прерванного запуска
+    'ALTER TABLE quiz_useranswer '
+    'DROP CONSTRAINT IF EXISTS answer_quiz_not_null',
+    'ALTER TABLE quiz_useranswer '
+    'ADD CONSTRAINT answer_quiz_not_null '
+    'CHECK (quiz_id IS NOT NULL) NOT VALID',
+    'ALTER TABLE quiz_useranswer VALIDATE CONSTRAINT answer_quiz_not_null',
+    'ALTER TABLE quiz_useranswer ALTER COLUMN quiz_id SET NOT NULL',
+    'ALTER TABLE quiz_useranswer DROP CONSTRAINT answer_quiz_not_null',
+]
+
+
+def fill_answer_quiz(apps, schema_editor):
+    """
+    викторина ответов, созданных до появления поля
+    пачками по возрастанию pk: миграция без транзакции,
+    поэтому каждая пачка - отдельный короткий update
+    """
+    user_answer_model = apps.get_model('quiz', 'UserAnswer')
+    question_quiz = apps.get_model('quiz', 'Question').objects.filter(
+        pk=models.OuterRef('question_id')
+    ).values('quiz_id')[:1]
+    answers = user_answer_model.objects.filter(quiz__isnull=True).order_by(
+        'pk'
+    )
+    last_pk = 0
+    while True:
+        pks = list(
+            answers.filter(pk__gt=last_pk).values_list('pk', flat=True)[
+                :FILL_BATCH_SIZE
+            ]
+        )
+        if not pks:
+            return
+        user_answer_model.objects.filter(pk__in=pks).update(
+            quiz_id=models.Subquery(question_quiz)
+        )
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    # заполнение идет пачками, каждая в своей транзакции
+    atomic = False
+
+    dependencies = [
+        ('quiz', '0040_hot_table_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_answer_quiz, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    SET_QUIZ_NOT_NULL,
+                    'ALTER TABLE quiz_useranswer '
+                    'ALTER COLUMN quiz_id DROP NOT NULL',
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='useranswer',
+                    name='quiz',
+                    field=models.ForeignKey(db_index=False, editable=False, help_text='Викторина вопроса, на который дан ответ', on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='quiz.quiz', verbose_name='викторина'),
+                ),
+            ],
+        ),
+    ]
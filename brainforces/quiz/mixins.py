@@ -1,6 +1,7 @@
+import django.http
 import django.views.generic
 
-import quiz.models
+import quiz.access
 
 
 class QuizMixin(django.views.generic.View):
@@ -11,41 +12,15 @@ class QuizMixin(django.views.generic.View):
     стартовое и конечное время квиза
     """
 
+    def get_quiz_access(self) -> quiz.access.QuizAccessContext:
+        """права пользователя в викторине, один запрос на весь запрос"""
+        return quiz.access.get_quiz_access_context(
+            self.request, self.kwargs['pk']
+        )
+
     def get_context_data(self, *args, **kwargs) -> dict:
         context = super().get_context_data(*args, **kwargs)
-        quiz_obj = django.shortcuts.get_object_or_404(
-            quiz.models.Quiz.objects.get_active_and_published_quizzes()
-            .filter(
-                django.db.models.Q(
-                    organized_by__is_private=False, is_private=False
-                )
-                | django.db.models.Q(
-                    organized_by__users__user__pk=self.request.user.pk
-                )
-            )
-            .select_related('creator')
-            .only('is_private', 'start_time', 'duration', 'creator__id'),
-            pk=self.kwargs['pk'],
-        )
-        context['quiz'] = quiz_obj
-        context['can_participate'] = quiz.models.QuizResults.objects.filter(
-            quiz__pk=self.kwargs['pk'], user__pk=self.request.user.pk
-        ).exists()
-        quiz_status = quiz_obj.get_quiz_status()
-        if quiz_status == 1:
-            context['can_access_questions'] = False
-        elif quiz_status == 2:
-            context['can_access_questions'] = context['can_participate']
-        else:
-            context[
-                'can_access_questions'
-            ] = quiz.services.user_can_access_quiz(quiz_obj, self.request.user)
-        context['quiz_status'] = quiz_status
-        context['now_time'] = str(django.utils.timezone.now())
-        context['end_time'] = str(
-            quiz_obj.start_time
-            + django.utils.timezone.timedelta(minutes=quiz_obj.duration)
-        )
+        context.update(self.get_quiz_access().get_context())
         return context
 
 
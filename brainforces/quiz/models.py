@@ -1,7 +1,11 @@
+import typing
+
 import ckeditor_uploader.fields
 import taggit.managers
 import taggit.models
 
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
 import django.core.validators
 import django.db.models
 import django.shortcuts
@@ -9,7 +13,10 @@ import django.urls
 import django.utils.encoding
 import django.utils.timezone
 
+import core.search_vectors
+import core.text_services
 import organization.models
+import organization.visibility
 import quiz.managers
 import users.models
 
@@ -55,6 +62,15 @@ class Quiz(django.db.models.Model):
         default=10,
     )
 
+    end_time = django.db.models.DateTimeField(
+        help_text='Время начала плюс продолжительность, '
+        'пересчитывается при сохранении',
+        null=True,
+        blank=True,
+        verbose_name='время окончания',
+        editable=False,
+    )
+
     is_rated = django.db.models.BooleanField(
         verbose_name='рейтинговая',
         help_text='Изменяется ли рейтинг пользователя после данной викторины',
@@ -89,9 +105,44 @@ class Quiz(django.db.models.Model):
         default=True,
     )
 
+    visibility = django.db.models.PositiveSmallIntegerField(
+        choices=organization.visibility.Visibility.choices,
+        default=organization.visibility.Visibility.HIDDEN,
+        verbose_name='видимость',
+        help_text='Кому видна викторина: по ее флагам и флагам организации',
+        editable=False,
+    )
+
+    search_vector = django.contrib.postgres.search.SearchVectorField(
+        verbose_name='поисковый вектор',
+        help_text='Название и текст для полнотекстового поиска postgres',
+        null=True,
+        editable=False,
+    )
+
     class Meta:
         verbose_name = 'викторина'
         verbose_name_plural = 'викторины'
+        indexes = (
+            django.contrib.postgres.indexes.GinIndex(
+                fields=('search_vector',), name='quiz_search_vector_idx'
+            ),
+            # списки видимых викторин от новых к старым без join организации
+            django.db.models.Index(
+                fields=('-id',),
+                name='quiz_visible_idx',
+                condition=django.db.models.Q(
+                    visibility__gt=organization.visibility.Visibility.HIDDEN
+                ),
+            ),
+            # фильтры статуса - диапазоны по времени начала и окончания
+            django.db.models.Index(
+                fields=('start_time',), name='quiz_start_time_idx'
+            ),
+            django.db.models.Index(
+                fields=('end_time',), name='quiz_end_time_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         """строковое представление"""
@@ -103,32 +154,61 @@ class Quiz(django.db.models.Model):
             'quiz:quiz_detail', kwargs={'pk': self.pk}
         )
 
+    def calculate_end_time(
+        self,
+    ) -> typing.Optional[django.utils.timezone.datetime]:
+        """время окончания по началу и продолжительности"""
+        if self.start_time is None:
+            return None
+        return self.start_time + django.utils.timezone.timedelta(
+            minutes=self.duration
+        )
+
     def get_quiz_status(self) -> int:
-        """статус викторины"""
+        """
+        статус викторины
+        списки аннотируют его в sql (quiz.managers.get_status_expression)
+        """
+        status = self.__dict__.get('status')
+        if status is not None:
+            return status
         now_datetime = django.utils.timezone.now()
         if now_datetime < self.start_time:
-            return 1
-        elif (
-            self.start_time
-            < now_datetime
-            < self.start_time
-            + django.utils.timezone.timedelta(minutes=self.duration)
-        ):
-            return 2
+            return quiz.managers.UPCOMING
+        elif now_datetime < self.end_time:
+            return quiz.managers.RUNNING
         else:
-            return 3
+            return quiz.managers.FINISHED
 
     def get_status_display(self) -> str:
         """получаем текстовое представление статусов"""
-        text_statuses = {1: 'Не начата', 2: 'Идет', 3: 'Закончена'}
+        text_statuses = {
+            quiz.managers.UPCOMING: 'Не начата',
+            quiz.managers.RUNNING: 'Идет',
+            quiz.managers.FINISHED: 'Закончена',
+        }
         return text_statuses[self.get_quiz_status()]
 
     def description_to_string_for_elastic(self) -> str:
         """
         elastic не может делать поиск по RichTextUploadingField сам,
-        поэтому прописываем его сами
+        поэтому индексируем текст описания без разметки
         """
-        return self.description
+        return core.text_services.html_to_text(self.description)
+
+    def get_search_texts(self) -> list:
+        """тексты с весами для поискового вектора postgres"""
+        return [
+            (self.name, core.search_vectors.NAME_WEIGHT),
+            (
+                self.organized_by.name if self.organized_by_id else '',
+                core.search_vectors.ORGANIZATION_WEIGHT,
+            ),
+            (
+                self.description_to_string_for_elastic(),
+                core.search_vectors.TEXT_WEIGHT,
+            ),
+        ]
 
 
 class QuizResults(django.db.models.Model):
@@ -177,12 +257,116 @@ class QuizResults(django.db.models.Model):
     class Meta:
         verbose_name = 'результат'
         verbose_name_plural = 'результаты'
+        constraints = (
+            # один результат участника: регистрация, ответы
+            # и подведение итогов ищут его по паре (викторина, пользователь)
+            django.db.models.UniqueConstraint(
+                fields=('quiz', 'user'), name='quiz_results_quiz_user_uniq'
+            ),
+        )
+        indexes = (
+            # положение участников из базы (quiz.standings)
+            django.db.models.Index(
+                fields=('quiz', '-solved'), name='results_quiz_solved_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         """строковое представление"""
         return f'Результат {self.pk}'
 
 
+class QuizFinalization(django.db.models.Model):
+    """подведение итогов викторины"""
+
+    quiz = django.db.models.OneToOneField(
+        Quiz,
+        verbose_name='викторина',
+        help_text='Викторина, итоги которой подведены',
+        on_delete=django.db.models.CASCADE,
+        related_name='finalization',
+    )
+
+    finished_at = django.db.models.DateTimeField(
+        verbose_name='время',
+        help_text='Время подведения итогов',
+        auto_now_add=True,
+    )
+
+    duration = django.db.models.FloatField(
+        verbose_name='длительность',
+        help_text='Сколько секунд подводились итоги',
+    )
+
+    places_updated = django.db.models.PositiveIntegerField(
+        verbose_name='обновлено мест',
+        help_text='Количество результатов, у которых изменилось место',
+    )
+
+    profiles_updated = django.db.models.PositiveIntegerField(
+        verbose_name='обновлено рейтингов',
+        help_text='Количество профилей, у которых изменился рейтинг',
+    )
+
+    class Meta:
+        verbose_name = 'подведение итогов'
+        verbose_name_plural = 'подведения итогов'
+
+    def __str__(self) -> str:
+        """строковое представление"""
+        return f'Итоги викторины {self.quiz_id}'
+
+
+class RatingChange(django.db.models.Model):
+    """изменение рейтинга пользователя после рейтинговой викторины"""
+
+    user = django.db.models.ForeignKey(
+        users.models.User,
+        verbose_name='пользователь',
+        help_text='Пользователь, у которого изменился рейтинг',
+        on_delete=django.db.models.CASCADE,
+        related_name='rating_changes',
+    )
+
+    quiz = django.db.models.ForeignKey(
+        Quiz,
+        verbose_name='викторина',
+        help_text='Викторина, после которой изменился рейтинг',
+        on_delete=django.db.models.CASCADE,
+        related_name='rating_changes',
+    )
+
+    quiz_start_time = django.db.models.DateTimeField(
+        verbose_name='время викторины',
+        help_text='Время начала викторины',
+    )
+
+    rating_before = django.db.models.PositiveIntegerField(
+        verbose_name='рейтинг до',
+        help_text='Рейтинг пользователя до викторины',
+    )
+
+    rating_after = django.db.models.PositiveIntegerField(
+        verbose_name='рейтинг после',
+        help_text='Рейтинг пользователя после викторины',
+    )
+
+    class Meta:
+        unique_together = ('user', 'quiz')
+        indexes = (
+            django.db.models.Index(
+                fields=('user', 'quiz_start_time'),
+                name='rating_change_user_time_idx',
+            ),
+        )
+        verbose_name = 'изменение рейтинга'
+        verbose_name_plural = 'изменения рейтинга'
+
+    def __str__(self) -> str:
+        """строковое представление"""
+        return f'Изменение рейтинга {self.pk}'
+
+
 class Question(django.db.models.Model):
     """модель вопроса"""
 
@@ -289,6 +473,18 @@ class UserAnswer(django.db.models.Model):
         on_delete=django.db.models.CASCADE,
     )
 
+    # копия question.quiz: ответы викторины выбираются без join вопросов
+    # индекс - составной (quiz, user, time_answered) в Meta
+    quiz = django.db.models.ForeignKey(
+        Quiz,
+        verbose_name='викторина',
+        help_text='Викторина вопроса, на который дан ответ',
+        related_name='answers',
+        on_delete=django.db.models.CASCADE,
+        editable=False,
+        db_index=False,
+    )
+
     is_correct = django.db.models.BooleanField(
         verbose_name='правильность ответа',
         help_text='правильный ответ или нет',
@@ -297,7 +493,8 @@ class UserAnswer(django.db.models.Model):
     time_answered = django.db.models.DateTimeField(
         verbose_name='время',
         help_text='Время, когда пользователь ответил на вопрос',
-        auto_now_add=True,
+        default=django.utils.timezone.now,
+        editable=False,
         blank=True,
         null=True,
     )
@@ -305,6 +502,23 @@ class UserAnswer(django.db.models.Model):
     class Meta:
         verbose_name = 'ответ пользователя'
         verbose_name_plural = 'ответы пользователей'
+        indexes = (
+            # посылки пользователя в викторине и агрегаты по викторине
+            django.db.models.Index(
+                fields=('quiz', 'user', '-time_answered'),
+                name='answer_quiz_user_time_idx',
+            ),
+            # отвечал ли пользователь на вопрос и счетчики ответов вопроса
+            django.db.models.Index(
+                fields=('user', 'question', 'is_correct'),
+                name='answer_user_question_idx',
+            ),
+            # ответы пишутся по времени, поэтому выборкам за период
+            # хватает маленького brin вместо btree на всю таблицу
+            django.contrib.postgres.indexes.BrinIndex(
+                fields=('time_answered',), name='answer_time_brin_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         """строковое представление"""
@@ -0,0 +1,101 @@
+import numpy
+
+import django.conf
+
+
+class AdditiveRatingEngine:
+    """
+    рейтинг после викторины - рейтинг до
+    плюс сумма сложностей решенных вопросов
+    rating_after считается по ходу викторины, поэтому его не меняем
+    """
+
+    changes_rating_after = False
+
+    def compute(
+        self,
+        rating_before: numpy.ndarray,
+        solved: numpy.ndarray,
+        rating_after: numpy.ndarray,
+    ) -> numpy.ndarray:
+        return rating_after
+
+
+class EloRatingEngine:
+    """
+    рейтинг Эло: каждый участник играет с каждым,
+    побеждает тот, кто решил больше задач
+    ожидаемый результат считается по уникальным рейтингам,
+    поэтому память и время не растут квадратично от числа участников
+    """
+
+    changes_rating_after = True
+    # сколько уникальных рейтингов сравниваем за раз
+    chunk_size = 1024
+
+    def __init__(self, k_factor: int = None) -> None:
+        if k_factor is None:
+            k_factor = django.conf.settings.QUIZ_ELO_K_FACTOR
+        self.k_factor = k_factor
+
+    def get_expected_scores(
+        self, rating_before: numpy.ndarray
+    ) -> numpy.ndarray:
+        """
+        средняя вероятность победы участника над остальными
+        1 / (1 + 10^((Rj - Ri) / 400)) для всех j != i
+        """
+        ratings, inverse, counts = numpy.unique(
+            rating_before, return_inverse=True, return_counts=True
+        )
+        expected = numpy.empty(len(ratings))
+        for start in range(0, len(ratings), self.chunk_size):
+            chunk = ratings[start : start + self.chunk_size]
+            win_probability = 1 / (
+                1 + 10 ** ((ratings - chunk[:, numpy.newaxis]) / 400)
+            )
+            expected[start : start + self.chunk_size] = (
+                win_probability @ counts
+            )
+        # вероятность победы над самим собой - 0.5, ее вычитаем
+        return (expected[inverse] - 0.5) / (len(rating_before) - 1)
+
+    def get_actual_scores(self, solved: numpy.ndarray) -> numpy.ndarray:
+        """
+        доля участников, которых обошел участник,
+        ничья (столько же решенных задач) - половина победы
+        """
+        sorted_solved = numpy.sort(solved)
+        lower = numpy.searchsorted(sorted_solved, solved, side='left')
+        upper = numpy.searchsorted(sorted_solved, solved, side='right')
+        return (lower + (upper - lower - 1) / 2) / (len(solved) - 1)
+
+    def compute(
+        self,
+        rating_before: numpy.ndarray,
+        solved: numpy.ndarray,
+        rating_after: numpy.ndarray,
+    ) -> numpy.ndarray:
+        if len(rating_before) < 2:
+            return rating_before.copy()
+        rating_before = rating_before.astype(numpy.float64)
+        delta = self.k_factor * (
+            self.get_actual_scores(solved)
+            - self.get_expected_scores(rating_before)
+        )
+        return numpy.maximum(numpy.rint(rating_before + delta), 0).astype(
+            numpy.int64
+        )
+
+
+RATING_ENGINES = {
+    'additive': AdditiveRatingEngine,
+    'elo': EloRatingEngine,
+}
+
+
+def get_rating_engine(name: str = None) -> object:
+    """движок рейтинга из настройки QUIZ_RATING_ENGINE"""
+    if name is None:
+        name = django.conf.settings.QUIZ_RATING_ENGINE
+    return RATING_ENGINES[name]()
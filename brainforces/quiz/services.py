@@ -1,5 +1,18 @@
-import organization.models
+import time
+import typing
+
+import numpy
+
+import django.conf
+import django.db
+import django.utils.timezone
+
+import core.redis_rervices
+import organization.roles
+import quiz.answer_stream
 import quiz.models
+import quiz.ratings
+import quiz.tasks
 import users.models
 
 
@@ -11,54 +24,298 @@ def user_can_access_quiz(
     она не приватная или пользователь участник
     проводящей организации
     """
-    org_to_user_manager = organization.models.OrganizationToUser.objects
     return (
         not quiz_obj.is_private
-        or quiz_obj.creator.pk == user_obj.pk
+        or quiz_obj.creator_id == user_obj.pk
         or (
-            quiz_obj.is_private
-            and (
-                org_to_user_manager.get_organization_member(
-                    org_pk=quiz_obj.organized_by.pk, user_pk=user_obj.pk
-                )
+            quiz_obj.organized_by_id is not None
+            and organization.roles.is_member(
+                org_pk=quiz_obj.organized_by_id, user_pk=user_obj.pk
             )
         )
     )
 
 
-def make_quiz_results(quiz_obj: quiz.models.Quiz) -> None:
+def _get_ranking_sql() -> str:
+    """
+    места участников одним UPDATE ... FROM
+    одинаковое количество решенных задач - одинаковое место,
+    следующее место идет без пропусков
+    строки, где место уже верное, не перезаписываем
+    """
+    results_table = quiz.models.QuizResults._meta.db_table
+    return f"""
+        UPDATE {results_table} AS results
+        SET place = ranked.place
+        FROM (
+            SELECT id, DENSE_RANK() OVER (ORDER BY solved DESC) AS place
+            FROM {results_table}
+            WHERE quiz_id = %s
+        ) AS ranked
+        WHERE results.quiz_id = %s
+            AND results.id = ranked.id
+            AND results.place IS DISTINCT FROM ranked.place
+    """
+
+
+def _get_profile_ratings_sql() -> str:
+    """рейтинг после викторины переносим в профили одним UPDATE ... FROM"""
+    return f"""
+        UPDATE {users.models.Profile._meta.db_table} AS profile
+        SET rating = results.rating_after
+        FROM {quiz.models.QuizResults._meta.db_table} AS results
+        WHERE results.quiz_id = %s
+            AND profile.user_id = results.user_id
+            AND profile.rating IS DISTINCT FROM results.rating_after
+    """
+
+
+def _get_ratings_sql() -> str:
+    """рейтинг участников до и после одним UPDATE ... FROM из массивов"""
+    return f"""
+        UPDATE {quiz.models.QuizResults._meta.db_table} AS results
+        SET rating_before = computed.rating_before,
+            rating_after = computed.rating_after
+        FROM unnest(%s::bigint[], %s::integer[], %s::integer[])
+            AS computed (id, rating_before, rating_after)
+        WHERE results.id = computed.id
+            AND (results.rating_before, results.rating_after)
+                IS DISTINCT FROM
+                (computed.rating_before, computed.rating_after)
+    """
+
+
+def _get_rating_changes_sql() -> str:
+    """записываем изменения рейтинга участников викторины в историю"""
+    return f"""
+        INSERT INTO {quiz.models.RatingChange._meta.db_table}
+            (user_id, quiz_id, quiz_start_time, rating_before, rating_after)
+        SELECT results.user_id, results.quiz_id, quiz.start_time,
+            results.rating_before, results.rating_after
+        FROM {quiz.models.QuizResults._meta.db_table} AS results
+        JOIN {quiz.models.Quiz._meta.db_table} AS quiz
+            ON quiz.id = results.quiz_id
+        WHERE results.quiz_id = %s AND quiz.start_time IS NOT NULL
+        ON CONFLICT (user_id, quiz_id) DO UPDATE
+        SET quiz_start_time = EXCLUDED.quiz_start_time,
+            rating_before = EXCLUDED.rating_before,
+            rating_after = EXCLUDED.rating_after
+    """
+
+
+def _get_previous_ratings_sql() -> str:
+    """
+    результаты участников викторины и их рейтинг
+    после предыдущей рейтинговой викторины из истории
+    """
+    rating_changes_table = quiz.models.RatingChange._meta.db_table
+    return f"""
+        SELECT results.id, results.solved,
+            results.rating_before, results.rating_after,
+            COALESCE(previous.rating_after, 0)
+        FROM {quiz.models.QuizResults._meta.db_table} AS results
+        LEFT JOIN LATERAL (
+            SELECT rating_after
+            FROM {rating_changes_table} AS rating_change
+            WHERE rating_change.user_id = results.user_id
+                AND (rating_change.quiz_start_time, rating_change.quiz_id)
+                    < (%s, %s)
+            ORDER BY rating_change.quiz_start_time DESC,
+                rating_change.quiz_id DESC
+            LIMIT 1
+        ) AS previous ON TRUE
+        WHERE results.quiz_id = %s
+    """
+
+
+def _get_history_profile_ratings_sql() -> str:
+    """
+    рейтинг профилей - последнее изменение из истории
+    только для участников викторин, начавшихся не раньше данного времени
+    """
+    rating_changes_table = quiz.models.RatingChange._meta.db_table
+    return f"""
+        UPDATE {users.models.Profile._meta.db_table} AS profile
+        SET rating = latest.rating_after
+        FROM (
+            SELECT DISTINCT ON (user_id) user_id, rating_after
+            FROM {rating_changes_table}
+            WHERE user_id IN (
+                SELECT user_id FROM {rating_changes_table}
+                WHERE quiz_start_time >= %s
+            )
+            ORDER BY user_id, quiz_start_time DESC, quiz_id DESC
+        ) AS latest
+        WHERE profile.user_id = latest.user_id
+            AND profile.rating IS DISTINCT FROM latest.rating_after
+    """
+
+
+def write_ratings(
+    cursor: object,
+    results_pks: numpy.ndarray,
+    rating_before: numpy.ndarray,
+    rating_after: numpy.ndarray,
+) -> int:
+    """
+    записываем рейтинг до и после в результаты викторины
+    возвращаем количество обновленных результатов
+    """
+    cursor.execute(
+        _get_ratings_sql(),
+        [results_pks.tolist(), rating_before.tolist(), rating_after.tolist()],
+    )
+    return cursor.rowcount
+
+
+def update_rating_after(quiz_pk: int, cursor: object) -> int:
+    """
+    пересчитываем рейтинг участников движком QUIZ_RATING_ENGINE
+    в память загружаем только массивы чисел
+    возвращаем количество обновленных результатов
+    """
+    rating_engine = quiz.ratings.get_rating_engine()
+    if not rating_engine.changes_rating_after:
+        return 0
+    results = numpy.array(
+        quiz.models.QuizResults.objects.filter(quiz__pk=quiz_pk).values_list(
+            'pk', 'rating_before', 'solved', 'rating_after'
+        ),
+        dtype=numpy.int64,
+    ).reshape(-1, 4)
+    rating_after = rating_engine.compute(
+        rating_before=results[:, 1],
+        solved=results[:, 2],
+        rating_after=results[:, 3],
+    )
+    return write_ratings(cursor, results[:, 0], results[:, 1], rating_after)
+
+
+def recompute_quiz_ratings(quiz_obj: quiz.models.Quiz) -> int:
+    """
+    пересчитываем рейтинг участников подведенной викторины
+    рейтинг до - рейтинг после предыдущей викторины из истории,
+    поэтому викторины нужно пересчитывать по порядку начала
+    прирост по сложности вопросов (для additive) сохраняется
+    возвращаем количество обновленных результатов
+    """
+    rating_engine = quiz.ratings.get_rating_engine()
+    with django.db.transaction.atomic():
+        with django.db.connection.cursor() as cursor:
+            cursor.execute(
+                _get_previous_ratings_sql(),
+                [quiz_obj.start_time, quiz_obj.pk, quiz_obj.pk],
+            )
+            results = numpy.array(
+                cursor.fetchall(), dtype=numpy.int64
+            ).reshape(-1, 5)
+            rating_before = results[:, 4]
+            rating_after = rating_engine.compute(
+                rating_before=rating_before,
+                solved=results[:, 1],
+                rating_after=numpy.maximum(
+                    rating_before + results[:, 3] - results[:, 2], 0
+                ),
+            )
+            results_updated = write_ratings(
+                cursor, results[:, 0], rating_before, rating_after
+            )
+            cursor.execute(_get_rating_changes_sql(), [quiz_obj.pk])
+    return results_updated
+
+
+def update_profile_ratings_from_history(
+    start_time: django.utils.timezone.datetime,
+) -> int:
+    """
+    переносим в профили последний рейтинг из истории
+    возвращаем количество обновленных профилей
+    """
+    with django.db.connection.cursor() as cursor:
+        cursor.execute(_get_history_profile_ratings_sql(), [start_time])
+        return cursor.rowcount
+
+
+def make_quiz_results(quiz_pk: int) -> typing.Optional[dict]:
     """
     подводим итоги викторины
     изменяем рейтинг пользователя,
     его место в топе участников викторины
+    все считается в базе, участники в память не загружаются
+    одновременно итоги викторины подводит только один процесс,
+    повторный вызов для подведенной викторины ничего не делает
+    при записи ответов через поток итоги подводятся только после
+    выгрузки всех ответов викторины в базу
+    длительность и количество обновленных строк
+    записываем в QuizFinalization и возвращаем
+    или None, если итоги уже подведены, подводятся
+    или ответы викторины еще не выгружены
     """
-    quiz_results = list(
-        quiz.models.QuizResults.objects.filter(quiz__pk=quiz_obj.pk)
-        .select_related('user')
-        .order_by('-solved')
-    )
-    add_rating = quiz_obj.is_rated and not quiz_obj.is_private
-    cur_place = 1
-    to_update_profiles, quiz_results_objects = list(), list()
-    profile_objects = users.models.Profile.objects.filter(
-        user__pk__in=(quiz_result.user.pk for quiz_result in quiz_results)
+    lock = core.redis_rervices.redis_connection.lock(
+        f'quiz:{quiz_pk}:results_lock', timeout=600
     )
-    for result_ind in range(len(quiz_results)):
-        if add_rating:
-            profile_obj = profile_objects[result_ind]
-            profile_obj.rating = quiz_results[result_ind].rating_after
-            to_update_profiles.append(profile_obj)
+    if not lock.acquire(blocking=False):
+        return None
+    try:
+        start = time.perf_counter()
         if (
-            result_ind != 0
-            and quiz_results[result_ind].solved
-            != quiz_results[result_ind - 1].solved
+            django.conf.settings.QUIZ_ANSWERS_WRITE_BEHIND
+            and not quiz.answer_stream.flush_quiz_answers(quiz_pk)
         ):
-            cur_place += 1
-        quiz_results[result_ind].place = cur_place
-        quiz_results_objects.append(quiz_results[result_ind])
-    quiz_obj.is_ended = True
-    quiz_obj.save()
-    users.models.Profile.objects.bulk_update(to_update_profiles, ('rating',))
-    quiz.models.QuizResults.objects.bulk_update(
-        quiz_results_objects, ('place',)
+            # без последних ответов места и рейтинг будут неверными,
+            # итоги подведет следующий make_ended_quizzes_results
+            return None
+        with django.db.transaction.atomic():
+            quiz_obj = (
+                quiz.models.Quiz.objects.select_for_update()
+                .filter(pk=quiz_pk, is_ended=False)
+                .only('is_rated', 'is_private')
+                .first()
+            )
+            if quiz_obj is None:
+                return None
+            with django.db.connection.cursor() as cursor:
+                cursor.execute(_get_ranking_sql(), [quiz_pk, quiz_pk])
+                places_updated = cursor.rowcount
+                profiles_updated = 0
+                if quiz_obj.is_rated and not quiz_obj.is_private:
+                    update_rating_after(quiz_pk, cursor)
+                    cursor.execute(_get_profile_ratings_sql(), [quiz_pk])
+                    profiles_updated = cursor.rowcount
+                    cursor.execute(_get_rating_changes_sql(), [quiz_pk])
+            quiz.models.Quiz.objects.filter(pk=quiz_pk).update(is_ended=True)
+            finalization_obj = quiz.models.QuizFinalization.objects.create(
+                quiz_id=quiz_pk,
+                duration=time.perf_counter() - start,
+                places_updated=places_updated,
+                profiles_updated=profiles_updated,
+            )
+    finally:
+        lock.release()
+    return {
+        'duration': finalization_obj.duration,
+        'places_updated': places_updated,
+        'profiles_updated': profiles_updated,
+    }
+
+
+def make_ended_quizzes_results() -> typing.List[int]:
+    """
+    ставим в очередь подведение итогов закончившихся викторин
+    за раз берем не больше QUIZ_RESULTS_BATCH_SIZE викторин
+    и запускаем их с интервалом QUIZ_RESULTS_STAGGER секунд,
+    чтобы не нагружать базу одновременно
+    остальные викторины возьмет следующий запуск
+    возвращаем pk поставленных в очередь викторин
+    """
+    quiz_pks = list(
+        quiz.models.Quiz.objects.get_waiting_for_results().values_list(
+            'pk', flat=True
+        )[: django.conf.settings.QUIZ_RESULTS_BATCH_SIZE]
     )
+    for index, quiz_pk in enumerate(quiz_pks):
+        quiz.tasks.make_quiz_results.apply_async(
+            args=(quiz_pk,),
+            countdown=index * django.conf.settings.QUIZ_RESULTS_STAGGER,
+        )
+    return quiz_pks
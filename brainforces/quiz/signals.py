@@ -0,0 +1,137 @@
+import typing
+
+import django.db
+import django.db.models.signals
+import django.dispatch
+
+import core.search_vectors
+import organization.visibility
+import quiz.answer_keys
+import quiz.models
+
+
+# поля викторины, от которых зависит ее видимость
+VISIBILITY_FIELDS = ('is_published', 'is_private', 'organized_by')
+# поля викторины, от которых зависит время окончания
+END_TIME_FIELDS = ('start_time', 'duration')
+
+
+def invalidate_answer_key_on_commit(quiz_pk: int) -> None:
+    """сбрасываем ключ ответов после коммита транзакции"""
+    django.db.transaction.on_commit(
+        lambda: quiz.answer_keys.invalidate_answer_key(quiz_pk)
+    )
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.post_save, sender=quiz.models.Question
+)
+@django.dispatch.receiver(
+    django.db.models.signals.post_delete, sender=quiz.models.Question
+)
+def question_changed(
+    sender: type, instance: quiz.models.Question, **kwargs
+) -> None:
+    """вопрос изменился - ключ ответов викторины устарел"""
+    invalidate_answer_key_on_commit(instance.quiz_id)
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.post_save, sender=quiz.models.Variant
+)
+@django.dispatch.receiver(
+    django.db.models.signals.post_delete, sender=quiz.models.Variant
+)
+def variant_changed(
+    sender: type, instance: quiz.models.Variant, **kwargs
+) -> None:
+    """вариант ответа изменился - ключ ответов викторины устарел"""
+    quiz_pk = (
+        quiz.models.Question.objects.filter(pk=instance.question_id)
+        .values_list('quiz_id', flat=True)
+        .first()
+    )
+    if quiz_pk is not None:
+        invalidate_answer_key_on_commit(quiz_pk)
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.pre_save, sender=quiz.models.Quiz
+)
+def quiz_visibility(
+    sender: type,
+    instance: quiz.models.Quiz,
+    update_fields: typing.Optional[frozenset] = None,
+    **kwargs,
+) -> None:
+    """
+    видимость викторины по ее флагам и флагам организации
+    при загрузке фикстур организации может еще не быть -
+    тогда видимость пересчитает сохранение организации
+    """
+    if core.search_vectors.should_update(update_fields, VISIBILITY_FIELDS):
+        instance.visibility = organization.visibility.get_visibility(
+            instance.organized_by_id,
+            is_hidden=not instance.is_published,
+            is_private=instance.is_private,
+        )
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.pre_save, sender=quiz.models.Quiz
+)
+def quiz_end_time(
+    sender: type,
+    instance: quiz.models.Quiz,
+    update_fields: typing.Optional[frozenset] = None,
+    **kwargs,
+) -> None:
+    """время окончания хранится, чтобы фильтры статуса шли по индексу"""
+    if core.search_vectors.should_update(update_fields, END_TIME_FIELDS):
+        instance.end_time = instance.calculate_end_time()
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.post_save, sender=quiz.models.Quiz
+)
+def quiz_saved(
+    sender: type,
+    instance: quiz.models.Quiz,
+    raw: bool = False,
+    update_fields: typing.Optional[frozenset] = None,
+    **kwargs,
+) -> None:
+    """название или описание изменились - пересчитываем поисковый вектор"""
+    if not raw and core.search_vectors.should_update(
+        update_fields, ('name', 'description', 'organized_by')
+    ):
+        core.search_vectors.update_search_vector(instance)
+    if core.search_vectors.should_update(update_fields, VISIBILITY_FIELDS):
+        organization.visibility.save_visibility(instance, update_fields)
+    if (
+        update_fields is not None
+        and 'end_time' not in update_fields
+        and core.search_vectors.should_update(update_fields, END_TIME_FIELDS)
+    ):
+        # save(update_fields=...) без end_time его не записал
+        quiz.models.Quiz.objects.filter(pk=instance.pk).update(
+            end_time=instance.end_time
+        )
+
+
+@django.dispatch.receiver(
+    django.db.models.signals.pre_save, sender=quiz.models.UserAnswer
+)
+def user_answer_quiz(
+    sender: type, instance: quiz.models.UserAnswer, **kwargs
+) -> None:
+    """
+    викторина ответа, если ее не передали при создании
+    (ответы во время викторины и bulk_create передают ее сами)
+    """
+    if instance.quiz_id is None and instance.question_id is not None:
+        instance.quiz_id = (
+            quiz.models.Question.objects.filter(pk=instance.question_id)
+            .values_list('quiz_id', flat=True)
+            .first()
+        )
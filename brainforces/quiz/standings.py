@@ -0,0 +1,212 @@
+import typing
+
+import redis.exceptions
+
+import django.conf
+import django.db.models
+import django.utils.timezone
+
+import core.redis_rervices
+import quiz.models
+import users.models
+
+
+def get_standings_key(quiz_pk: int) -> str:
+    """ключ сортированного множества (пользователь - решенные задачи)"""
+    return f'quiz:{quiz_pk}:standings'
+
+
+def get_standings_built_key(quiz_pk: int) -> str:
+    """ключ-метка, что множество собрано из базы"""
+    return f'quiz:{quiz_pk}:standings:built'
+
+
+def get_standings_rebuild_lock_key(quiz_pk: int) -> str:
+    """ключ блокировки пересборки положения"""
+    return f'quiz:{quiz_pk}:standings:rebuild_lock'
+
+
+def get_standings_building_key(quiz_pk: int) -> str:
+    """ключ, в который собирается новое положение"""
+    return f'quiz:{quiz_pk}:standings:building'
+
+
+def get_expire_time(
+    quiz_obj: quiz.models.Quiz,
+) -> django.utils.timezone.datetime:
+    """положение в redis живет час после окончания викторины"""
+    return quiz_obj.start_time + django.utils.timezone.timedelta(
+        minutes=quiz_obj.duration, hours=1
+    )
+
+
+def rebuild_standings(quiz_obj: quiz.models.Quiz) -> None:
+    """
+    собираем положение заново из QuizResults
+    пересобирает один процесс: остальные, пришедшие одновременно
+    за пустым положением, не нагружают базу тем же запросом
+    новое множество собирается в отдельном ключе и одним rename
+    заменяет старое, поэтому читатели не видят его пустым
+    """
+    connection = core.redis_rervices.redis_connection
+    lock = connection.lock(
+        get_standings_rebuild_lock_key(quiz_obj.pk), timeout=30
+    )
+    if not lock.acquire(blocking=False):
+        return
+    try:
+        results = quiz.models.QuizResults.objects.filter(
+            quiz__pk=quiz_obj.pk
+        ).values_list('user_id', 'solved')
+        standings_key = get_standings_key(quiz_obj.pk)
+        building_key = get_standings_building_key(quiz_obj.pk)
+        built_key = get_standings_built_key(quiz_obj.pk)
+        expire_time = get_expire_time(quiz_obj)
+        pipeline = connection.pipeline()
+        mapping = {user_pk: solved for user_pk, solved in results}
+        if mapping:
+            pipeline.delete(building_key)
+            pipeline.zadd(building_key, mapping)
+            pipeline.expireat(building_key, expire_time)
+            pipeline.rename(building_key, standings_key)
+        else:
+            pipeline.delete(standings_key)
+        pipeline.set(built_key, 1)
+        pipeline.expireat(built_key, expire_time)
+        pipeline.execute()
+    finally:
+        lock.release()
+
+
+def ensure_standings(quiz_obj: quiz.models.Quiz) -> None:
+    """пересобираем положение, если redis его потерял"""
+    connection = core.redis_rervices.redis_connection
+    if not connection.exists(get_standings_built_key(quiz_obj.pk)):
+        rebuild_standings(quiz_obj)
+
+
+def add_participant(quiz_obj: quiz.models.Quiz, user_pk: int) -> None:
+    """
+    добавляем зарегистрировавшегося участника с нулем решенных
+    zadd создает множество, если его еще нет, поэтому срок жизни
+    ставим тот же, что и при пересборке
+    """
+    if not django.conf.settings.QUIZ_LIVE_STANDINGS:
+        return
+    standings_key = get_standings_key(quiz_obj.pk)
+    pipeline = core.redis_rervices.redis_connection.pipeline(transaction=False)
+    pipeline.zadd(standings_key, {user_pk: 0}, nx=True)
+    pipeline.expireat(standings_key, get_expire_time(quiz_obj))
+    try:
+        pipeline.execute()
+    except redis.exceptions.RedisError:
+        pass
+
+
+def add_solved(quiz_pk: int, user_pk: int, solved: int = 1) -> None:
+    """
+    увеличиваем количество решенных задач участника
+    если участника в множестве нет (redis потерял данные),
+    ничего не делаем - он появится при пересборке из базы
+    """
+    if not django.conf.settings.QUIZ_LIVE_STANDINGS:
+        return
+    try:
+        core.redis_rervices.redis_connection.zadd(
+            get_standings_key(quiz_pk), {user_pk: solved}, xx=True, incr=True
+        )
+    except redis.exceptions.RedisError:
+        pass
+
+
+def add_solved_many(solved_by_participant: dict) -> None:
+    """
+    увеличиваем количество решенных задач нескольких участников
+    за один поход в redis
+    solved_by_participant - {(quiz_pk, user_pk): решенные задачи}
+    """
+    if not django.conf.settings.QUIZ_LIVE_STANDINGS:
+        return
+    pipeline = core.redis_rervices.redis_connection.pipeline(transaction=False)
+    for (quiz_pk, user_pk), solved in solved_by_participant.items():
+        pipeline.zadd(
+            get_standings_key(quiz_pk), {user_pk: solved}, xx=True, incr=True
+        )
+    try:
+        pipeline.execute()
+    except redis.exceptions.RedisError:
+        pass
+
+
+def get_user_position(quiz_pk: int, user_pk: int) -> typing.Optional[int]:
+    """позиция пользователя в положении, начиная с нуля"""
+    return core.redis_rervices.redis_connection.zrevrank(
+        get_standings_key(quiz_pk), user_pk
+    )
+
+
+class QuizStandings:
+    """
+    положение участников викторины из redis
+    поддерживает count и срезы, поэтому его можно
+    отдавать пагинатору вместо кверисета
+    если redis перестал отвечать уже после выбора положения,
+    количество и страница берутся из базы
+    """
+
+    def __init__(self, quiz_pk: int) -> None:
+        self.quiz_pk = quiz_pk
+        self.standings_key = get_standings_key(quiz_pk)
+
+    def count(self) -> int:
+        """количество участников"""
+        try:
+            return core.redis_rervices.redis_connection.zcard(
+                self.standings_key
+            )
+        except redis.exceptions.RedisError:
+            return get_sql_standings(self.quiz_pk).count()
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(
+        self, index: slice
+    ) -> typing.List[quiz.models.QuizResults]:
+        """
+        участники с позиции start по stop
+        имена пользователей подгружаем одним запросом
+        """
+        start = index.start or 0
+        if index.stop is None:
+            stop = -1
+        else:
+            stop = index.stop - 1
+            if stop < start:
+                return list()
+        try:
+            rows = core.redis_rervices.redis_connection.zrevrange(
+                self.standings_key, start, stop, withscores=True
+            )
+        except redis.exceptions.RedisError:
+            return list(get_sql_standings(self.quiz_pk)[index])
+        user_objects = users.models.User.objects.only('username').in_bulk(
+            [int(user_pk) for user_pk, _ in rows]
+        )
+        return [
+            quiz.models.QuizResults(
+                user=user_objects[int(user_pk)], solved=int(solved)
+            )
+            for user_pk, solved in rows
+            if int(user_pk) in user_objects
+        ]
+
+
+def get_sql_standings(quiz_pk: int) -> django.db.models.QuerySet:
+    """положение участников из базы"""
+    return (
+        quiz.models.QuizResults.objects.select_related('user')
+        .filter(quiz__pk=quiz_pk)
+        .only('solved', 'user__username')
+        .order_by('-solved')
+    )
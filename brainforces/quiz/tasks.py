@@ -0,0 +1,38 @@
+import celery
+
+import quiz.answer_keys
+import quiz.answer_stream
+import quiz.services
+
+
+@celery.shared_task
+def flush_answers_stream() -> int:
+    """
+    выгружаем ответы пользователей из потока redis в базу
+    возвращаем количество записанных ответов
+    """
+    return quiz.answer_stream.flush_answers_stream()
+
+
+@celery.shared_task
+def warm_up_answer_key(quiz_pk: int) -> None:
+    """собираем ключ ответов викторины незадолго до ее начала"""
+    quiz.answer_keys.warm_up_answer_key(quiz_pk)
+
+
+@celery.shared_task
+def make_quiz_results(quiz_pk: int) -> dict:
+    """
+    подводим итоги викторины
+    возвращаем количество обновленных строк
+    """
+    return quiz.services.make_quiz_results(quiz_pk)
+
+
+@celery.shared_task
+def make_ended_quizzes_results() -> list:
+    """
+    периодически подводим итоги закончившихся викторин
+    возвращаем pk викторин, поставленных в очередь
+    """
+    return quiz.services.make_ended_quizzes_results()
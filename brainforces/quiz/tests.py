@@ -1,7 +1,35 @@
+import io
+import json
+import types
+
+import elasticsearch_dsl.utils
+import mock
+import numpy
+import redis.exceptions
+
+import django.core.management
+import django.db
+import django.http
 import django.test
 import django.urls
+import django.utils.timezone
 
+import core.elastic_services
+import core.redis_rervices
+import core.search_backends
+import core.search_cache
+import organization.models
+import quiz.answer_keys
+import quiz.answer_stream
+import quiz.documents
+import quiz.management.commands.benchmark_rating_engines
+import quiz.managers
 import quiz.models
+import quiz.ratings
+import quiz.services
+import quiz.standings
+import quiz.tasks
+import users.models
 
 
 class QuizTests(django.test.TestCase):
@@ -30,3 +58,1130 @@ class QuizTests(django.test.TestCase):
                 )
             )
         )
+
+
+class LiveQuizTestCase(django.test.TestCase):
+    """идущая викторина с зарегистрированным участником"""
+
+    def setUp(self) -> None:
+        """подготовка к тестированию, создание тестовых данных"""
+        self.user = users.models.User.objects.create(
+            username='participant', email='participant@gmail.com'
+        )
+        users.models.Profile.objects.create(user=self.user, rating=10)
+        self.organization = organization.models.Organization.objects.create(
+            name='organization', description='description', is_active=True
+        )
+        self.quiz = quiz.models.Quiz.objects.create(
+            name='quiz',
+            description='description',
+            creator=self.user,
+            organized_by=self.organization,
+            start_time=django.utils.timezone.now()
+            - django.utils.timezone.timedelta(minutes=5),
+            duration=60,
+        )
+        self.question = quiz.models.Question.objects.create(
+            name='question', text='text', quiz=self.quiz, difficulty=3
+        )
+        self.right_variant = quiz.models.Variant.objects.create(
+            text='right', question=self.question, is_correct=True
+        )
+        self.wrong_variant = quiz.models.Variant.objects.create(
+            text='wrong', question=self.question, is_correct=False
+        )
+        quiz.models.QuizResults.objects.create(
+            quiz=self.quiz, user=self.user, rating_before=10, rating_after=10
+        )
+        quiz.answer_keys.invalidate_answer_key(self.quiz.pk)
+        self.client = django.test.Client()
+        self.client.force_login(self.user)
+        super().setUp()
+
+    def send_answer(self, variant: quiz.models.Variant) -> None:
+        """отправляем ответ на вопрос"""
+        self.client.post(
+            django.urls.reverse(
+                'quiz:question_detail',
+                kwargs={'pk': self.quiz.pk, 'question_pk': self.question.pk},
+            ),
+            data={'answer': variant.pk},
+        )
+
+
+@django.test.override_settings(QUIZ_ANSWERS_WRITE_BEHIND=True)
+class AnswerStreamTests(LiveQuizTestCase):
+    """тестируем запись ответов через поток redis"""
+
+    def test_answer_flushed_to_database(self) -> None:
+        """ответ из потока попадает в базу, результат обновляется"""
+        self.send_answer(self.right_variant)
+        quiz_result = quiz.models.QuizResults.objects.get(quiz=self.quiz)
+        self.assertEqual(
+            list(
+                quiz.models.UserAnswer.objects.values_list('quiz', flat=True)
+            ),
+            [self.quiz.pk],
+        )
+        self.assertEqual(quiz_result.solved, 1)
+        self.assertEqual(quiz_result.rating_after, 13)
+
+    def test_second_answer_rejected(self) -> None:
+        """во время викторины на вопрос можно ответить только один раз"""
+        self.send_answer(self.wrong_variant)
+        self.send_answer(self.right_variant)
+        quiz_result = quiz.models.QuizResults.objects.get(quiz=self.quiz)
+        self.assertEqual(quiz.models.UserAnswer.objects.count(), 1)
+        self.assertEqual(quiz_result.solved, 0)
+
+    def test_replayed_entries_not_applied_twice(self) -> None:
+        """
+        после падения между коммитом и подтверждением в потоке
+        повторная выгрузка не дублирует ответ и решенные задачи
+        """
+        with mock.patch('quiz.answer_stream.schedule_answers_flush'):
+            self.send_answer(self.right_variant)
+        with mock.patch(
+            'core.redis_rervices.BreakerPipeline.execute',
+            side_effect=RuntimeError,
+        ):
+            with self.assertRaises(RuntimeError):
+                quiz.answer_stream.flush_answers(10)
+        self.assertEqual(quiz.answer_stream.flush_answers_stream(), 1)
+        quiz_result = quiz.models.QuizResults.objects.get(quiz=self.quiz)
+        self.assertEqual(quiz.models.UserAnswer.objects.count(), 1)
+        self.assertEqual(quiz_result.solved, 1)
+        self.assertEqual(quiz_result.rating_after, 13)
+
+    def test_redis_error_falls_back_to_database(self) -> None:
+        """
+        при ошибке redis отметка об ответе снимается,
+        а ответ записывается в базу синхронно
+        """
+        with mock.patch(
+            'quiz.answer_stream.schedule_answers_flush',
+            side_effect=redis.exceptions.ConnectionError,
+        ):
+            self.send_answer(self.right_variant)
+        self.assertFalse(
+            core.redis_rervices.redis_connection.sismember(
+                quiz.answer_stream.get_answered_questions_key(
+                    self.quiz.pk, self.user.pk
+                ),
+                self.question.pk,
+            )
+        )
+        quiz_result = quiz.models.QuizResults.objects.get(quiz=self.quiz)
+        self.assertEqual(quiz.models.UserAnswer.objects.count(), 1)
+        self.assertEqual(quiz_result.solved, 1)
+        # запись, все же попавшая в поток, не засчитывается второй раз
+        quiz.answer_stream.flush_answers_stream()
+        quiz_result.refresh_from_db()
+        self.assertEqual(quiz.models.UserAnswer.objects.count(), 1)
+        self.assertEqual(quiz_result.solved, 1)
+
+    def test_answer_in_database_not_applied(self) -> None:
+        """ответ из потока на вопрос с ответом в базе отбрасывается"""
+        quiz.models.UserAnswer.objects.create(
+            user=self.user,
+            question=self.question,
+            quiz=self.quiz,
+            is_correct=False,
+        )
+        with mock.patch('quiz.answer_stream.schedule_answers_flush'):
+            self.send_answer(self.right_variant)
+        quiz.answer_stream.flush_answers_stream()
+        quiz_result = quiz.models.QuizResults.objects.get(quiz=self.quiz)
+        self.assertEqual(quiz.models.UserAnswer.objects.count(), 1)
+        self.assertEqual(quiz_result.solved, 0)
+
+    def test_flush_rescheduled_after_release(self) -> None:
+        """записи, добавленные во время выгрузки, выгружаются снова"""
+        connection = core.redis_rervices.redis_connection
+
+        def add_entry(batch_size: int) -> int:
+            connection.xadd(quiz.answer_stream.STREAM_KEY, {'test': 1})
+            return 0
+
+        with mock.patch(
+            'quiz.answer_stream.flush_answers', side_effect=add_entry
+        ), mock.patch('quiz.answer_stream.schedule_answers_flush') as schedule:
+            quiz.answer_stream.flush_answers_stream()
+        connection.delete(quiz.answer_stream.STREAM_KEY)
+        schedule.assert_called_once()
+
+    def test_pending_answers_in_context(self) -> None:
+        """невыгруженные ответы видны пользователю"""
+        core.redis_rervices.redis_connection.hset(
+            quiz.answer_stream.get_pending_answers_key(
+                self.quiz.pk, self.user.pk
+            ),
+            self.question.pk,
+            '{"is_correct": true, '
+            '"time_answered": "2023-01-01T00:00:00+00:00"}',
+        )
+        response = self.client.get(
+            django.urls.reverse(
+                'quiz:user_answers_list', kwargs={'pk': self.quiz.pk}
+            )
+        )
+        self.assertEqual(len(response.context['pending_answers']), 1)
+
+    def tearDown(self) -> None:
+        """удаляем ключи викторины из redis"""
+        core.redis_rervices.redis_connection.delete(
+            quiz.answer_stream.get_answered_questions_key(
+                self.quiz.pk, self.user.pk
+            ),
+            quiz.answer_stream.get_pending_answers_key(
+                self.quiz.pk, self.user.pk
+            ),
+        )
+        super().tearDown()
+
+
+class UserAnswerQuizTests(LiveQuizTestCase):
+    """тестируем викторину, сохраненную в ответе"""
+
+    def test_answer_saved_with_quiz(self) -> None:
+        """ответ записывается с викториной и виден в посылках"""
+        self.send_answer(self.right_variant)
+        answer_obj = quiz.models.UserAnswer.objects.get()
+        self.assertEqual(answer_obj.quiz_id, self.quiz.pk)
+        response = self.client.get(
+            django.urls.reverse(
+                'quiz:user_answers_list', kwargs={'pk': self.quiz.pk}
+            )
+        )
+        self.assertEqual(list(response.context['answers']), [answer_obj])
+        sql = str(response.context['answers'].query)
+        self.assertIn('"quiz_useranswer"."quiz_id" =', sql)
+        self.assertNotIn('"quiz_question"."quiz_id"', sql)
+
+    def test_quiz_filled_from_question(self) -> None:
+        """без переданной викторины она берется из вопроса"""
+        answer_obj = quiz.models.UserAnswer.objects.create(
+            user=self.user, question=self.question, is_correct=True
+        )
+        self.assertEqual(answer_obj.quiz_id, self.quiz.pk)
+
+
+class HotTableIndexesTests(LiveQuizTestCase):
+    """тестируем индексы и уникальность результатов"""
+
+    def test_registration_once(self) -> None:
+        """повторная регистрация не создает второй результат"""
+        url = django.urls.reverse('quiz:register', kwargs={'pk': self.quiz.pk})
+        user_obj = users.models.User.objects.create(
+            username='newcomer', email='newcomer@gmail.com'
+        )
+        users.models.Profile.objects.create(user=user_obj, rating=7)
+        self.client.force_login(user_obj)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        result_obj = quiz.models.QuizResults.objects.get(
+            quiz=self.quiz, user=user_obj
+        )
+        self.assertEqual(result_obj.rating_before, 7)
+
+    def test_results_unique(self) -> None:
+        """второй результат участника запрещен базой"""
+        with self.assertRaises(django.db.IntegrityError):
+            with django.db.transaction.atomic():
+                quiz.models.QuizResults.objects.create(
+                    quiz=self.quiz, user=self.user
+                )
+
+    def test_indexes_created(self) -> None:
+        """индексы из concurrently миграций построены"""
+        with django.db.connection.cursor() as cursor:
+            constraints = {
+                model: django.db.connection.introspection.get_constraints(
+                    cursor, model._meta.db_table
+                )
+                for model in (
+                    quiz.models.QuizResults,
+                    quiz.models.UserAnswer,
+                    users.models.Profile,
+                )
+            }
+        self.assertTrue(
+            constraints[quiz.models.QuizResults][
+                'quiz_results_quiz_user_uniq'
+            ]['unique']
+        )
+        self.assertIn(
+            'results_quiz_solved_idx', constraints[quiz.models.QuizResults]
+        )
+        self.assertIn(
+            'answer_user_question_idx', constraints[quiz.models.UserAnswer]
+        )
+        self.assertEqual(
+            constraints[quiz.models.UserAnswer]['answer_time_brin_idx'][
+                'type'
+            ],
+            'brin',
+        )
+        self.assertEqual(
+            constraints[users.models.Profile]['profile_rating_idx']['orders'],
+            ['DESC'],
+        )
+
+
+class LiveStandingsTests(LiveQuizTestCase):
+    """тестируем положение викторины в redis"""
+
+    def get_standings(self) -> django.http.HttpResponse:
+        """получаем страницу с положением"""
+        return self.client.get(
+            django.urls.reverse(
+                'quiz:standings_list', kwargs={'pk': self.quiz.pk}
+            )
+        )
+
+    def test_standings_from_redis(self) -> None:
+        """положение строится в redis и обновляется при верном ответе"""
+        self.get_standings()
+        self.send_answer(self.right_variant)
+        response = self.get_standings()
+        self.assertIsInstance(
+            response.context['paginator'].object_list,
+            quiz.standings.QuizStandings,
+        )
+        self.assertEqual(response.context['results'][0].solved, 1)
+        self.assertEqual(response.context['my_page'], 1)
+
+    def test_standings_rebuilt_after_flush(self) -> None:
+        """положение пересобирается из базы, если redis его потерял"""
+        self.get_standings()
+        quiz.models.QuizResults.objects.filter(quiz=self.quiz).update(solved=5)
+        core.redis_rervices.redis_connection.delete(
+            quiz.standings.get_standings_key(self.quiz.pk),
+            quiz.standings.get_standings_built_key(self.quiz.pk),
+        )
+        response = self.get_standings()
+        self.assertEqual(response.context['results'][0].solved, 5)
+
+    def test_standings_page_without_redis(self) -> None:
+        """redis отказал после выбора положения - страница из базы"""
+        connection = core.redis_rervices.redis_connection
+        with mock.patch.object(
+            connection, 'zcard', side_effect=redis.exceptions.ConnectionError
+        ), mock.patch.object(
+            connection,
+            'zrevrange',
+            side_effect=redis.exceptions.ConnectionError,
+        ):
+            response = self.get_standings()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result.user for result in response.context['results']],
+            [self.user],
+        )
+
+    def test_rebuild_replaces_standings(self) -> None:
+        """новое положение целиком заменяет старое и живет до срока"""
+        connection = core.redis_rervices.redis_connection
+        standings_key = quiz.standings.get_standings_key(self.quiz.pk)
+        connection.zadd(standings_key, {0: 7})
+        quiz.standings.rebuild_standings(self.quiz)
+        self.assertEqual(
+            connection.zrange(standings_key, 0, -1, withscores=True),
+            [(str(self.user.pk).encode(), 0)],
+        )
+        self.assertGreater(connection.ttl(standings_key), 0)
+        self.assertFalse(
+            connection.exists(
+                quiz.standings.get_standings_building_key(self.quiz.pk)
+            )
+        )
+
+    def test_participant_standings_expire(self) -> None:
+        """множество, созданное регистрацией, тоже живет до срока"""
+        quiz.standings.add_participant(self.quiz, self.user.pk)
+        self.assertGreater(
+            core.redis_rervices.redis_connection.ttl(
+                quiz.standings.get_standings_key(self.quiz.pk)
+            ),
+            0,
+        )
+
+    def test_rebuild_locked(self) -> None:
+        """пока положение пересобирается, второй процесс его не трогает"""
+        lock = core.redis_rervices.redis_connection.lock(
+            quiz.standings.get_standings_rebuild_lock_key(self.quiz.pk),
+            timeout=30,
+        )
+        lock.acquire()
+        try:
+            with self.assertNumQueries(0):
+                quiz.standings.rebuild_standings(self.quiz)
+        finally:
+            lock.release()
+        self.assertFalse(
+            core.redis_rervices.redis_connection.exists(
+                quiz.standings.get_standings_built_key(self.quiz.pk)
+            )
+        )
+
+    @django.test.override_settings(QUIZ_LIVE_STANDINGS=False)
+    def test_sql_standings(self) -> None:
+        """без redis положение берется из базы"""
+        response = self.get_standings()
+        self.assertEqual(response.context['results'][0].solved, 0)
+        self.assertIsNone(response.context['my_page'])
+
+    def tearDown(self) -> None:
+        """удаляем положение из redis"""
+        core.redis_rervices.redis_connection.delete(
+            quiz.standings.get_standings_key(self.quiz.pk),
+            quiz.standings.get_standings_built_key(self.quiz.pk),
+        )
+        super().tearDown()
+
+
+class AnswerKeyTests(LiveQuizTestCase):
+    """тестируем ключ ответов викторины"""
+
+    def test_answer_key_content(self) -> None:
+        """ключ ответов содержит верные варианты и сложность"""
+        self.assertEqual(
+            quiz.answer_keys.get_answer_key(self.quiz.pk),
+            {
+                self.question.pk: {
+                    'variants': {self.right_variant.pk},
+                    'difficulty': 3,
+                }
+            },
+        )
+
+    def test_answer_key_without_queries(self) -> None:
+        """повторная проверка ответа не обращается к базе"""
+        quiz.answer_keys.get_answer_key(self.quiz.pk)
+        with self.assertNumQueries(0):
+            answer_key = quiz.answer_keys.get_answer_key(self.quiz.pk)
+            self.assertTrue(
+                quiz.answer_keys.check_answer(
+                    answer_key, self.question.pk, str(self.right_variant.pk)
+                )
+            )
+
+    @django.test.override_settings(QUIZ_ANSWER_KEY_LOCAL_MAX_SIZE=1)
+    def test_local_answer_keys_bounded(self) -> None:
+        """в памяти процесса остается только недавно нужный ключ"""
+        other_quiz = quiz.models.Quiz.objects.create(
+            name='other', description='description'
+        )
+        quiz.answer_keys.get_answer_key(self.quiz.pk)
+        quiz.answer_keys.get_answer_key(other_quiz.pk)
+        self.assertNotIn(self.quiz.pk, quiz.answer_keys._local_answer_keys)
+        self.assertIn(other_quiz.pk, quiz.answer_keys._local_answer_keys)
+        core.redis_rervices.redis_connection.delete(
+            quiz.answer_keys.get_payload_key(other_quiz.pk)
+        )
+
+    def test_variant_of_other_question(self) -> None:
+        """верный вариант другого вопроса не засчитывается"""
+        other_question = quiz.models.Question.objects.create(
+            name='other', text='text', quiz=self.quiz
+        )
+        other_variant = quiz.models.Variant.objects.create(
+            text='right', question=other_question, is_correct=True
+        )
+        quiz.answer_keys.invalidate_answer_key(self.quiz.pk)
+        self.send_answer(other_variant)
+        self.assertFalse(quiz.models.UserAnswer.objects.get().is_correct)
+
+    def test_invalidate_answer_key(self) -> None:
+        """после изменения вариантов ключ собирается заново"""
+        quiz.answer_keys.get_answer_key(self.quiz.pk)
+        self.wrong_variant.is_correct = True
+        self.wrong_variant.save()
+        quiz.answer_keys.invalidate_answer_key(self.quiz.pk)
+        self.assertEqual(
+            quiz.answer_keys.get_answer_key(self.quiz.pk)[self.question.pk][
+                'variants'
+            ],
+            {self.right_variant.pk, self.wrong_variant.pk},
+        )
+
+
+class QuizStatusTests(LiveQuizTestCase):
+    """тестируем сохраненное время окончания и статусы викторин"""
+
+    def create_quiz(self, minutes_ago: int) -> quiz.models.Quiz:
+        """викторина на 60 минут, начавшаяся minutes_ago минут назад"""
+        return quiz.models.Quiz.objects.create(
+            name='quiz',
+            description='description',
+            organized_by=self.organization,
+            start_time=django.utils.timezone.now()
+            - django.utils.timezone.timedelta(minutes=minutes_ago),
+            duration=60,
+        )
+
+    def test_end_time_saved(self) -> None:
+        """время окончания пересчитывается и при save(update_fields=...)"""
+        self.assertEqual(
+            self.quiz.end_time,
+            self.quiz.start_time + django.utils.timezone.timedelta(minutes=60),
+        )
+        self.quiz.duration = 90
+        self.quiz.save(update_fields=['duration'])
+        self.quiz.refresh_from_db()
+        self.assertEqual(
+            self.quiz.end_time,
+            self.quiz.start_time + django.utils.timezone.timedelta(minutes=90),
+        )
+
+    def test_status_managers(self) -> None:
+        """методы менеджера и аннотация статуса согласованы с моделью"""
+        upcoming = self.create_quiz(-30)
+        finished = self.create_quiz(120)
+        manager = quiz.models.Quiz.objects
+        self.assertEqual(list(manager.get_upcoming_quizzes()), [upcoming])
+        self.assertEqual(list(manager.get_running_quizzes()), [self.quiz])
+        self.assertEqual(list(manager.get_finished_quizzes()), [finished])
+        statuses = {
+            quiz_obj.pk: quiz_obj.status
+            for quiz_obj in manager.get_only_useful_list_fields()
+        }
+        for quiz_obj in (upcoming, self.quiz, finished):
+            self.assertEqual(statuses[quiz_obj.pk], quiz_obj.get_quiz_status())
+        self.assertEqual(list(manager.get_waiting_for_results()), [finished])
+
+    def test_status_filters_by_index_range(self) -> None:
+        """фильтры статуса сравнивают столбцы с константой"""
+        sql = str(quiz.models.Question.objects.get_visible_questions().query)
+        self.assertIn('"quiz_quiz"."end_time" <=', sql)
+        self.assertNotIn('"duration"', sql)
+
+
+class QuizAccessQueriesTests(LiveQuizTestCase):
+    """
+    тестируем количество запросов на страницах викторины
+    три запроса уходят на сессию, пользователя и профиль в шапке,
+    права в викторине считаются одним запросом
+    """
+
+    def get_page(self, name: str, **kwargs) -> django.http.HttpResponse:
+        """получаем страницу викторины"""
+        return self.client.get(
+            django.urls.reverse(name, kwargs={'pk': self.quiz.pk, **kwargs})
+        )
+
+    def test_quiz_detail_queries(self) -> None:
+        """описание викторины"""
+        with self.assertNumQueries(4):
+            self.assertEqual(
+                self.get_page('quiz:quiz_detail').status_code, 200
+            )
+
+    def test_questions_queries(self) -> None:
+        """список вопросов"""
+        with self.assertNumQueries(5):
+            self.assertEqual(self.get_page('quiz:questions').status_code, 200)
+
+    def test_question_detail_queries(self) -> None:
+        """страница вопроса"""
+        with self.assertNumQueries(6):
+            response = self.get_page(
+                'quiz:question_detail', question_pk=self.question.pk
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_user_answers_queries(self) -> None:
+        """мои посылки"""
+        with self.assertNumQueries(5):
+            response = self.get_page('quiz:user_answers_list')
+            self.assertEqual(response.status_code, 200)
+
+    def test_standings_queries(self) -> None:
+        """положение из redis"""
+        self.get_page('quiz:standings_list')
+        with self.assertNumQueries(5):
+            response = self.get_page('quiz:standings_list')
+            self.assertEqual(response.status_code, 200)
+
+    def test_invited_user_no_private_quiz(self) -> None:
+        """приглашенный, но не вступивший, не видит закрытую викторину"""
+        self.quiz.is_private = True
+        self.quiz.save()
+        organization.models.OrganizationToUser.objects.create(
+            organization=self.organization, user=self.user, role=0
+        )
+        self.assertEqual(self.get_page('quiz:quiz_detail').status_code, 404)
+
+    def test_send_answer_queries(self) -> None:
+        """отправка ответа с прогретым ключом ответов"""
+        quiz.answer_keys.warm_up_answer_key(self.quiz.pk)
+        with self.assertNumQueries(6):
+            self.send_answer(self.right_variant)
+
+    def tearDown(self) -> None:
+        """удаляем положение из redis"""
+        core.redis_rervices.redis_connection.delete(
+            quiz.standings.get_standings_key(self.quiz.pk),
+            quiz.standings.get_standings_built_key(self.quiz.pk),
+        )
+        super().tearDown()
+
+
+class ElasticResponse(list):
+    """ответ elastic: найденные документы и агрегации"""
+
+    def __init__(self, hits: list, aggregations: dict) -> None:
+        super().__init__(hits)
+        self.aggregations = elasticsearch_dsl.utils.AttrDict(aggregations)
+
+
+class QuizSearchTests(LiveQuizTestCase):
+    """тестируем поиск викторин через elastic"""
+
+    def get_aggregations(self, organization_buckets: list = ()) -> dict:
+        """агрегации фасетов викторин"""
+        statuses = ('upcoming', 'running', 'finished')
+        return {
+            'organization': {
+                'values': {'buckets': list(organization_buckets)}
+            },
+            'status': {
+                'values': {
+                    'buckets': {
+                        status: {'doc_count': index}
+                        for index, status in enumerate(statuses)
+                    }
+                }
+            },
+            'rated': {
+                'values': {
+                    'buckets': [
+                        {'key': 1, 'key_as_string': 'true', 'doc_count': 4}
+                    ]
+                }
+            },
+            'private': {'values': {'buckets': []}},
+        }
+
+    def get_hits(self, quiz_pks: list) -> list:
+        """ответ elastic с найденными викторинами"""
+        return [
+            types.SimpleNamespace(
+                meta=types.SimpleNamespace(id=str(pk), sort=[1.0, pk])
+            )
+            for pk in quiz_pks
+        ]
+
+    def test_member_ids_prepared(self) -> None:
+        """в документ попадают только участники организации"""
+        membership = organization.models.OrganizationToUser.objects.create(
+            organization=self.organization, user=self.user, role=1
+        )
+        invited = users.models.User.objects.create(
+            username='invited', email='invited@gmail.com'
+        )
+        organization.models.OrganizationToUser.objects.create(
+            organization=self.organization, user=invited, role=0
+        )
+        prepared = quiz.documents.QuizDocument().prepare(self.quiz)
+        self.assertEqual(prepared['member_ids'], [self.user.pk])
+        self.assertTrue(prepared['organized_by']['is_active'])
+        prepared = quiz.documents.QuizDocument(
+            related_instance_to_ignore=membership
+        ).prepare(self.quiz)
+        self.assertEqual(prepared['member_ids'], [])
+
+    def search(self, hits: list, **params) -> django.http.HttpResponse:
+        """ищем викторины, elastic отвечает hits"""
+        with mock.patch(
+            'django_elasticsearch_dsl.search.Search.execute',
+            autospec=True,
+            return_value=ElasticResponse(hits, self.get_aggregations()),
+        ) as execute:
+            response = self.client.get(
+                django.urls.reverse('quiz:list'), {'query': 'quiz', **params}
+            )
+        self.execute_calls = execute.call_count
+        self.searches = [call.args[0].to_dict() for call in execute.mock_calls]
+        return response
+
+    def test_search_pages(self) -> None:
+        """
+        страницы поиска в порядке elastic - срезы закешированного списка,
+        записи страницы достаются одним запросом
+        """
+        quiz_objects = [self.quiz] + [
+            quiz.models.Quiz.objects.create(
+                name=f'quiz {index}',
+                description='description',
+                organized_by=self.organization,
+                start_time=self.quiz.start_time,
+            )
+            for index in range(5)
+        ]
+        quiz_pks = [quiz_obj.pk for quiz_obj in reversed(quiz_objects)]
+        with self.assertNumQueries(4):
+            response = self.search(self.get_hits(quiz_pks))
+        self.assertEqual(
+            [quiz_obj.pk for quiz_obj in response.context['quizzes']],
+            quiz_pks[:5],
+        )
+        self.assertEqual(response.context['paginator'].num_pages, 2)
+        self.assertNotIn('hits_limit', response.context)
+        response = self.search(list(), page=2)
+        self.assertEqual(self.execute_calls, 0)
+        self.assertEqual(
+            [quiz_obj.pk for quiz_obj in response.context['quizzes']],
+            quiz_pks[5:],
+        )
+        self.assertEqual(
+            core.search_cache.get_stats(),
+            {'hits': 1, 'misses': 1, 'hit_rate': 0.5},
+        )
+
+    @django.test.override_settings(SEARCH_MAX_HITS=1)
+    def test_search_hits_limited(self) -> None:
+        """если найдено больше SEARCH_MAX_HITS, список помечен обрезанным"""
+        response = self.search(self.get_hits([self.quiz.pk]))
+        self.assertEqual(response.context['hits_limit'], 1)
+        self.assertContains(response, 'Показаны первые 1 найденных записей')
+
+    def test_search_cache_invalidated(self) -> None:
+        """после записи в индекс поиск снова идет в elastic"""
+        self.search(self.get_hits([self.quiz.pk]))
+        core.search_cache.invalidate_search_cache('викторины')
+        response = self.search(list())
+        self.assertEqual(self.execute_calls, 1)
+        self.assertEqual(list(response.context['quizzes']), [])
+
+    def test_search_by_fields(self) -> None:
+        """поиск только по выбранному полю"""
+        with mock.patch(
+            'core.elastic_services.make_search_query',
+            wraps=core.elastic_services.make_search_query,
+        ) as make_search_query:
+            self.search(self.get_hits([self.quiz.pk]), search_by=4)
+        make_search_query.assert_called_once_with(
+            'quiz', ['organized_by.name']
+        )
+
+    def test_facets(self) -> None:
+        """
+        выбранные фасеты фильтруют найденные викторины,
+        счетчики приходят агрегациями в том же запросе к elastic
+        """
+        with self.assertNumQueries(4):
+            response = self.search(
+                self.get_hits([self.quiz.pk]),
+                status='running',
+                rated='true',
+                private='unknown',
+            )
+        self.assertEqual(self.execute_calls, 1)
+        search = self.searches[0]
+        self.assertEqual(len(search['post_filter']['bool']['filter']), 2)
+        self.assertEqual(
+            set(search['aggs']),
+            {'organization', 'status', 'rated', 'private'},
+        )
+        # счетчик фасета считается без его собственного фильтра
+        self.assertEqual(
+            search['aggs']['status']['filter'],
+            {'bool': {'filter': [{'term': {'is_rated': 'true'}}]}},
+        )
+        facets = {facet['name']: facet for facet in response.context['facets']}
+        self.assertEqual(
+            [
+                (choice['value'], choice['count'], choice['selected'])
+                for choice in facets['status']['choices']
+            ],
+            [
+                ('upcoming', 0, False),
+                ('running', 1, True),
+                ('finished', 2, False),
+            ],
+        )
+        self.assertEqual(
+            [choice['count'] for choice in facets['rated']['choices']],
+            [4, 0],
+        )
+        self.assertEqual(list(response.context['quizzes']), [self.quiz])
+
+    def test_facets_without_query(self) -> None:
+        """
+        без запроса и фасетов список строит база,
+        а elastic только считает фасеты
+        """
+        response = self.search(list(), query='')
+        self.assertEqual(self.searches[0]['size'], 0)
+        self.assertNotIn('multi_match', json.dumps(self.searches[0]))
+        self.assertEqual(list(response.context['quizzes']), [self.quiz])
+
+    def test_facets_only_sort(self) -> None:
+        """
+        по одним фасетам викторины идут по времени начала,
+        как в списке без поиска
+        """
+        self.search(self.get_hits([self.quiz.pk]), query='', status='running')
+        self.assertEqual(
+            self.searches[0]['sort'],
+            [
+                {'start_time': {'order': 'desc', 'missing': '_first'}},
+                {'id': {'order': 'desc', 'missing': '_first'}},
+            ],
+        )
+
+    def test_postgres_facet_filters(self) -> None:
+        """postgres фильтрует фасеты статуса без счетчиков"""
+        backend = core.search_backends.PostgresSearchBackend()
+        for status, expected in (
+            ('upcoming', []),
+            ('running', [self.quiz.pk]),
+            ('finished', []),
+        ):
+            self.assertEqual(
+                backend.get_hits(
+                    quiz.documents.QuizDocument,
+                    ['name'],
+                    '',
+                    None,
+                    quiz.documents.FACETS,
+                    {'status': status},
+                ),
+                (expected, {}),
+            )
+
+    def test_end_time_prepared(self) -> None:
+        """в документ попадает время окончания викторины"""
+        prepared = quiz.documents.QuizDocument().prepare(self.quiz)
+        self.assertEqual(
+            prepared['end_time'],
+            self.quiz.start_time + django.utils.timezone.timedelta(minutes=60),
+        )
+        self.assertTrue(prepared['is_rated'])
+
+    def test_suggestions(self) -> None:
+        """подсказки по префиксу названия кешируются"""
+        hits = [
+            types.SimpleNamespace(
+                meta=types.SimpleNamespace(id=str(self.quiz.pk)),
+                name=self.quiz.name,
+            )
+        ]
+        url = django.urls.reverse('quiz:suggest')
+        with mock.patch(
+            'django_elasticsearch_dsl.search.Search.execute',
+            return_value=hits,
+        ) as execute:
+            response = self.client.get(url, {'query': ' Qu '})
+            cached_response = self.client.get(url, {'query': 'qu'})
+            short_response = self.client.get(url, {'query': 'q'})
+        self.assertEqual(execute.call_count, 1)
+        expected = {
+            'suggestions': [
+                {
+                    'name': self.quiz.name,
+                    'url': django.urls.reverse(
+                        'quiz:quiz_detail', kwargs={'pk': self.quiz.pk}
+                    ),
+                }
+            ]
+        }
+        self.assertEqual(response.json(), expected)
+        self.assertEqual(cached_response.json(), expected)
+        self.assertEqual(short_response.json(), {'suggestions': []})
+        self.assertIn('private', response['Cache-Control'])
+
+    def setUp(self) -> None:
+        """очищаем кеш поиска"""
+        self.clear_search_cache()
+        super().setUp()
+
+    def tearDown(self) -> None:
+        """очищаем кеш поиска"""
+        self.clear_search_cache()
+        super().tearDown()
+
+    def clear_search_cache(self) -> None:
+        """удаляем результаты поиска и счетчики из redis"""
+        connection = core.redis_rervices.redis_connection
+        for key in connection.scan_iter('search:*'):
+            connection.delete(key)
+
+
+class QuizResultsTests(django.test.TestCase):
+    """тестируем подведение итогов викторины"""
+
+    def setUp(self) -> None:
+        """закончившаяся викторина с тремя участниками"""
+        self.creator = users.models.User.objects.create(
+            username='creator', email='creator@gmail.com'
+        )
+        organization_obj = organization.models.Organization.objects.create(
+            name='organization', description='description', is_active=True
+        )
+        self.quiz = quiz.models.Quiz.objects.create(
+            name='quiz',
+            description='description',
+            creator=self.creator,
+            organized_by=organization_obj,
+            start_time=django.utils.timezone.now()
+            - django.utils.timezone.timedelta(days=1),
+        )
+        self.participants = list()
+        for index, solved in enumerate((1, 5, 5)):
+            user_obj = users.models.User.objects.create(
+                username=f'participant{index}',
+                email=f'participant{index}@gmail.com',
+            )
+            users.models.Profile.objects.create(user=user_obj, rating=10)
+            quiz.models.QuizResults.objects.create(
+                quiz=self.quiz,
+                user=user_obj,
+                solved=solved,
+                rating_before=10,
+                rating_after=10 + solved * 2,
+            )
+            self.participants.append(user_obj)
+        super().setUp()
+
+    def test_places_and_ratings(self) -> None:
+        """места по решенным задачам, рейтинг - в профиль участника"""
+        rows = quiz.services.make_quiz_results(self.quiz.pk)
+        self.assertEqual(rows['places_updated'], 3)
+        self.assertEqual(rows['profiles_updated'], 3)
+        places = dict(
+            quiz.models.QuizResults.objects.filter(
+                quiz__pk=self.quiz.pk
+            ).values_list('user_id', 'place')
+        )
+        ratings = dict(
+            users.models.Profile.objects.filter(
+                user__in=self.participants
+            ).values_list('user_id', 'rating')
+        )
+        self.assertEqual(
+            [places[user_obj.pk] for user_obj in self.participants],
+            [2, 1, 1],
+        )
+        self.assertEqual(
+            [ratings[user_obj.pk] for user_obj in self.participants],
+            [12, 20, 20],
+        )
+        self.quiz.refresh_from_db()
+        self.assertTrue(self.quiz.is_ended)
+
+    def test_private_quiz_keeps_ratings(self) -> None:
+        """приватная викторина не меняет рейтинг"""
+        quiz.models.Quiz.objects.filter(pk=self.quiz.pk).update(
+            is_private=True
+        )
+        rows = quiz.services.make_quiz_results(self.quiz.pk)
+        self.assertEqual(rows['profiles_updated'], 0)
+
+    @django.test.override_settings(
+        QUIZ_ANSWERS_WRITE_BEHIND=True, QUIZ_ANSWERS_FLUSH_WAIT=0
+    )
+    def test_results_wait_for_answers_flush(self) -> None:
+        """
+        пока поток выгружает другой процесс, итоги не подводятся:
+        иначе последние ответы викторины в них не попадут
+        """
+        lock = core.redis_rervices.redis_connection.lock(
+            quiz.answer_stream.FLUSH_LOCK_KEY, timeout=10
+        )
+        lock.acquire()
+        try:
+            self.assertIsNone(quiz.services.make_quiz_results(self.quiz.pk))
+        finally:
+            lock.release()
+        self.quiz.refresh_from_db()
+        self.assertFalse(self.quiz.is_ended)
+        self.assertIsNotNone(quiz.services.make_quiz_results(self.quiz.pk))
+
+    def test_results_made_once(self) -> None:
+        """повторное подведение итогов ничего не делает"""
+        quiz.services.make_quiz_results(self.quiz.pk)
+        quiz.models.QuizResults.objects.filter(quiz__pk=self.quiz.pk).update(
+            place=0
+        )
+        self.assertIsNone(quiz.services.make_quiz_results(self.quiz.pk))
+        self.assertFalse(
+            quiz.models.QuizResults.objects.filter(
+                quiz__pk=self.quiz.pk, place__gt=0
+            ).exists()
+        )
+
+    def test_finalization_recorded(self) -> None:
+        """длительность и обновленные строки записываются"""
+        quiz.services.make_quiz_results(self.quiz.pk)
+        finalization_obj = quiz.models.QuizFinalization.objects.get(
+            quiz__pk=self.quiz.pk
+        )
+        self.assertEqual(finalization_obj.places_updated, 3)
+        self.assertEqual(finalization_obj.profiles_updated, 3)
+
+    @django.test.override_settings(QUIZ_RESULTS_BATCH_SIZE=1)
+    def test_ended_quizzes_results(self) -> None:
+        """
+        итоги закончившихся викторин подводятся пачками,
+        идущие викторины не трогаем
+        """
+        running_quiz = quiz.models.Quiz.objects.create(
+            name='running',
+            description='description',
+            start_time=django.utils.timezone.now(),
+        )
+        ended_quiz = quiz.models.Quiz.objects.create(
+            name='ended',
+            description='description',
+            start_time=django.utils.timezone.now()
+            - django.utils.timezone.timedelta(hours=1),
+        )
+        self.assertEqual(
+            quiz.tasks.make_ended_quizzes_results(), [self.quiz.pk]
+        )
+        self.assertEqual(
+            quiz.tasks.make_ended_quizzes_results(), [ended_quiz.pk]
+        )
+        self.assertEqual(quiz.tasks.make_ended_quizzes_results(), [])
+        running_quiz.refresh_from_db()
+        self.assertFalse(running_quiz.is_ended)
+
+    @django.test.override_settings(QUIZ_RATING_ENGINE='elo')
+    def test_elo_ratings(self) -> None:
+        """рейтинг Эло: решившие больше поднимаются, меньше - опускаются"""
+        quiz.services.make_quiz_results(self.quiz.pk)
+        ratings = dict(
+            users.models.Profile.objects.filter(
+                user__in=self.participants
+            ).values_list('user_id', 'rating')
+        )
+        self.assertEqual(
+            [ratings[user_obj.pk] for user_obj in self.participants],
+            [0, 18, 18],
+        )
+
+    def test_rating_changes_recorded(self) -> None:
+        """изменения рейтинга попадают в историю"""
+        quiz.services.make_quiz_results(self.quiz.pk)
+        self.assertEqual(
+            list(
+                quiz.models.RatingChange.objects.filter(quiz__pk=self.quiz.pk)
+                .order_by('user_id')
+                .values_list('rating_before', 'rating_after')
+            ),
+            [(10, 12), (10, 20), (10, 20)],
+        )
+
+    def test_recompute_ratings(self) -> None:
+        """
+        пересчет рейтинга после исправления результата
+        доходит до следующих викторин и профиля
+        """
+        next_quiz = quiz.models.Quiz.objects.create(
+            name='next',
+            description='description',
+            start_time=self.quiz.start_time
+            + django.utils.timezone.timedelta(hours=1),
+        )
+        quiz.models.QuizResults.objects.create(
+            quiz=next_quiz,
+            user=self.participants[0],
+            solved=1,
+            rating_before=12,
+            rating_after=15,
+        )
+        quiz.services.make_quiz_results(self.quiz.pk)
+        quiz.services.make_quiz_results(next_quiz.pk)
+        quiz.models.QuizResults.objects.filter(
+            quiz__pk=self.quiz.pk, user=self.participants[0]
+        ).update(rating_after=30)
+        django.core.management.call_command(
+            'recompute_ratings',
+            self.quiz.pk,
+            chunk_size=1,
+            stdout=io.StringIO(),
+        )
+        self.assertEqual(
+            list(
+                quiz.models.RatingChange.objects.filter(
+                    user=self.participants[0]
+                )
+                .order_by('quiz_start_time')
+                .values_list('rating_before', 'rating_after')
+            ),
+            [(0, 20), (20, 23)],
+        )
+        self.assertEqual(
+            users.models.Profile.objects.get(user=self.participants[0]).rating,
+            23,
+        )
+        self.assertEqual(
+            users.models.Profile.objects.get(user=self.participants[1]).rating,
+            10,
+        )
+
+    def test_creator_makes_results(self) -> None:
+        """создатель подводит итоги со страницы викторины"""
+        client = django.test.Client()
+        client.force_login(self.creator)
+        client.get(
+            django.urls.reverse(
+                'quiz:make_results', kwargs={'pk': self.quiz.pk}
+            )
+        )
+        self.assertTrue(
+            quiz.models.QuizResults.objects.filter(
+                quiz__pk=self.quiz.pk, place=1
+            ).exists()
+        )
+
+
+class EloRatingEngineTests(django.test.SimpleTestCase):
+    """тестируем векторизованный рейтинг Эло"""
+
+    def test_same_as_naive(self) -> None:
+        """совпадает с попарным перебором участников"""
+        random_generator = numpy.random.default_rng(0)
+        rating_before = random_generator.integers(0, 3000, 300)
+        solved = random_generator.integers(0, 10, 300)
+        engine = quiz.ratings.EloRatingEngine(k_factor=32)
+        self.assertEqual(
+            engine.compute(rating_before, solved, rating_before).tolist(),
+            quiz.management.commands.benchmark_rating_engines.naive_elo(
+                rating_before.tolist(), solved.tolist(), 32
+            ),
+        )
+
+    def test_single_participant(self) -> None:
+        """единственный участник остается при своем рейтинге"""
+        engine = quiz.ratings.EloRatingEngine(k_factor=32)
+        rating_before = numpy.array([100])
+        self.assertEqual(
+            engine.compute(rating_before, numpy.array([5]), None).tolist(),
+            [100],
+        )
+
+
+class LoadTestTests(django.test.TransactionTestCase):
+    """тестируем нагрузочный тест начала викторины"""
+
+    def test_load_test_report(self) -> None:
+        """в отчете есть все представления, данные теста удаляются"""
+        output = io.StringIO()
+        django.core.management.call_command(
+            'load_test_quiz',
+            participants=2,
+            questions=2,
+            concurrency=2,
+            stdout=output,
+        )
+        report = json.loads(output.getvalue())
+        self.assertEqual(
+            set(report['views']),
+            {'register', 'questions', 'answer', 'standings'},
+        )
+        self.assertEqual(report['total']['requests'], 2 * (3 + 2))
+        self.assertEqual(report['total']['errors'], 0)
+        self.assertFalse(users.models.User.objects.exists())
@@ -7,6 +7,9 @@ app_name = 'quiz'
 
 urlpatterns = [
     django.urls.path('', quiz.views.QuizListView.as_view(), name='list'),
+    django.urls.path(
+        'suggest/', quiz.views.QuizSuggestView.as_view(), name='suggest'
+    ),
     django.urls.path(
         '<int:pk>/',
         quiz.views.QuizDetailView.as_view(),
@@ -1,5 +1,8 @@
 import typing
 
+import redis.exceptions
+
+import django.conf
 import django.contrib.auth.mixins
 import django.contrib.messages
 import django.db.models
@@ -10,13 +13,15 @@ import django.utils.timezone
 import django.views.generic
 
 import core.elastic_services
-import core.forms
 import core.views
+import quiz.answer_keys
+import quiz.answer_stream
 import quiz.documents
 import quiz.forms
 import quiz.mixins
 import quiz.models
-import quiz.services
+import quiz.standings
+import quiz.tasks
 
 
 class QuizListView(core.views.ElasticSearchListView):
@@ -25,39 +30,42 @@ class QuizListView(core.views.ElasticSearchListView):
     template_name = 'quiz/list.html'
     context_object_name = 'quizzes'
     paginate_by = 5
-    search_fields = ['name', 'description']
+    search_fields = ['name^3', 'organized_by.name^2', 'description']
+    search_by_choices = (
+        (1, 'Все', search_fields),
+        (2, 'Имя', ['name']),
+        (3, 'Описание', ['description']),
+        (4, 'Организация', ['organized_by.name']),
+    )
     document_class = quiz.documents.QuizDocument
+    suggest_url = 'quiz:suggest'
+    facets = quiz.documents.FACETS
 
     def get_default_queryset(self) -> django.db.models.QuerySet:
         return quiz.models.Quiz.objects.filter_user_access(
             user_pk=self.request.user.pk
         ).order_by('-id')
 
-    def get_context_data(self, *args, **kwargs) -> dict:
-        """дополняем контекст формой поиска"""
-        context = super().get_context_data(*args, **kwargs)
-        form = core.forms.SearchForm()
-        form.fields['search_by'].choices = (
-            (1, 'Все'),
-            (2, 'Имя'),
-            (3, 'Описание'),
-            (4, 'Организация'),
-        )
-        context['form'] = form
-        return context
+    def get_search_queryset(self) -> django.db.models.QuerySet:
+        return quiz.models.Quiz.objects.get_only_useful_list_fields()
+
 
+class QuizSuggestView(core.views.ElasticSuggestView):
+    """подсказки названий викторин"""
 
-class QuizDetailView(django.views.generic.DetailView):
+    document_class = quiz.documents.QuizDocument
+    url_name = 'quiz:quiz_detail'
+
+
+class QuizDetailView(quiz.mixins.QuizMixin, django.views.generic.DetailView):
     """детальная информация о викторине"""
 
     template_name = 'quiz/quiz_detail.html'
     context_object_name = 'quiz'
 
-    def get_queryset(self) -> django.db.models.QuerySet:
-        """список викторин, проверка доступа пользователя"""
-        return quiz.models.Quiz.objects.filter_user_access(
-            user_pk=self.request.user.pk
-        )
+    def get_object(self, *args, **kwargs) -> quiz.models.Quiz:
+        """викторина с проверкой доступа пользователя"""
+        return self.get_quiz_access().quiz
 
     def get_context_data(self, *args, **kwargs) -> dict:
         """
@@ -66,32 +74,10 @@ class QuizDetailView(django.views.generic.DetailView):
         может ли он решать задания на данный момент
         """
         context = super().get_context_data(*args, **kwargs)
-        quiz_obj = context['object']
-        context['can_participate'] = quiz.models.QuizResults.objects.filter(
-            quiz__pk=self.kwargs['pk'], user__pk=self.request.user.pk
-        ).exists()
-        quiz_status = quiz_obj.get_quiz_status()
-        context['quiz_status'] = quiz_status
-        if quiz_status == 1:
-            context['can_access_questions'] = False
-        elif quiz_status == 2:
-            context['can_access_questions'] = context['can_participate']
-        else:
-            context[
-                'can_access_questions'
-            ] = quiz.services.user_can_access_quiz(quiz_obj, self.request.user)
-        context['can_end'] = (
-            quiz_status == 3 and quiz_obj.creator.pk == self.request.user.pk
-        )
-        context['now_time'] = str(django.utils.timezone.now())
-        context['end_time'] = str(
-            quiz_obj.start_time
-            + django.utils.timezone.timedelta(minutes=quiz_obj.duration)
-        )
+        quiz_access = self.get_quiz_access()
+        context['can_end'] = quiz_access.status == 3 and quiz_access.is_creator
         context['quiz_is_ended'] = (
-            quiz_obj.start_time
-            + django.utils.timezone.timedelta(minutes=quiz_obj.duration)
-            < django.utils.timezone.now()
+            quiz_access.end_time < django.utils.timezone.now()
         )
         return context
 
@@ -115,8 +101,8 @@ class MakeQuizResultsView(django.views.generic.View):
         )
         if quiz_obj.creator.pk != request.user.pk:
             raise django.http.Http404()
-        quiz.services.make_quiz_results(quiz_obj)
-        django.contrib.messages.success(request, 'Успешно!')
+        quiz.tasks.make_quiz_results.delay(quiz_obj.pk)
+        django.contrib.messages.success(request, 'Итоги подводятся')
         return django.shortcuts.redirect(
             django.urls.reverse('quiz:quiz_detail', kwargs={'pk': pk}),
         )
@@ -165,9 +151,14 @@ class QuestionDetailView(
 
     template_name = 'quiz/question_detail.html'
     context_object_name = 'question'
-    queryset = quiz.models.Question.objects.only('name', 'text', 'difficulty')
     pk_url_kwarg = 'question_pk'
 
+    def get_queryset(self) -> django.db.models.QuerySet:
+        """вопросы только этой викторины"""
+        return quiz.models.Question.objects.filter(
+            quiz__pk=self.kwargs['pk']
+        ).only('name', 'text', 'difficulty')
+
     def get_context_data(self, *args, **kwargs) -> typing.Dict:
         """
         рендерим вопрос, отдаем форму
@@ -189,7 +180,7 @@ class QuestionDetailView(
     ) -> django.http.HttpResponse:
         """
         сохраняем ответ пользователя
-        квиз должен существовать
+        квиз должен существовать, пользователь должен иметь доступ к вопросам
         вопрос должен существовать
         создаем объект ответа пользователя
         обновляем результат решенных задач
@@ -198,65 +189,93 @@ class QuestionDetailView(
         если викторина идет, пользователь не может
         дать ответ на тот же вопрос дважды
         """
-        question_obj = django.shortcuts.get_object_or_404(
-            quiz.models.Question.objects.select_related('quiz').only(
-                'quiz__is_rated',
-                'quiz__is_private',
-                'id',
-                'quiz__start_time',
-                'quiz__duration',
-            ),
-            pk=question_pk,
-            quiz__pk=pk,
+        quiz_access = self.get_quiz_access()
+        answer_key = quiz.answer_keys.get_answer_key(pk)
+        if (
+            question_pk not in answer_key
+            or not quiz_access.can_access_questions
+        ):
+            raise django.http.Http404()
+        is_correct = quiz.answer_keys.check_answer(
+            answer_key, question_pk, request.POST.get('answer')
         )
-        quiz_obj = question_obj.quiz
-        if quiz.services.user_can_access_quiz(quiz_obj, request.user):
-            is_correct = quiz.models.Variant.objects.filter(
-                pk=request.POST['answer'], is_correct=True
-            ).exists()
-
-            quiz_status = quiz_obj.get_quiz_status()
-            if quiz_status == 2:
-                if quiz.models.UserAnswer.objects.filter(
-                    user__pk=request.user.pk, question__pk=question_pk
-                ).exists():
-                    django.contrib.messages.error(
-                        request,
-                        'Вы уже отправляли ответ на этот вопрос'
-                        ' в течение викторины',
-                    )
-                    return django.shortcuts.redirect(
-                        django.urls.reverse(
-                            'quiz:question_detail',
-                            kwargs={'pk': pk, 'question_pk': question_pk},
-                        )
-                    )
-
-            quiz.models.UserAnswer.objects.create(
-                user=request.user,
-                question=question_obj,
-                is_correct=is_correct,
-            )
-            quiz_result = quiz.models.QuizResults.objects.filter(
+        rating = 0
+        if quiz_access.quiz.is_rated and not quiz_access.quiz.is_private:
+            rating = answer_key[question_pk]['difficulty']
+
+        if quiz_access.status == 2:
+            if django.conf.settings.QUIZ_ANSWERS_WRITE_BEHIND:
+                response = self.push_answer(
+                    quiz_access.quiz, question_pk, is_correct, rating
+                )
+                if response is not None:
+                    return response
+            if quiz.models.UserAnswer.objects.filter(
+                user__pk=request.user.pk, question__pk=question_pk
+            ).exists():
+                return self.already_answered_redirect(pk, question_pk)
+
+        quiz.models.UserAnswer.objects.create(
+            user=request.user,
+            question_id=question_pk,
+            quiz_id=pk,
+            is_correct=is_correct,
+        )
+        if (
+            quiz_access.status == 2
+            and quiz_access.is_registered
+            and is_correct
+        ):
+            quiz.models.QuizResults.objects.filter(
                 quiz__pk=pk, user__pk=request.user.pk
-            ).first()
-            if (
-                quiz_status == 2
-                and quiz_result
-                and is_correct
-                and quiz.models.UserAnswer.objects.filter(
-                    user__pk=request.user.pk,
-                    question__pk=question_pk,
-                    is_correct=is_correct,
-                ).count()
-                == 1
-            ):
-                quiz_result.solved += 1
-                if quiz_obj.is_rated and not quiz_obj.is_private:
-                    quiz_result.rating_after += question_obj.difficulty
-                quiz_result.save()
+            ).update(
+                solved=django.db.models.F('solved') + 1,
+                rating_after=django.db.models.F('rating_after') + rating,
+            )
+            quiz.standings.add_solved(pk, request.user.pk)
         return django.shortcuts.redirect('quiz:user_answers_list', pk=pk)
 
+    def push_answer(
+        self,
+        quiz_obj: quiz.models.Quiz,
+        question_pk: int,
+        is_correct: bool,
+        rating: int,
+    ) -> typing.Optional[django.http.HttpResponse]:
+        """
+        кладем ответ в поток redis и возвращаем редирект
+        если redis недоступен - None, ответ пишется в базу синхронно
+        """
+        try:
+            is_pushed = quiz.answer_stream.push_answer(
+                quiz_obj, question_pk, self.request.user.pk, is_correct, rating
+            )
+        except redis.exceptions.RedisError:
+            return None
+        if not is_pushed:
+            return self.already_answered_redirect(quiz_obj.pk, question_pk)
+        return django.shortcuts.redirect(
+            'quiz:user_answers_list', pk=quiz_obj.pk
+        )
+
+    def already_answered_redirect(
+        self, pk: int, question_pk: int
+    ) -> django.http.HttpResponse:
+        """
+        пользователь уже отвечал на вопрос во время викторины,
+        возвращаем его к вопросу с ошибкой
+        """
+        django.contrib.messages.error(
+            self.request,
+            'Вы уже отправляли ответ на этот вопрос в течение викторины',
+        )
+        return django.shortcuts.redirect(
+            django.urls.reverse(
+                'quiz:question_detail',
+                kwargs={'pk': pk, 'question_pk': question_pk},
+            )
+        )
+
 
 class UserAnswersList(
     quiz.mixins.AccessToQuizMixin, django.views.generic.ListView
@@ -272,13 +291,32 @@ class UserAnswersList(
         useful_answer_fields = (
             quiz.models.UserAnswer.objects.get_only_useful_list_fields()
             .filter(
-                question__quiz__id=self.kwargs['pk'],
-                user__id=self.request.user.id,
+                quiz_id=self.kwargs['pk'],
+                user_id=self.request.user.id,
             )
             .order_by('-time_answered')
         )
+        self.pending_answers = list()
+        if (
+            django.conf.settings.QUIZ_ANSWERS_WRITE_BEHIND
+            and self.request.user.is_authenticated
+        ):
+            self.pending_answers = quiz.answer_stream.get_pending_answers(
+                quiz_pk=self.kwargs['pk'], user_obj=self.request.user
+            )
         return useful_answer_fields
 
+    def get_context_data(self, *args, **kwargs) -> dict:
+        """
+        дополняем контекст ответами,
+        которые еще не записаны в базу
+        """
+        context = super().get_context_data(*args, **kwargs)
+        context['pending_answers'] = list()
+        if context['page_obj'].number == 1:
+            context['pending_answers'] = self.pending_answers
+        return context
+
 
 class StandingsList(
     quiz.mixins.AccessToQuizMixin, django.views.generic.ListView
@@ -289,17 +327,39 @@ class StandingsList(
     context_object_name = 'results'
     paginate_by = 40
 
-    def get_queryset(self) -> django.db.models.QuerySet:
+    def get_queryset(
+        self,
+    ) -> typing.Union[django.db.models.QuerySet, quiz.standings.QuizStandings]:
         """
         получаем информацию о других пользователях,
         участвующих в викторине
+        пока викторина идет, положение берется из redis,
+        иначе или при недоступности redis - из базы
         """
-        return (
-            quiz.models.QuizResults.objects.select_related('user')
-            .filter(quiz__pk=self.kwargs['pk'])
-            .only('solved', 'user__username')
-            .order_by('-solved')
-        )
+        self.user_position = None
+        quiz_access = self.get_quiz_access()
+        if (
+            django.conf.settings.QUIZ_LIVE_STANDINGS
+            and quiz_access.status == 2
+        ):
+            quiz_obj = quiz_access.quiz
+            try:
+                quiz.standings.ensure_standings(quiz_obj)
+                self.user_position = quiz.standings.get_user_position(
+                    quiz_obj.pk, self.request.user.pk
+                )
+                return quiz.standings.QuizStandings(quiz_obj.pk)
+            except redis.exceptions.RedisError:
+                pass
+        return quiz.standings.get_sql_standings(self.kwargs['pk'])
+
+    def get_context_data(self, *args, **kwargs) -> dict:
+        """дополняем контекст страницей с пользователем"""
+        context = super().get_context_data(*args, **kwargs)
+        context['my_page'] = None
+        if self.user_position is not None:
+            context['my_page'] = self.user_position // self.paginate_by + 1
+        return context
 
 
 class QuizRegistrationView(
@@ -323,15 +383,18 @@ class QuizRegistrationView(
         )
         if not quiz_obj.get_quiz_status() in (1, 2):
             raise django.http.Http404()
-        if not quiz.models.QuizResults.objects.filter(
-            quiz__pk=pk, user__pk=request.user.pk
-        ).exists():
-            quiz.models.QuizResults.objects.create(
-                quiz=quiz_obj,
-                user=request.user,
-                rating_before=request.user.profile.rating,
-                rating_after=request.user.profile.rating,
-            )
+        # повторная регистрация, в том числе одновременная,
+        # упирается в уникальность (викторина, пользователь)
+        _, created = quiz.models.QuizResults.objects.get_or_create(
+            quiz=quiz_obj,
+            user=request.user,
+            defaults={
+                'rating_before': request.user.profile.rating,
+                'rating_after': request.user.profile.rating,
+            },
+        )
+        if created:
+            quiz.standings.add_participant(quiz_obj, request.user.pk)
             django.contrib.messages.success(request, 'Регистрация успешна!')
             return django.shortcuts.redirect(
                 django.urls.reverse('quiz:quiz_detail', kwargs={'pk': pk})
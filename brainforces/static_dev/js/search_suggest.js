@@ -0,0 +1,50 @@
+window.addEventListener('DOMContentLoaded', (event) => {
+  // запрос подсказок отправляется, когда пользователь перестал печатать
+  const DEBOUNCE_DELAY = 250;
+  const MIN_LENGTH = 2;
+  document.querySelectorAll('input[data-suggest-url]').forEach(input => {
+    const datalist = document.getElementById(input.getAttribute('list'));
+    let timer = null;
+    let controller = null;
+    let urls = {};
+
+    // подсказку выбрали из списка, а не напечатали: при выборе
+    // chrome шлет insertReplacementText, firefox - событие без inputType
+    const isSuggestionPicked = (event) => (
+      !event.inputType || event.inputType === 'insertReplacementText'
+    );
+
+    input.addEventListener('input', function (event) {
+      clearTimeout(timer);
+      const query = input.value.trim();
+      if (isSuggestionPicked(event) && urls[query] !== undefined) {
+        window.location.href = urls[query];
+        return;
+      }
+      if (query.length < MIN_LENGTH) {
+        datalist.innerHTML = '';
+        return;
+      }
+      timer = setTimeout(() => {
+        if (controller !== null) {
+          controller.abort();
+        }
+        controller = new AbortController();
+        const url = `${input.dataset.suggestUrl}?query=${encodeURIComponent(query)}`;
+        fetch(url, {signal: controller.signal, mode: 'same-origin'})
+        .then(response => response.json())
+        .then(data => {
+          datalist.innerHTML = '';
+          urls = {};
+          data['suggestions'].forEach(suggestion => {
+            const option = document.createElement('option');
+            option.value = suggestion['name'];
+            datalist.appendChild(option);
+            urls[suggestion['name']] = suggestion['url'];
+          });
+        })
+        .catch(error => {});
+      }, DEBOUNCE_DELAY);
+    });
+  });
+});
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:34
+
+import django.contrib.postgres.operations
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # concurrently нельзя выполнять в транзакции
+    atomic = False
+
+    dependencies = [
+        ('users', '0004_alter_profile_user'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.AddIndexConcurrently(
+            model_name='profile',
+            index=models.Index(fields=['-rating'], name='profile_rating_idx'),
+        ),
+    ]
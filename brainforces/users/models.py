@@ -68,6 +68,12 @@ class Profile(core.models.AbstractImageModel):
     class Meta:
         verbose_name = 'профиль'
         verbose_name_plural = 'профили'
+        indexes = (
+            # список пользователей по убыванию рейтинга
+            django.db.models.Index(
+                fields=('-rating',), name='profile_rating_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         """строковое представление"""
@@ -17,6 +17,7 @@ import django.views.generic
 import django.views.generic.edit
 
 import organization.models
+import organization.visibility
 import quiz.models
 import users.backends
 import users.forms
@@ -233,18 +234,16 @@ class UserAnswersView(
         либо пользователь - участник организации,
         которая организовала викторину
         """
-        user_pk = self.request.user.pk
         return (
-            quiz.models.UserAnswer.objects.get_only_useful_list_fields()
-            .filter(
+            organization.visibility.filter_visible(
+                quiz.models.UserAnswer.objects.get_only_useful_list_fields(),
                 django.db.models.Q(
-                    question__quiz__is_private=False,
-                    question__quiz__organized_by__users__pk=user_pk,
-                )
-                | django.db.models.Q(question__quiz__is_private=False),
-                user__pk=self.kwargs['pk'],
+                    quiz__visibility=organization.visibility.Visibility.PUBLIC
+                ),
+                'quiz__organized_by',
+                self.request.user.pk,
             )
-            .distinct()
+            .filter(user__pk=self.kwargs['pk'])
             .order_by('-time_answered')
         )
 
@@ -266,16 +265,15 @@ class UserQuizzesView(
         которая организовала викторину
         """
         return (
-            quiz.models.QuizResults.objects.get_only_useful_list_fields()
-            .filter(
+            organization.visibility.filter_visible(
+                quiz.models.QuizResults.objects.get_only_useful_list_fields(),
                 django.db.models.Q(
-                    quiz__is_private=True,
-                    quiz__organized_by__users__pk=self.request.user.pk,
-                )
-                | django.db.models.Q(quiz__is_private=False),
-                user__pk=self.kwargs['pk'],
+                    quiz__visibility=organization.visibility.Visibility.PUBLIC
+                ),
+                'quiz__organized_by',
+                self.request.user.pk,
             )
-            .distinct()
+            .filter(user__pk=self.kwargs['pk'])
             .order_by('-quiz__start_time')
         )
 
@@ -298,18 +296,15 @@ class UserOrganizationsView(
         """
         org_to_user_manager = organization.models.OrganizationToUser.objects
         return (
-            org_to_user_manager.get_active_organization_to_user()
-            .filter(
-                django.db.models.Q(organization__is_private=False)
-                | django.db.models.Q(
-                    organization__is_private=True,
-                    organization__users__pk=self.request.user.pk,
-                ),
-                user__pk=self.kwargs['pk'],
+            organization.visibility.filter_visible(
+                org_to_user_manager.get_active_organization_to_user(),
+                django.db.models.Q(organization__is_private=False),
+                'organization',
+                self.request.user.pk,
             )
+            .filter(user__pk=self.kwargs['pk'])
             .select_related('organization')
             .only('organization__name', 'role')
-            .distinct()
         )
 
 